@@ -0,0 +1,22 @@
+#!/usr/local/bin/python3
+
+# mapswipe_benchmark.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Benchmark the tools on synthetic data
+
+# The code is in mapswipe_utils/benchmark.py - this script is the same as
+#   python -m mapswipe_utils benchmark
+
+import sys
+
+from mapswipe_utils import benchmark
+
+
+if __name__ == '__main__':
+    sys.exit(benchmark.main())
@@ -0,0 +1,22 @@
+#!/usr/local/bin/python3
+
+# mapswipe_build_tile_pyramid.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Build the lower zoom levels for a set of tiles
+
+# The code is in mapswipe_utils/build_tile_pyramid.py - this script is the same as
+#   python -m mapswipe_utils build_tile_pyramid
+
+import sys
+
+from mapswipe_utils import build_tile_pyramid
+
+
+if __name__ == '__main__':
+    sys.exit(build_tile_pyramid.main())
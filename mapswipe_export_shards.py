@@ -0,0 +1,22 @@
+#!/usr/local/bin/python3
+
+# mapswipe_export_shards.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Pack partitioned tiles into shard files
+
+# The code is in mapswipe_utils/export_shards.py - this script is the same as
+#   python -m mapswipe_utils export_shards
+
+import sys
+
+from mapswipe_utils import export_shards
+
+
+if __name__ == '__main__':
+    sys.exit(export_shards.main())
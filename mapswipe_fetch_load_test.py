@@ -0,0 +1,22 @@
+#!/usr/local/bin/python3
+
+# mapswipe_fetch_load_test.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Measure fetch throughput against a local tile server
+
+# The code is in mapswipe_utils/fetch_load_test.py - this script is the same as
+#   python -m mapswipe_utils fetch_load_test
+
+import sys
+
+from mapswipe_utils import fetch_load_test
+
+
+if __name__ == '__main__':
+    sys.exit(fetch_load_test.main())
@@ -0,0 +1,22 @@
+#!/usr/local/bin/python3
+
+# mapswipe_pipeline.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Run the whole workflow for a project from a config file
+
+# The code is in mapswipe_utils/pipeline.py - this script is the same as
+#   python -m mapswipe_utils pipeline
+
+import sys
+
+from mapswipe_utils import pipeline
+
+
+if __name__ == '__main__':
+    sys.exit(pipeline.main())
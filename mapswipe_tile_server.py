@@ -0,0 +1,22 @@
+#!/usr/local/bin/python3
+
+# mapswipe_tile_server.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Serve synthetic tiles for testing the fetch scripts
+
+# The code is in mapswipe_utils/tile_server.py - this script is the same as
+#   python -m mapswipe_utils tile_server
+
+import sys
+
+from mapswipe_utils import tile_server
+
+
+if __name__ == '__main__':
+    sys.exit(tile_server.main())
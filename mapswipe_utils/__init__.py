@@ -0,0 +1,19 @@
+# mapswipe_utils/__init__.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Utilities for working with MapSwipe projects and Bing Maps image tiles
+#
+# The command line tools are modules of this package with a main(argv=None) function
+# (see commands.py) and the code they share is in library modules that can be imported
+# on their own, for example
+#
+#   from mapswipe_utils import tile_math
+#   tile_math.tile_id_to_quadkey('18-158000-127000')
+#
+# Importing the package imports nothing else. NumPy and PIL are only imported when they
+# are first used (see lazy.py).
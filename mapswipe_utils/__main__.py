@@ -0,0 +1,17 @@
+# mapswipe_utils/__main__.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# python -m mapswipe_utils <command> [options]
+
+import sys
+
+from mapswipe_utils import commands
+
+
+if __name__ == '__main__':
+    sys.exit(commands.main())
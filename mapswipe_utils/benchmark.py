@@ -0,0 +1,325 @@
+# mapswipe_utils/benchmark.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Time the slow parts of the MapSwipe tools on synthetic data (see synthetic.py)
+
+# For each project size a synthetic project.json is generated, along with a block of synthetic
+# JPEG tiles, in the work directory. Generated files are kept and reused by later runs. The
+# default work directory is mapswipe_benchmark_data in the system temporary directory.
+#
+# The benchmarks are
+#
+#   quadkey     tile ID to quadkey conversion, one at a time and as a batch
+#   cache       building the project cache from the JSON file, and loading it again
+#   filter      filtering records one at a time with check_tile_info, and with a compiled query
+#   negatives   finding negative neighbors, one at a time, as a batch and in parallel
+#   select      the select_tile_subset command with copies and with hard links
+#   partition   the partition_tiles command with copies and with hard links
+#   render      the display_grid_tile_block command writing a TIFF at two tile sizes
+#   startup     starting a new Python process to run a command with --help
+#
+# The select, partition and render commands are run in this process (see commands.py).
+#
+# Each benchmark is run --repeat times and the fastest time is kept. The results are written
+# as JSON along with the versions of Python and NumPy and the current git commit, by default
+# to benchmark_results.json in the work directory. With --compare
+# the times are shown next to those in an earlier results file.
+
+import argparse
+import sys
+import os
+import json
+import time
+import shutil
+import random
+import tempfile
+import platform
+import subprocess
+import contextlib
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import tile_query as mapswipe_tile_query
+from mapswipe_utils import project_cache as mapswipe_project_cache
+from mapswipe_utils import negative_sampling as mapswipe_negative_sampling
+from mapswipe_utils import synthetic as mapswipe_synthetic
+from mapswipe_utils import commands as mapswipe_commands
+
+np = lazy_import('numpy')
+
+
+BENCHMARKS = ['quadkey', 'cache', 'filter', 'negatives', 'select', 'partition', 'render', 'startup']
+
+STARTUP_COMMANDS = ['fetch_tiles', 'filter_tile_list', 'partition_tiles', 'display_grid_tile_block']
+
+RESULTS_VERSION = 1
+RESULTS_FILENAME = 'benchmark_results.json'
+
+DEFAULT_WORKDIR = os.path.join(tempfile.gettempdir(), 'mapswipe_benchmark_data')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Run fn repeat times and return the times in seconds
+def time_runs(fn, repeat, setup=None):
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+# Run a command in this process, without its output
+def run_command(name, *args):
+    with open(os.devnull, 'wt') as devnull, contextlib.redirect_stdout(devnull):
+        mapswipe_commands.run(name, args)
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class Benchmarks:
+    def __init__(self, work_dir, repeat, seed):
+        self.work_dir = work_dir
+        self.repeat = repeat
+        self.seed = seed
+        self.results = []
+
+    def record(self, name, size, times, items=None):
+        result = {
+            'name': name,
+            'size': size,
+            'seconds': min(times),
+            'times': times,
+        }
+        if items:
+            result['us_per_item'] = min(times) / items * 1e6
+        self.results.append(result)
+        print("{:32s} {:>9} {:10.4f}s".format(name, size, min(times)))
+
+    def project(self, n_tiles):
+        path = os.path.join(self.work_dir, "project_{}_{}.json".format(n_tiles, self.seed))
+        if not os.path.exists(path):
+            print("generating {}".format(path))
+            mapswipe_synthetic.generate_project(path, n_tiles, self.seed)
+        return path
+
+    # a directory of synthetic tiles, split into two halves for partitioning
+    def tiles(self, n_tiles):
+        path = os.path.join(self.work_dir, "tiles_{}_{}".format(n_tiles, self.seed))
+        if not os.path.exists(path):
+            print("generating {}".format(path))
+            nx = int(np.ceil(np.sqrt(n_tiles)))
+            tile_ids = mapswipe_synthetic.block_tile_ids(nx, (n_tiles + nx - 1) // nx)[:n_tiles]
+            for name, half in (('positives', tile_ids[0::2]), ('negatives', tile_ids[1::2])):
+                store = mapswipe_tile_store.open_tile_store(os.path.join(path + '.part', name), 'w')
+                mapswipe_synthetic.generate_tiles(store, half, self.seed)
+            os.rename(path + '.part', path)
+        return path
+
+    def quadkey(self, n_tiles):
+        project = mapswipe_project_cache.load_project(self.project(n_tiles))
+        tile_ids = project.tile_ids()
+        self.record('quadkey.scalar', n_tiles,
+                    time_runs(lambda: [mapswipe_tile_math.tile_id_to_quadkey(t) for t in tile_ids], self.repeat),
+                    len(tile_ids))
+        self.record('quadkey.batch', n_tiles,
+                    time_runs(lambda: mapswipe_tile_math.tile_ids_to_quadkeys(tile_ids), self.repeat), len(tile_ids))
+
+    def cache(self, n_tiles):
+        path = self.project(n_tiles)
+        self.record('cache.build', n_tiles,
+                    time_runs(lambda: mapswipe_project_cache.load_project(path, rebuild=True), self.repeat), n_tiles)
+        self.record('cache.load', n_tiles,
+                    time_runs(lambda: mapswipe_project_cache.load_project(path)['yes_count'].sum(), self.repeat))
+
+    def filter(self, n_tiles):
+        path = self.project(n_tiles)
+        with open(path, 'rt') as f:
+            records = json.load(f)
+
+        def check():
+            return [t['id'] for t in records if mapswipe_tile_query.check_tile_info(t, 'yes_count', 'ge', 2)]
+        self.record('filter.check_tile_info', n_tiles, time_runs(check, self.repeat), n_tiles)
+
+        project = mapswipe_project_cache.load_project(path)
+        query = mapswipe_tile_query.compile_query('yes_count >= 2 and bad_imagery_count == 0')
+        self.record('filter.query', n_tiles, time_runs(lambda: query.mask(project), self.repeat), n_tiles)
+
+    def negatives(self, n_tiles):
+        project = mapswipe_project_cache.load_project(self.project(n_tiles))
+        positives = np.asarray(project['decision']) <= 1.0
+        zooms, xs, ys = mapswipe_tile_math.unpack_tiles(np.asarray(project['key'])[positives])
+        all_zooms, all_xs, all_ys = mapswipe_tile_math.unpack_tiles(project['key'])
+        tile_ids = mapswipe_tile_math.format_tile_ids(zooms, xs, ys)
+
+        def index():
+            return mapswipe_negative_sampling.OccupancyIndex(all_zooms, all_xs, all_ys)
+
+        def one_at_a_time():
+            occupancy = index()
+            rng = random.Random(self.seed)
+            for tile_id in tile_ids:
+                mapswipe_negative_sampling.find_neighbor(occupancy, tile_id, rng)
+
+        workers = os.cpu_count() or 1
+        self.record('negatives.find_neighbor', n_tiles, time_runs(one_at_a_time, self.repeat), len(tile_ids))
+        self.record('negatives.batch', n_tiles,
+                    time_runs(lambda: mapswipe_negative_sampling.find_negatives(index(), zooms, xs, ys,
+                                                                                random.Random(self.seed)),
+                              self.repeat), len(tile_ids))
+        self.record('negatives.parallel.{}'.format(workers), n_tiles,
+                    time_runs(lambda: mapswipe_negative_sampling.sample_negatives(index(), zooms, xs, ys,
+                                                                                  self.seed, workers),
+                              self.repeat), len(tile_ids))
+
+    def select(self, n_tiles):
+        tiles = self.tiles(n_tiles)
+        positives = os.path.join(tiles, 'positives')
+        tile_list = os.path.join(self.work_dir, 'select.lst')
+        tile_ids = sorted(mapswipe_tile_store.open_tile_store(positives).tile_ids())
+        with open(tile_list, 'wt') as f:
+            f.write('\n'.join(tile_ids[0::2]) + '\n')
+
+        out = os.path.join(self.work_dir, 'select_out')
+        for mode in ('copy', 'link'):
+            self.record('select.{}'.format(mode), n_tiles,
+                        time_runs(lambda: run_command('select_tile_subset', '--tilelist', tile_list,
+                                                      '--indir', positives, '--outdir', out, '--mode', mode),
+                                  self.repeat, lambda: remove(out)), len(tile_ids) // 2)
+        remove(out)
+
+    def partition(self, n_tiles):
+        tiles = self.tiles(n_tiles)
+        out = os.path.join(self.work_dir, 'partition_out')
+        for mode in ('copy', 'link'):
+            self.record('partition.{}'.format(mode), n_tiles,
+                        time_runs(lambda: run_command('partition_tiles',
+                                                      '--positives', os.path.join(tiles, 'positives'),
+                                                      '--negatives', os.path.join(tiles, 'negatives'),
+                                                      '--outdir', out, '--mode', mode),
+                                  self.repeat, lambda: remove(out)), n_tiles)
+        remove(out)
+
+    def render(self, n_tiles):
+        tiles = self.tiles(n_tiles)
+        out = os.path.join(self.work_dir, 'render.tif')
+        for size in (64, 256):
+            self.record('render.{}px'.format(size), n_tiles,
+                        time_runs(lambda: run_command('display_grid_tile_block',
+                                                      '--tiledir', os.path.join(tiles, 'positives'),
+                                                      '--imagesize', str(size), '--output', out),
+                                  self.repeat), n_tiles // 2)
+        remove(out)
+
+    def startup(self):
+        env = mapswipe_commands.command_env()
+        for name in STARTUP_COMMANDS:
+            command = mapswipe_commands.command_line(name, ['--help'])
+            self.record('startup.{}'.format(name), 1,
+                        time_runs(lambda: subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL),
+                                  self.repeat))
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare(results, previous_path):
+    with open(previous_path, 'rt') as f:
+        previous = json.load(f)
+    earlier = {}
+    for result in previous.get('results', []):
+        earlier[(result['name'], result['size'])] = result['seconds']
+
+    print('')
+    print("{:32s} {:>9} {:>10} {:>10} {:>8}".format('benchmark', 'size', 'before', 'now', 'ratio'))
+    for result in results:
+        before = earlier.get((result['name'], result['size']))
+        if before is None:
+            continue
+        print("{:32s} {:>9} {:9.4f}s {:9.4f}s {:8.2f}".format(result['name'], result['size'], before,
+                                                            result['seconds'], result['seconds'] / before))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MapSwipe tools on synthetic data")
+    parser.add_argument('--workdir', '-d', metavar='<work_directory>', default=DEFAULT_WORKDIR,
+                        help='Directory for the synthetic data (default {})'.format(DEFAULT_WORKDIR))
+    parser.add_argument('--sizes', '-n', metavar='<sizes>', default='10000,100000',
+                        help='Comma separated project sizes in tiles (default 10000,100000)')
+    parser.add_argument('--tiles', '-t', metavar='<number of tiles>', type=int, default=2000,
+                        help='Number of image tiles for the select, partition and render benchmarks (default 2000)')
+    parser.add_argument('--benchmarks', '-b', metavar='<benchmarks>', default=','.join(BENCHMARKS),
+                        help='Comma separated benchmarks to run (default all): {}'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--repeat', '-r', metavar='<repeat>', type=int, default=3,
+                        help='Number of times to run each benchmark (default 3)')
+    parser.add_argument('--seed', '-s', metavar='<seed>', type=int, default=0,
+                        help='Seed for the synthetic data (default 0)')
+    parser.add_argument('--output', '-o', metavar='<json_file>',
+                        help='File for the results (default {} in the work directory)'.format(RESULTS_FILENAME))
+    parser.add_argument('--compare', '-c', metavar='<json_file>',
+                        help='Earlier results file to compare with')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    names = [name for name in args.benchmarks.split(',') if name]
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.stderr.write("ERROR: invalid benchmark: {}\n".format(name))
+            sys.exit(1)
+
+    if not os.path.exists(args.workdir):
+        os.makedirs(args.workdir)
+
+    benchmarks = Benchmarks(args.workdir, max(1, args.repeat), args.seed)
+    for name in BENCHMARKS:
+        if name not in names:
+            continue
+        # the file benchmarks use a fixed number of image tiles, the others each project size
+        if name in ('select', 'partition', 'render'):
+            getattr(benchmarks, name)(args.tiles)
+        elif name == 'startup':
+            benchmarks.startup()
+        else:
+            for size in sizes:
+                getattr(benchmarks, name)(size)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'results': benchmarks.results,
+    }
+    output = args.output if args.output is not None else os.path.join(args.workdir, RESULTS_FILENAME)
+    with open(output, 'wt') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        compare(benchmarks.results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+# mapswipe_utils/build_tile_pyramid.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Build zoomed out versions of a set of image tiles, like the lower zoom levels of Bing Maps
+
+# Each parent tile is made by joining its four child tiles into a 512 x 512 image and
+# shrinking that to 256 x 256. Levels are built from the bottom up, starting with the parents
+# of the input tiles, until there is a single tile or --min_zoom is reached.
+#
+# Input is a directory or .tiles archive of tiles at one zoom level, for example a block
+# fetched with mapswipe_fetch_tile_block.py
+#
+# Output is a directory with a subdirectory of tiles for each zoom level
+# /17
+#    /17-67366-61890.jpg
+# /16
+# ...
+# or, if the output path ends in .tiles, a single archive holding all the levels
+#
+# Builds are incremental. The output has a manifest with a signature for every tile - the size
+# and modification time of an input tile, or a hash of the signatures of the four children of a
+# parent tile. A parent is only rebuilt when its signature changes or it is missing from the
+# output, so after adding or refetching some input tiles only their ancestors are rebuilt.
+# Parents that no longer have any children are removed.
+#
+# The parents at each level are split into runs of consecutive packed keys, which are whole
+# subtrees in quadkey order, and the runs are built on a pool of threads.
+
+import argparse
+import sys
+import os
+import io
+import json
+import zlib
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import tile_store as mapswipe_tile_store
+
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+
+
+TILE_SIZE = 256
+
+MANIFEST_FILENAME = 'pyramid_manifest.json'
+MANIFEST_VERSION = 1
+
+DEFAULT_WORKERS = 8
+
+# parents built per task
+CHUNK_SIZE = 256
+
+MISSING = '-'
+
+
+# Where the tiles for each zoom level go
+class PyramidOutput:
+    def __init__(self, path):
+        self.path = path
+        self.stores = {}
+        if mapswipe_tile_store.is_archive(path):
+            self.archive = mapswipe_tile_store.open_tile_store(path, 'w')
+            self.manifest_path = path + '.' + MANIFEST_FILENAME
+        else:
+            self.archive = None
+            if not os.path.exists(path):
+                os.makedirs(path)
+            self.manifest_path = os.path.join(path, MANIFEST_FILENAME)
+
+    def level(self, zoom):
+        if self.archive is not None:
+            return self.archive
+        if zoom not in self.stores:
+            self.stores[zoom] = mapswipe_tile_store.open_tile_store(os.path.join(self.path, str(zoom)), 'w')
+        return self.stores[zoom]
+
+    # the store for a level if it has been written, without creating it - otherwise None
+    def existing_level(self, zoom):
+        if self.archive is not None or zoom in self.stores:
+            return self.level(zoom)
+        if os.path.isdir(os.path.join(self.path, str(zoom))):
+            return self.level(zoom)
+        return None
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, 'rt') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('signatures', {})
+
+    def write_manifest(self, signatures):
+        with open(self.manifest_path + '.part', 'wt') as f:
+            json.dump({'version': MANIFEST_VERSION, 'signatures': signatures}, f)
+        os.replace(self.manifest_path + '.part', self.manifest_path)
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+        for store in self.stores.values():
+            store.close()
+
+
+# Signatures of the input tiles, as a dict of packed key -> signature
+# For a directory the size and modification time of each file, which needs no reading,
+# for an archive the size and CRC of each tile
+def input_signatures(tile_store, keys):
+    signatures = {}
+    tile_ids = mapswipe_tile_math.keys_to_tile_ids(keys)
+    for key, tile_id in zip(keys.tolist(), tile_ids):
+        if isinstance(tile_store, mapswipe_tile_store.DirectoryTileStore):
+            stat = os.stat(tile_store.tile_path(tile_id))
+            signatures[key] = "{}:{}".format(stat.st_size, stat.st_mtime_ns)
+        else:
+            data = tile_store.read(tile_id)
+            signatures[key] = "{}:{:08x}".format(len(data), zlib.crc32(data))
+    return signatures
+
+
+def parent_signature(child_signatures):
+    return hashlib.sha1('|'.join(child_signatures).encode('ascii')).hexdigest()
+
+
+# Join the four children of a tile and shrink them to one tile
+# Missing children are left black
+def build_parent(child_store, children, quality):
+    image = Image.new('RGB', (2 * TILE_SIZE, 2 * TILE_SIZE), (0,0,0))
+    for i, tile_id in enumerate(children):
+        try:
+            data = child_store.read(tile_id)
+        except KeyError:
+            continue
+        child = Image.open(io.BytesIO(data)).convert('RGB')
+        if child.size != (TILE_SIZE, TILE_SIZE):
+            child = child.resize((TILE_SIZE, TILE_SIZE), Image.LANCZOS)
+        # quadkey digits run NW, NE, SW, SE
+        image.paste(child, ((i & 1) * TILE_SIZE, (i >> 1) * TILE_SIZE))
+    image = image.resize((TILE_SIZE, TILE_SIZE), Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def build_chunk(child_store, parent_store, parents, children, quality):
+    for parent, child_keys in zip(parents, children):
+        data = build_parent(child_store, mapswipe_tile_math.keys_to_tile_ids(child_keys), quality)
+        parent_store.write(mapswipe_tile_math.key_to_tile_id(parent), data)
+    return len(parents)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the lower zoom levels for a set of image tiles")
+    parser.add_argument('--tiledir', '-d', metavar='<tile_directory>', required=True,
+                        help='Directory or .tiles archive of tile images')
+    parser.add_argument('--outdir', '-o', metavar='<output_directory>', required=True,
+                        help='Output directory or .tiles archive for the pyramid')
+    parser.add_argument('--min_zoom', '-z', metavar='<zoom>', type=int,
+                        help='Lowest zoom level to build (default: until there is a single tile)')
+    parser.add_argument('--quality', '-q', metavar='<jpeg quality>', type=int, default=90,
+                        help='JPEG quality of the built tiles (default 90)')
+    parser.add_argument('--workers', '-w', metavar='<number of threads>', type=int, default=DEFAULT_WORKERS,
+                        help='Number of threads building tiles (default {})'.format(DEFAULT_WORKERS))
+    args = parser.parse_args(argv)
+
+    input_store = mapswipe_tile_store.open_tile_store(args.tiledir)
+    keys = input_store.keys()
+    if len(keys) == 0:
+        sys.stderr.write("ERROR: no tiles in {}\n".format(args.tiledir))
+        sys.exit(1)
+
+    zooms = np.unique(keys >> np.uint64(mapswipe_tile_math.ZOOM_SHIFT))
+    if len(zooms) > 1:
+        sys.stderr.write("ERROR: the input tiles must all be at the same zoom level\n")
+        sys.exit(1)
+    zoom = int(zooms[0])
+    min_zoom = args.min_zoom if args.min_zoom is not None else 0
+
+    output = PyramidOutput(args.outdir)
+    previous = output.read_manifest()
+    manifest = {}
+
+    signatures = input_signatures(input_store, keys)
+    child_store = input_store
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        while zoom > min_zoom and (args.min_zoom is not None or len(keys) > 1):
+            zoom -= 1
+            parent_store = output.level(zoom)
+
+            parents = np.unique(mapswipe_tile_math.parent_keys(keys))
+            children = mapswipe_tile_math.children_keys(parents)
+
+            # work out which parents have changed - or have gone from the output since they were built
+            parent_signatures = {}
+            changed = np.zeros(len(parents), dtype=bool)
+            for i, (parent, child_keys) in enumerate(zip(parents.tolist(), children.tolist())):
+                signature = parent_signature([signatures.get(child, MISSING) for child in child_keys])
+                parent_signatures[parent] = signature
+                manifest[str(parent)] = signature
+                changed[i] = (previous.get(str(parent)) != signature or
+                              mapswipe_tile_math.key_to_tile_id(parent) not in parent_store)
+
+            # build the changed parents in runs of consecutive keys
+            rebuild = np.flatnonzero(changed)
+            tasks = []
+            for start in range(0, len(rebuild), CHUNK_SIZE):
+                rows = rebuild[start:start + CHUNK_SIZE]
+                tasks.append(pool.submit(build_chunk, child_store, parent_store, parents[rows].tolist(),
+                                         children[rows], args.quality))
+            n_built = sum(task.result() for task in tasks)
+
+            # remove parents that no longer have any children
+            n_removed = 0
+            for key in previous:
+                key_zoom = int(key) >> mapswipe_tile_math.ZOOM_SHIFT
+                if key_zoom == zoom and int(key) not in parent_signatures:
+                    parent_store.delete(mapswipe_tile_math.key_to_tile_id(int(key)))
+                    n_removed += 1
+
+            print("zoom {}: {} tiles, {} built, {} removed".format(zoom, len(parents), n_built, n_removed))
+
+            keys = parents
+            signatures = parent_signatures
+            child_store = parent_store
+
+    # tiles at zoom levels that are no longer built
+    for key in previous:
+        if key not in manifest:
+            level_store = output.existing_level(int(key) >> mapswipe_tile_math.ZOOM_SHIFT)
+            if level_store is not None:
+                level_store.delete(mapswipe_tile_math.key_to_tile_id(int(key)))
+
+    output.write_manifest(manifest)
+    output.close()
+    input_store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# mapswipe_utils/commands.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# The commands of mapswipe_utils and a single entry point that runs any of them
+#
+#   python -m mapswipe_utils <command> [options]
+#
+# Each command is a module in this package with a main(argv=None) function, which can also be
+# called directly from Python, e.g.
+#
+#   from mapswipe_utils import partition_tiles
+#   partition_tiles.main(['--positives', 'pos', '--negatives', 'neg', '--outdir', 'out'])
+#
+# Only the module for the command being run is imported. The mapswipe_<command>.py scripts
+# in the top level of the repo run the same commands, as do the mapswipe and
+# mapswipe_<command> console scripts that pyproject.toml installs.
+
+import os
+import sys
+import importlib
+
+
+# command name -> description
+COMMANDS = {
+    'fetch_project_json':        'Fetch a project JSON file and write tile lists',
+    'filter_tile_list':          'Filter the tiles in a project JSON file',
+    'fetch_tiles':               'Fetch a list of Bing Maps image tiles',
+    'fetch_tile_block':          'Fetch a block of Bing Maps image tiles',
+    'fetch_single_tile':         'Fetch a single Bing Maps image tile',
+    'find_negative_neighbors':   'Find negative tiles near positive tiles',
+    'partition_tiles':           'Partition tiles into training, validation and test sets',
+    'select_tile_subset':        'Select a subset of tiles based on a file of tile IDs',
+    'export_shards':             'Pack partitioned tiles into shard files',
+    'display_grid_random_tiles': 'Display a grid of randomly chosen tiles',
+    'display_grid_tile_block':   'Display a block of tiles',
+    'build_tile_pyramid':        'Build the lower zoom levels for a set of tiles',
+    'benchmark':                 'Benchmark the tools on synthetic data',
+    'tile_server':               'Serve synthetic tiles for testing the fetch scripts',
+    'fetch_load_test':           'Measure fetch throughput against a local tile server',
+    'pipeline':                  'Run the whole workflow for a project from a config file',
+}
+
+
+def command_module(name):
+    name = name.replace('-', '_')
+    if name.startswith('mapswipe_'):
+        name = name[len('mapswipe_'):]
+    if name.endswith('.py'):
+        name = name[:-len('.py')]
+    if name not in COMMANDS:
+        return None
+    return importlib.import_module('mapswipe_utils.' + name)
+
+
+# Run a command with a list of arguments, in this process
+def run(name, argv=()):
+    module = command_module(name)
+    if module is None:
+        raise ValueError("unknown command: {}".format(name))
+    return module.main(list(argv))
+
+
+# The command line and environment to run a command in a new Python process
+def command_line(name, argv=()):
+    return [sys.executable, '-m', 'mapswipe_utils', name] + list(argv)
+
+
+def command_env():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + (os.pathsep + env['PYTHONPATH'] if env.get('PYTHONPATH') else '')
+    return env
+
+
+def usage():
+    lines = ["usage: python -m mapswipe_utils <command> [options]", "", "commands:"]
+    for name, description in COMMANDS.items():
+        lines.append("  {:27s} {}".format(name, description))
+    lines.append("")
+    lines.append("python -m mapswipe_utils <command> --help shows the options for a command")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return
+    module = command_module(argv[0])
+    if module is None:
+        sys.stderr.write("ERROR: unknown command: {}\n\n{}\n".format(argv[0], usage()))
+        sys.exit(1)
+    # so the help for each command shows how it was run
+    sys.argv[0] = 'python -m mapswipe_utils ' + argv[0]
+    return module.main(argv[1:])
@@ -0,0 +1,111 @@
+# mapswipe_utils/display_grid_random_tiles.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+
+# Simple script that generates a grid image made up of x * y image tiles selected at random
+# Handy for getting a quick overview of a directory or .tiles archive of image tiles
+
+# Tiles are loaded on a pool of threads, decoding small images at a reduced
+# scale (see tile_loader.py)
+
+import argparse
+import sys
+import os
+import json
+import random
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import tile_loader as mapswipe_tile_loader
+
+Image = lazy_import('PIL.Image')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Display a grid of image tiles")
+    parser.add_argument('--tilelist', '-f', metavar='<tile_list_file>', required=True,
+                        help='MapSwipe Project Tile List file')
+    parser.add_argument('--tiledir', '-d', metavar='<tile_directory>', required=True,
+                        help='Directory or .tiles archive of tile images')
+    parser.add_argument('--nx', '-x', metavar='<nx>', type=int, required=True,
+                        help='Number of tiles in X dimension')
+    parser.add_argument('--ny', '-y', metavar='<ny>', type=int, required=True,
+                        help='Number of tiles in Y dimension')
+    parser.add_argument('--imagesize', '-s', metavar='<image size>', type=int, default=256,
+                        help='Display size for each image')
+    parser.add_argument('--workers', '-w', metavar='<number of threads>', type=int,
+                        default=mapswipe_tile_loader.DEFAULT_WORKERS,
+                        help='Number of threads loading tiles (default {})'.format(mapswipe_tile_loader.DEFAULT_WORKERS))
+    args = parser.parse_args(argv)
+
+
+    nx = int(args.nx)
+    ny = int(args.ny)
+
+    tile_list_file = args.tilelist
+    tile_dir  = args.tiledir
+
+    tile_store = mapswipe_tile_store.open_tile_store(tile_dir)
+
+    # create the base image
+    # Bing maps tiles are 256 x 256 pixels but can be displayed smaller
+    tile_size = int(args.imagesize)
+
+    image_width  = nx * (tile_size + 1) + 1
+    image_height = ny * (tile_size + 1) + 1
+
+    base_image = Image.new('RGBA', (image_width, image_height), (0,0,0))
+
+    selected_tiles = {}
+
+    # Load the tile_ids into a list
+    with open(tile_list_file, 'rt') as f:
+        tile_ids = f.read().splitlines()
+
+
+    used_ints = {}
+
+    n_tiles = len(tile_ids)
+    print(n_tiles)
+
+    if nx * ny > n_tiles:
+        sys.stderr.write("ERROR: there are only {} tiles in the list\n".format(n_tiles))
+        sys.exit(1)
+
+    # pick the tiles for each row, then load the row on a pool of threads
+    loader = mapswipe_tile_loader.TileLoader(tile_store, tile_size, args.workers)
+
+    x = 0
+    y = 1
+    for i in range(ny):
+      row = []
+      for j in range(nx):
+        k = random.randint(0, n_tiles-1)
+        # keep looking if this tile has already been seen
+        while k in used_ints:
+          k = random.randint(0, n_tiles-1)
+
+        used_ints[k] = 1
+        tile_id = tile_ids[k]
+        print(tile_id)
+        row.append(tile_id)
+
+      x = 1
+      for img in loader.load_all(row):
+        if img is not None:
+          base_image.paste(img, (x, y))
+        x += tile_size + 1
+      print('')
+      y += tile_size + 1
+
+    loader.close()
+    base_image.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# mapswipe_utils/display_grid_tile_block.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+
+# Simple script that generates a grid image made up of the image tiles
+# in a directory - this expects those to be a contiguous tile block
+
+# It is up the user to ensure the block is not too large to display
+# Use the imagesize argument to display smaller tiles
+
+# With --output the grid is written to a TIFF file instead, one row of tiles at a time,
+# so there is no limit to the size of the block (see strip_tiff.py)
+
+# Tiles are loaded on a pool of threads, decoding small images at a reduced
+# scale (see tile_loader.py). Missing tiles are left black
+
+# The tiles can be in a directory or a .tiles archive
+
+import argparse
+import sys
+import os
+import json
+import re
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import strip_tiff as mapswipe_strip_tiff
+from mapswipe_utils import tile_loader as mapswipe_tile_loader
+
+Image = lazy_import('PIL.Image')
+
+
+# the IDs of a row of nx tiles starting at tile_x, tile_y
+def row_tile_ids(zoom, tile_x, tile_y, nx):
+    return [mapswipe_tile_math.format_tile_id(zoom, tile_x + j, tile_y) for j in range(nx)]
+
+
+# Write the composite to a TIFF file, one strip per row of tiles
+# Each strip is the 1px gap above a row of tiles and the row itself, then there is a last
+# strip for the gap at the bottom. Only one row of tiles is in memory at a time
+# Tiles missing from the block are left black
+
+def write_mosaic(path, loader, zoom, min_x, min_y, nx, ny, image_size):
+    image_width  = nx * (image_size + 1) + 1
+    image_height = ny * (image_size + 1) + 1
+
+    with mapswipe_strip_tiff.StripTiffWriter(path, image_width, image_height, image_size + 1) as tiff:
+        for i in range(ny):
+            strip = Image.new('RGB', (image_width, image_size + 1), (0,0,0))
+            x = 1
+            for img in loader.load_all(row_tile_ids(zoom, min_x, min_y + i, nx)):
+                if img is not None:
+                    strip.paste(img, (x, 1))
+                x += image_size + 1
+            tiff.write_strip(strip.tobytes())
+
+        # the gap below the last row
+        tiff.write_strip(bytes(image_width * 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Display an image tile block")
+    parser.add_argument('--tiledir', '-d', metavar='<tile_directory>', required=True,
+                        help='Directory or .tiles archive of tile images')
+    parser.add_argument('--imagesize', '-s', metavar='<image size>', type=int, default=256,
+                        help='Display size for each image')
+    parser.add_argument('--output', '-o', metavar='<tiff_file>',
+                        help='Write the composite to a TIFF file instead of displaying it')
+    parser.add_argument('--workers', '-w', metavar='<number of threads>', type=int,
+                        default=mapswipe_tile_loader.DEFAULT_WORKERS,
+                        help='Number of threads loading tiles (default {})'.format(mapswipe_tile_loader.DEFAULT_WORKERS))
+    args = parser.parse_args(argv)
+
+    tile_dir  = args.tiledir
+    image_size = int(args.imagesize)
+
+    # Read the tiles from the directory and get the bounds
+
+    tile_store = mapswipe_tile_store.open_tile_store(tile_dir)
+    tile_ids = tile_store.tile_ids()
+
+    zooms, xs, ys = mapswipe_tile_math.parse_tile_ids(tile_ids)
+    zoom = int(zooms[-1])
+    min_x = int(xs.min())
+    max_x = int(xs.max())
+    min_y = int(ys.min())
+    max_y = int(ys.max())
+
+
+    nx = max_x - min_x + 1
+    ny = max_y - min_y + 1
+
+    loader = mapswipe_tile_loader.TileLoader(tile_store, image_size, args.workers)
+
+    # With --output write the composite to a TIFF file one row of tiles at a time
+    if args.output is not None:
+        write_mosaic(args.output, loader, zoom, min_x, min_y, nx, ny, image_size)
+        loader.close()
+        return
+
+    # create the base image for the composite
+    # this allows for a 1px gap between tiles
+
+    image_width  = nx * (image_size + 1) + 1
+    image_height = ny * (image_size + 1) + 1
+
+    base_image = Image.new('RGBA', (image_width, image_height), (0,0,0))
+
+    y = 1
+    tile_y = min_y
+    for i in range(ny):
+      x = 1
+      for img in loader.load_all(row_tile_ids(zoom, min_x, tile_y, nx)):
+        if img is not None:
+          base_image.paste(img, (x, y))
+        x += image_size + 1
+
+      y += image_size + 1
+      tile_y += 1
+
+    loader.close()
+    base_image.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# mapswipe_utils/export_shards.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Export the output of mapswipe_partition_tiles.py as shard files for training
+
+# Reading thousands of small image files every epoch is slow, especially from network storage.
+# This writes each split (train, validation, test) as a series of shard files of about the same
+# size, each holding a shuffled mix of positive and negative tiles with their labels, which
+# training code can read sequentially and shuffle shard by shard.
+#
+# Input directory structure is the output of mapswipe_partition_tiles.py - directories or .tiles archives
+# /train
+#    /positives
+#    /negatives
+# /validation
+# ...
+#
+# Output is
+# /train-000000.tar
+# /train-000001.tar
+# ...
+# /validation-000000.tar
+# ...
+# /index.json     the shards in each split, with the number of tiles of each label, size and SHA1 hash
+#
+# Labels are 1 for positives and 0 for negatives
+#
+# See shards.py for the tar and records formats
+
+import argparse
+import sys
+import os
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import shards as mapswipe_shards
+
+
+splits = ['train', 'validation', 'test']
+
+categories = ['positives', 'negatives']
+labels = {'positives': 1, 'negatives': 0}
+
+INDEX_FILENAME = 'index.json'
+
+# tiles read at a time, on a pool of threads
+READ_BATCH_SIZE = 256
+READ_WORKERS = 8
+
+
+# Find the store for one category of a split - a directory or .tiles archive, or None if neither exists
+def find_store(input_dir, split, category):
+    path = os.path.join(input_dir, split, category)
+    if os.path.isdir(path):
+        return mapswipe_tile_store.open_tile_store(path)
+    if os.path.exists(path + mapswipe_tile_store.ARCHIVE_SUFFIX):
+        return mapswipe_tile_store.open_tile_store(path + mapswipe_tile_store.ARCHIVE_SUFFIX)
+    return None
+
+
+# Read tiles in batches on a pool of threads, yielding (tile_id, label, data)
+def read_tiles(samples, stores):
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        for i in range(0, len(samples), READ_BATCH_SIZE):
+            batch = samples[i:i + READ_BATCH_SIZE]
+            data = pool.map(lambda sample: stores[sample[0]].read(sample[1]), batch)
+            for (category, tile_id), tile_data in zip(batch, data):
+                yield tile_id, labels[category], tile_data
+
+
+def export_split(split, samples, stores, output_dir, shard_format, max_bytes, max_samples):
+    shards = []
+    shard = None
+    for tile_id, label, data in read_tiles(samples, stores):
+        if shard is not None and (shard.size_with(len(data)) > max_bytes or shard.n_samples >= max_samples):
+            shard.close()
+            shards.append(shard.info())
+            shard = None
+        if shard is None:
+            filename = mapswipe_shards.shard_filename(split, len(shards), shard_format)
+            shard = mapswipe_shards.open_shard(os.path.join(output_dir, filename), shard_format)
+        shard.write(tile_id, label, data)
+    if shard is not None:
+        shard.close()
+        shards.append(shard.info())
+    return shards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export partitioned tiles as shard files for training")
+    parser.add_argument('--indir', '-i', metavar='<input_directory>', required=True,
+                        help='Output directory of mapswipe_partition_tiles.py')
+    parser.add_argument('--outdir', '-o', metavar='<output_directory>', required=True,
+                        help='Output Directory')
+    parser.add_argument('--format', '-f', choices=mapswipe_shards.FORMATS, default='tar',
+                        help='Shard format (default tar)')
+    parser.add_argument('--shard_size', '-s', metavar='<megabytes>', type=float, default=256,
+                        help='Maximum size of each shard in MB (default 256)')
+    parser.add_argument('--shard_samples', '-n', metavar='<number of tiles>', type=int, default=0,
+                        help='Maximum number of tiles in each shard (default no limit)')
+    parser.add_argument('--seed', metavar='<seed>', type=int, default=0,
+                        help='Seed for shuffling the tiles (default 0)')
+
+    args = parser.parse_args(argv)
+
+    input_dir  = args.indir
+    output_dir = args.outdir
+
+    max_bytes = int(args.shard_size * 1024 * 1024)
+    max_samples = args.shard_samples if args.shard_samples > 0 else sys.maxsize
+    if max_bytes <= 0:
+        sys.stderr.write("ERROR: shard size must be > 0\n")
+        sys.exit(1)
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    index = {
+        'format': args.format,
+        'seed': args.seed,
+        'labels': labels,
+        'splits': {},
+    }
+
+    for split in splits:
+        stores = {}
+        samples = []
+        for category in categories:
+            store = find_store(input_dir, split, category)
+            if store is None:
+                continue
+            stores[category] = store
+            samples.extend((category, tile_id) for tile_id in sorted(store.tile_ids()))
+
+        if len(stores) == 0:
+            continue
+
+        # the same input and seed always give the same shards
+        random.Random("{} {}".format(args.seed, split)).shuffle(samples)
+
+        shards = export_split(split, samples, stores, output_dir, args.format, max_bytes, max_samples)
+        index['splits'][split] = shards
+        for store in stores.values():
+            store.close()
+
+        print("{}: {} tiles in {} shards".format(split, len(samples), len(shards)))
+
+    index_path = os.path.join(output_dir, INDEX_FILENAME)
+    with open(index_path + '.part', 'wt') as f:
+        json.dump(index, f, indent=2)
+    os.replace(index_path + '.part', index_path)
+
+
+if __name__ == '__main__':
+    main()
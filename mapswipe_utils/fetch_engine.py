@@ -0,0 +1,435 @@
+# mapswipe_utils/fetch_engine.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Concurrent tile downloader shared by mapswipe_fetch_tiles.py and mapswipe_fetch_tile_block.py
+
+# A pool of worker threads pulls tile IDs from a shared iterator and fetches them.
+# Every request, including retries, first takes a token from a RateLimiter which
+# enforces both a requests-per-second and a requests-per-day budget across all workers,
+# and across runs with the same API key (see fetch_quota.py).
+# That way throughput is set by the quota rather than by latency plus a fixed sleep.
+
+# Completed tiles are recorded in a download journal (fetch_journal.py) in the
+# output directory, which is what decides the tiles to skip when a job is restarted.
+# The output can also be a packed tile archive (tile_store.py) in which case
+# the archive itself records the completed tiles.
+
+# Counts of tiles and requests, a latency histogram, the quota used and an ETA are kept in
+# a FetchMetrics object (fetch_metrics.py) which is reported as the job runs
+
+# Each tile body is hashed as it arrives. With dedup identical tiles in a directory are stored
+# once, and 'no imagery' placeholder tiles can be skipped or listed (see tile_dedup.py)
+
+# Requests go through a pooled keep-alive HTTP client (http_pool.py) and
+# Bing tiles are spread over the t0..t3 tile servers
+
+# The tile URL is supplied by the caller as a function of the tile ID so the engine
+# can be pointed at a local stand-in HTTP server for testing (see mapswipe_tile_server.py)
+# The fetch scripts build it from a URL template given with --tile_url
+
+import sys
+import threading
+import time
+import math
+import string
+import collections
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from mapswipe_utils import http_pool as mapswipe_http_pool
+from mapswipe_utils import fetch_journal as mapswipe_fetch_journal
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import fetch_metrics as mapswipe_fetch_metrics
+from mapswipe_utils import tile_dedup as mapswipe_tile_dedup
+from mapswipe_utils import fetch_quota as mapswipe_fetch_quota
+
+
+# Bing Maps limits access to 50,000 records per day
+BING_MAPS_DAILY_LIMIT = 50000
+
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+DEFAULT_CONNECTIONS_PER_HOST = 4
+
+# requests between writes of the quota file
+QUOTA_SAVE_EVERY = 100
+
+# Tile URL templates can contain {shard} - the tile server number 0 to 3, {quadkey} and
+# {key} - the API key
+BING_MAPS_TILE_URL = "http://t{shard}.tiles.virtualearth.net/tiles/a{quadkey}.jpeg?g=854&mkt=en-US&token={key}"
+TILE_URL_FIELDS = ['shard', 'quadkey', 'key']
+
+# HTTP status codes that are worth retrying
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+# A token bucket holds up to capacity tokens and refills at rate tokens per second
+# It starts full so a job can use its budget straight away
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.timestamp = time.monotonic()
+
+    def refill(self, now):
+        elapsed = now - self.timestamp
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.timestamp = now
+
+    # seconds until one token is available - 0 if there is one now
+    def wait_time(self):
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+# Enforce a requests-per-second and a requests-per-day budget across threads
+# The per second rate is a token bucket. The daily budget is a sliding 24 hour window - a
+# request only proceeds if fewer than requests_per_day were made in the last 24 hours.
+# With a quota_file the requests of earlier runs count against the window too and the
+# requests of this run are added to it (see fetch_quota.py)
+
+class RateLimiter:
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                 requests_per_day=BING_MAPS_DAILY_LIMIT, quota_file=None):
+        # allow a burst of up to one second's worth of requests
+        self.requests_per_second = requests_per_second
+        self.requests_per_day = requests_per_day
+        burst = max(1.0, requests_per_second)
+        self.second_bucket = TokenBucket(requests_per_second, burst)
+        self.lock = threading.Lock()
+        self.n_acquired = 0
+
+        # requests in the last 24 hours counted per minute, as [minute, n] oldest first
+        self.window = collections.deque()
+        self.n_window = 0
+
+        self.quota_file = quota_file
+        self.save_lock = threading.Lock()
+        # minute -> requests not yet added to the quota file
+        self.unsaved = {}
+        if quota_file is not None:
+            for minute, n in sorted(mapswipe_fetch_quota.read_quota_file(quota_file, time.time()).items()):
+                self._add(minute, n)
+
+    def _add(self, minute, n):
+        if self.window and self.window[-1][0] >= minute:
+            self.window[-1][1] += n
+        else:
+            self.window.append([minute, n])
+        self.n_window += n
+
+    def _expire(self, now):
+        while self.window and (self.window[0][0] + 1) * 60 + mapswipe_fetch_quota.QUOTA_WINDOW <= now:
+            self.n_window -= self.window.popleft()[1]
+
+    # seconds until the window has room for n more requests
+    def _day_wait(self, n, now):
+        excess = self.n_window + n - self.requests_per_day
+        if excess <= 0:
+            return 0.0
+        freed = 0
+        for minute, count in self.window:
+            freed += count
+            if freed >= excess:
+                return max(0.0, (minute + 1) * 60 + mapswipe_fetch_quota.QUOTA_WINDOW - now)
+        # more than a day's worth - the window is emptied and filled again once a day
+        end = (self.window[-1][0] + 1) * 60 + mapswipe_fetch_quota.QUOTA_WINDOW - now if self.window else 0.0
+        return max(0.0, end) + mapswipe_fetch_quota.QUOTA_WINDOW * math.ceil((excess - freed) / self.requests_per_day)
+
+    # block until a request is allowed
+    def acquire(self):
+        while True:
+            with self.lock:
+                self.second_bucket.refill(time.monotonic())
+                now = time.time()
+                self._expire(now)
+                wait = max(self.second_bucket.wait_time(), self._day_wait(1, now))
+                if wait == 0.0:
+                    self.second_bucket.tokens -= 1.0
+                    minute = int(now // 60)
+                    self._add(minute, 1)
+                    self.unsaved[minute] = self.unsaved.get(minute, 0) + 1
+                    self.n_acquired += 1
+                    save = self.quota_file is not None and self.n_acquired % QUOTA_SAVE_EVERY == 0
+                    break
+            time.sleep(wait)
+        if save:
+            self.save()
+
+    # the number of requests made in the last 24 hours, including earlier runs
+    def used(self):
+        with self.lock:
+            self._expire(time.time())
+            return self.n_window
+
+    # seconds until n more requests could be made, if nothing else takes tokens
+    def wait_for(self, n):
+        with self.lock:
+            self.second_bucket.refill(time.monotonic())
+            now = time.time()
+            self._expire(now)
+            return max(max(0.0, n - self.second_bucket.tokens) / self.second_bucket.rate,
+                       self._day_wait(n, now))
+
+    # Add the requests made since the last save to the quota file
+    def save(self):
+        if self.quota_file is None:
+            return
+        with self.save_lock:
+            with self.lock:
+                unsaved = self.unsaved
+                self.unsaved = {}
+            if unsaved:
+                mapswipe_fetch_quota.update_quota_file(self.quota_file, unsaved, time.time())
+
+
+# Construct the Bing Maps URL for a quadkey
+# Requests are spread over the tile servers t0 to t3 using the last quadkey digit
+# so a given tile always comes from the same server
+
+def bing_maps_tile_url(quadkey, api_key, template=BING_MAPS_TILE_URL):
+    shard = quadkey[-1] if quadkey else '0'
+    return template.format(shard=shard, quadkey=quadkey, key=api_key)
+
+
+# Check a tile URL template and return True if it needs an API key
+# Raises ValueError if the template is not valid
+
+def check_tile_url(template):
+    try:
+        fields = [field for text, field, spec, conversion in string.Formatter().parse(template) if field is not None]
+    except ValueError:
+        fields = None
+    if fields is None or 'quadkey' not in fields or any(field not in TILE_URL_FIELDS for field in fields):
+        raise ValueError("invalid tile URL: {} - it must contain {{quadkey}} and can contain {{shard}} and {{key}}".format(template))
+    return 'key' in fields
+
+
+# The function mapping a tile ID to its URL for a tile URL template
+# The API key is read from keyfile if the template needs one
+# Raises ValueError for an invalid template or a missing key file and OSError if the key can't be read
+
+def tile_url_function(template=BING_MAPS_TILE_URL, keyfile=None):
+    api_key = ''
+    if check_tile_url(template):
+        if keyfile is None:
+            raise ValueError("a Bing Maps API key file is needed for {}".format(template))
+        api_key = read_api_key(keyfile)
+
+    def tile_url(tile_id):
+        return bing_maps_tile_url(mapswipe_tile_math.tile_id_to_quadkey(tile_id), api_key, template)
+    return tile_url
+
+
+# Read the Bing Maps API key - the file contains a single line with the key
+
+def read_api_key(keyfile):
+    try:
+        with open(keyfile, 'rt') as f:
+            return f.read().strip()
+    except OSError as e:
+        raise OSError("Problem reading Bing Maps API key: {}: {}".format(keyfile, e)) from e
+
+
+# The quota file that counts the requests made with the key a tile URL template needs -
+# None for a server that doesn't need a key
+
+def default_quota_file(template=BING_MAPS_TILE_URL, keyfile=None):
+    if not check_tile_url(template) or keyfile is None:
+        return None
+    return mapswipe_fetch_quota.default_quota_file(read_api_key(keyfile))
+
+
+# Open the destination for fetched tiles - a journaled directory or a tile archive
+# Both record which tiles are complete and write new tiles atomically
+# dedup only applies to directories
+
+def open_fetch_target(output, dedup=False):
+    if mapswipe_tile_store.is_archive(output):
+        if dedup:
+            sys.stderr.write("Warning: identical tiles are not deduplicated in a tile archive: {}\n".format(output))
+        return mapswipe_tile_store.ArchiveTileStore(output, 'w')
+    return mapswipe_fetch_journal.FetchJournal(output, dedup)
+
+
+# Read a file of placeholder hashes for the fetch scripts
+# Raises OSError if the file can't be read and ValueError if it holds something other than hashes
+
+def read_placeholder_hashes(path):
+    try:
+        return mapswipe_tile_dedup.read_placeholder_hashes(path)
+    except OSError as e:
+        raise OSError("Problem reading placeholder hashes {}: {}".format(path, e)) from e
+    except ValueError as e:
+        raise ValueError("Problem reading placeholder hashes {}: {}".format(path, e)) from e
+
+
+# Fetch a list of tiles into output_dir using a pool of worker threads
+# output_dir can also be a .tiles archive
+# tile_url is a function that maps a tile ID to its URL
+# Progress is printed every report_interval seconds (0 for none) and the metrics are
+# written to metrics_file if one is given (see fetch_metrics.py)
+# dedup stores identical tiles once, placeholders is keep, skip or list and placeholder_hashes
+# is a set of known placeholder hashes (see tile_dedup.py)
+
+class TileFetcher:
+    def __init__(self, output_dir, tile_url, limiter=None, workers=DEFAULT_WORKERS,
+                 retries=DEFAULT_RETRIES, timeout=30,
+                 report_interval=mapswipe_fetch_metrics.DEFAULT_REPORT_INTERVAL, metrics_file=None,
+                 connections_per_host=DEFAULT_CONNECTIONS_PER_HOST,
+                 dedup=False, placeholders='keep', placeholder_hashes=None):
+        self.output_dir = output_dir
+        self.tile_url = tile_url
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.workers = max(1, int(workers))
+        self.retries = retries
+        self.report_interval = report_interval
+        self.metrics_file = metrics_file
+        self.client = mapswipe_http_pool.ConnectionPool(connections_per_host, timeout)
+        self.target = None
+        self.metrics = mapswipe_fetch_metrics.FetchMetrics(limiter=self.limiter)
+        self.dedup = dedup
+        if placeholders not in mapswipe_tile_dedup.PLACEHOLDER_MODES:
+            raise ValueError("invalid placeholders mode: {}".format(placeholders))
+        self.placeholder_mode = placeholders
+        self.placeholders = mapswipe_tile_dedup.PlaceholderDetector(placeholder_hashes)
+        self.placeholder_list = None
+        self.placeholder_list_lock = threading.Lock()
+
+    @property
+    def n_fetched(self):
+        return self.metrics.tiles['fetched']
+
+    @property
+    def n_skipped(self):
+        return self.metrics.tiles['skipped']
+
+    @property
+    def n_failed(self):
+        return self.metrics.tiles['failed']
+
+    @property
+    def n_placeholders(self):
+        return self.placeholders.n_placeholders
+
+    @property
+    def n_retries(self):
+        return self.metrics.n_retries
+
+    # The metrics summary and what was found about repeated tiles
+    def summary(self):
+        lines = [self.metrics.summary()]
+        content = self.placeholders.summary()
+        if content:
+            lines.append(content)
+        return '\n'.join(lines)
+
+    # Fetch every tile in tile_ids - this can be any iterable, including a generator
+    # Returns the number of tiles fetched
+    def fetch(self, tile_ids):
+        # this creates the output directory if it doesn't exist
+        self.target = open_fetch_target(self.output_dir, self.dedup)
+
+        # the ETA needs the number of tiles, which a generator doesn't have
+        try:
+            self.metrics.total = len(tile_ids)
+        except TypeError:
+            self.metrics.total = None
+
+        tile_iter = iter(tile_ids)
+        iter_lock = threading.Lock()
+
+        reporter = mapswipe_fetch_metrics.MetricsReporter(self.metrics, self.metrics_file, self.report_interval)
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._worker, tile_iter, iter_lock) for i in range(self.workers)]
+                for future in futures:
+                    future.result()
+        finally:
+            reporter.stop()
+            self.limiter.save()
+            self.client.close()
+            self.target.close()
+            if self.placeholder_list is not None:
+                self.placeholder_list.close()
+                self.placeholder_list = None
+
+        return self.n_fetched
+
+    def _worker(self, tile_iter, iter_lock):
+        while True:
+            with iter_lock:
+                tile_id = next(tile_iter, None)
+            if tile_id is None:
+                return
+            self.fetch_tile(tile_id)
+
+    def fetch_tile(self, tile_id):
+        # Skip this tile if we already downloaded it
+        if self.target.is_complete(tile_id):
+            self.metrics.tile_done('skipped')
+            return
+
+        response = self.download(self.tile_url(tile_id))
+        if response is None:
+            self.metrics.tile_done('failed')
+            self.target.record(tile_id, mapswipe_fetch_journal.STATUS_FAILED)
+            print("{} failed".format(tile_id), file=sys.stderr)
+            return
+
+        data = response.body
+        digest = mapswipe_fetch_journal.content_hash(data)
+        if self.placeholders.check(digest, response.headers) and self.placeholder_mode != 'keep':
+            self.target.record(tile_id, mapswipe_fetch_journal.STATUS_PLACEHOLDER, len(data), digest)
+            if self.placeholder_mode == 'list':
+                self.list_placeholder(tile_id)
+            self.metrics.tile_done('placeholder', len(data))
+            return
+
+        if not self.target.write_tile(tile_id, data, digest):
+            self.metrics.duplicate(len(data))
+        self.metrics.tile_done('fetched', len(data))
+
+    # Append a tile ID to the placeholder list, which is opened when the first one is found
+    def list_placeholder(self, tile_id):
+        with self.placeholder_list_lock:
+            if self.placeholder_list is None:
+                path = mapswipe_tile_dedup.placeholder_list_path(self.output_dir, mapswipe_tile_store.is_archive(self.output_dir))
+                self.placeholder_list = open(path, 'at')
+            self.placeholder_list.write(tile_id + '\n')
+            self.placeholder_list.flush()
+
+    # GET a URL and return the response, retrying transient errors with backoff
+    # Returns None if the request keeps failing
+    def download(self, url):
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.metrics.retry()
+                time.sleep(min(60.0, 2.0 ** (attempt - 1)))
+
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = self.client.get(url)
+            except (OSError, http.client.HTTPException):
+                self.metrics.request_done('error', time.monotonic() - start)
+                continue
+            self.metrics.request_done(response.status, time.monotonic() - start)
+
+            if response.status == 200:
+                return response
+            if response.status not in RETRY_STATUS_CODES:
+                return None
+
+        return None
@@ -0,0 +1,165 @@
+# mapswipe_utils/fetch_journal.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Crash-safe record of the tiles downloaded into an output directory
+
+# The journal is an append-only, tab separated file in the output directory with one line per
+# download attempt:
+#    tile_id  status  size  sha1
+# status is 'ok', 'failed' or 'placeholder' and the last line for a tile wins. A placeholder
+# is a 'no imagery' tile that was not stored (see tile_dedup.py) - like an 'ok' tile it is not
+# fetched again.
+#
+# Tiles are written to a temporary file and renamed into place before the journal line is
+# appended, so a tile marked 'ok' is always complete. A tile that was interrupted part way
+# through has no 'ok' line and is fetched again on the next run.
+#
+# Deciding what to skip on a restart is a single read of the journal rather than a stat of
+# every tile file. If a directory has no journal, the existing tiles are checked once and
+# adopted into a new journal. Delete the journal to force a rescan of the directory.
+#
+# With dedup each tile is a hard link into a content addressed object store in the directory
+# (see tile_dedup.py) and the sha1 in the journal is the tile's reference to its object.
+
+import os
+import re
+import threading
+import hashlib
+
+from mapswipe_utils import tile_dedup as mapswipe_tile_dedup
+
+
+JOURNAL_FILENAME = '.mapswipe_journal'
+PARTIAL_SUFFIX = '.part'
+
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+STATUS_PLACEHOLDER = 'placeholder'
+
+# statuses of tiles that don't need to be fetched again
+COMPLETE_STATUSES = (STATUS_OK, STATUS_PLACEHOLDER)
+
+# a complete JPEG ends with the End Of Image marker
+JPEG_EOI = b'\xff\xd9'
+
+# the name of a tile file - <zoom>-<x>-<y>.jpg
+TILE_FILENAME_PATTERN = re.compile(r'\d+-\d+-\d+\.jpg$')
+
+
+def tile_path(output_dir, tile_id):
+    return os.path.join(output_dir, "{}.jpg".format(tile_id))
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+# Read a journal into a dict of tile_id -> (status, size, sha1) - the last line for a tile wins
+def read_journal(path):
+    entries = {}
+    with open(path, 'rt') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            # ignore a partial line left by a crash
+            if len(fields) != 4:
+                continue
+            tile_id, status, size, digest = fields
+            entries[tile_id] = (status, int(size), digest)
+    return entries
+
+
+class FetchJournal:
+    def __init__(self, output_dir, dedup=False):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, JOURNAL_FILENAME)
+        self.lock = threading.Lock()
+        # tile_id -> (status, size, sha1)
+        self.entries = {}
+
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        if os.path.exists(self.path):
+            self.load()
+        else:
+            self.adopt_existing_tiles()
+
+        self.objects = None
+        if dedup:
+            self.objects = mapswipe_tile_dedup.ObjectStore(os.path.join(output_dir, mapswipe_tile_dedup.OBJECTS_DIRNAME))
+
+        self.f = open(self.path, 'at')
+
+    def load(self):
+        self.entries = read_journal(self.path)
+
+    # Build the journal for a directory of tiles fetched without one
+    # Only files named like tiles are adopted. Truncated JPEGs are left where they are but not
+    # journalled, so they get fetched again, and temporary files left by an interrupted fetch
+    # are removed
+    def adopt_existing_tiles(self):
+        for entry in list(os.scandir(self.output_dir)):
+            if entry.name.endswith(PARTIAL_SUFFIX):
+                if TILE_FILENAME_PATTERN.match(entry.name[:-len(PARTIAL_SUFFIX)]):
+                    os.remove(entry.path)
+                continue
+            if not TILE_FILENAME_PATTERN.match(entry.name) or not entry.is_file():
+                continue
+            with open(entry.path, 'rb') as f:
+                data = f.read()
+            if len(data) == 0 or not data.endswith(JPEG_EOI):
+                continue
+            tile_id = entry.name[:-len('.jpg')]
+            self.entries[tile_id] = (STATUS_OK, len(data), content_hash(data))
+
+        # write the new journal in one go so a crash here leaves no journal at all
+        partial_path = self.path + PARTIAL_SUFFIX
+        with open(partial_path, 'wt') as f:
+            for tile_id, (status, size, digest) in self.entries.items():
+                f.write("{}\t{}\t{}\t{}\n".format(tile_id, status, size, digest))
+        os.replace(partial_path, self.path)
+
+    def is_complete(self, tile_id):
+        entry = self.entries.get(tile_id)
+        return entry is not None and entry[0] in COMPLETE_STATUSES
+
+    def complete_tile_ids(self):
+        return [tile_id for tile_id, entry in self.entries.items() if entry[0] == STATUS_OK]
+
+    def record(self, tile_id, status, size=0, digest='-'):
+        with self.lock:
+            self.entries[tile_id] = (status, size, digest)
+            self.f.write("{}\t{}\t{}\t{}\n".format(tile_id, status, size, digest))
+            self.f.flush()
+
+    # Write a tile to a temporary file, rename it into place and then record it
+    # digest is the SHA1 of data, if the caller already has it
+    # Returns False if the tile was stored as a link to an existing object, otherwise True
+    def write_tile(self, tile_id, data, digest=None):
+        if digest is None:
+            digest = content_hash(data)
+        path = tile_path(self.output_dir, tile_id)
+        is_new = True
+        if self.objects is not None:
+            is_new = self.objects.place(path, data, digest)
+        else:
+            partial_path = path + PARTIAL_SUFFIX
+            with open(partial_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(partial_path, path)
+        self.record(tile_id, STATUS_OK, len(data), digest)
+        return is_new
+
+    def close(self):
+        with self.lock:
+            if not self.f.closed:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+                self.f.close()
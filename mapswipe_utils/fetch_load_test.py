@@ -0,0 +1,194 @@
+# mapswipe_utils/fetch_load_test.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Measure the throughput of the fetch scripts against a local tile server (mapswipe_tile_server.py)
+
+# For each fetch script and each number of workers a fresh tile server is started, the script
+# fetches a block of tiles from it into an empty directory, and the metrics file written by the
+# script (see fetch_metrics.py) and the server's /stats page are read back. That gives
+#
+#   - tiles per second over the whole run of the script, including starting Python
+#   - the percentiles of the request latency seen by the script, which includes waiting for a
+#     connection, and of the time the server took to answer each request
+#   - the number of retries, and of the HTTP 429 and 503 responses that caused them
+#   - the number of tiles that still failed after all the retries
+#
+# The server's latency, error rate and rate limit stand in for those of the real tile servers,
+# so the number of workers, connections and the request rate can be tuned without using up
+# any Bing Maps quota.
+
+import argparse
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import urllib.request
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import fetch_metrics as mapswipe_fetch_metrics
+from mapswipe_utils import synthetic as mapswipe_synthetic
+from mapswipe_utils import commands as mapswipe_commands
+
+np = lazy_import('numpy')
+
+
+FETCHERS = {
+    'tiles': 'fetch_tiles',
+    'block': 'fetch_tile_block',
+}
+
+
+# Start a tile server on a free port and return the process and its base URL
+def start_server(server_args):
+    process = subprocess.Popen(mapswipe_commands.command_line('tile_server', ['--port', '0'] + server_args),
+                               env=mapswipe_commands.command_env(), stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Serving tiles on '):
+        process.kill()
+        sys.stderr.write("ERROR: the tile server did not start\n")
+        sys.exit(1)
+    url = line.split()[-1]
+    return process, url[:url.index('/tiles/')]
+
+
+def stop_server(process):
+    process.terminate()
+    process.communicate()
+
+
+def server_stats(base_url):
+    with urllib.request.urlopen(base_url + '/stats') as response:
+        return json.loads(response.read().decode('ascii'))
+
+
+# Run one fetch script and return its results
+def run_fetch(fetcher, n_workers, args, server_args, tile_list, block):
+    process, base_url = start_server(server_args)
+    out_dir = tempfile.mkdtemp(prefix='mapswipe_load_test_')
+    try:
+        fetch_args = ['--tile_url', base_url + '/tiles/a{quadkey}.jpeg',
+                      '--outdir', os.path.join(out_dir, 'tiles'),
+                      '--workers', str(n_workers),
+                      '--connections_per_host', str(args.connections_per_host or n_workers),
+                      '--rate', str(args.rate),
+                      '--daily_limit', str(args.daily_limit),
+                      '--metrics', os.path.join(out_dir, 'metrics.json'),
+                      '--report_interval', '0']
+        if fetcher == 'tiles':
+            fetch_args += ['--tilelist', tile_list]
+        else:
+            x, y, nx, ny = block
+            fetch_args += ['--x', str(x), '--y', str(y), '--nx', str(nx), '--ny', str(ny),
+                           '--zoom', str(mapswipe_synthetic.ZOOM)]
+
+        start = time.perf_counter()
+        subprocess.run(mapswipe_commands.command_line(FETCHERS[fetcher], fetch_args), env=mapswipe_commands.command_env(),
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+
+        stats = server_stats(base_url)
+        with open(os.path.join(out_dir, 'metrics.json'), 'rt') as f:
+            metrics = json.load(f)
+    finally:
+        stop_server(process)
+        shutil.rmtree(out_dir)
+
+    n_tiles = block[2] * block[3]
+    requests = metrics['requests']
+    result = {
+        'fetcher': fetcher,
+        'workers': n_workers,
+        'tiles': n_tiles,
+        'seconds': seconds,
+        'tiles_per_second': metrics['tiles']['fetched'] / seconds,
+        'requests': sum(requests.values()),
+        'retries': metrics['retries'],
+        'status_429': requests.get('429', 0),
+        'status_503': requests.get('503', 0),
+        'failed': metrics['tiles']['failed'],
+    }
+    for p in mapswipe_fetch_metrics.PERCENTILES:
+        result['latency_p{}_ms'.format(p)] = metrics['latency']['p{}_seconds'.format(p)] * 1000
+    for name in stats:
+        if name.startswith('latency_'):
+            result['server_' + name] = stats[name]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure fetch throughput against a local tile server")
+    parser.add_argument('--fetchers', '-f', metavar='<fetchers>', default='tiles,block',
+                        help='Comma separated fetch scripts to run: tiles, block. Default: tiles,block')
+    parser.add_argument('--tiles', '-n', metavar='<number of tiles>', type=int, default=500,
+                        help='Number of tiles to fetch in each run. Default: 500')
+    parser.add_argument('--workers', '-w', metavar='<workers>', default='1,4,8,16',
+                        help='Comma separated numbers of workers to try. Default: 1,4,8,16')
+    parser.add_argument('--connections_per_host', '-c', metavar='<connections per host>', type=int,
+                        help='Maximum open connections to the server. Default: the number of workers')
+    parser.add_argument('--rate', '-r', metavar='<requests per second>', type=float, default=1000.0,
+                        help='Maximum requests per second made by the fetch script. Default: 1000')
+    parser.add_argument('--daily_limit', metavar='<requests per day>', type=int, default=10000000,
+                        help='Maximum requests per day made by the fetch script. Default: 10000000')
+    parser.add_argument('--latency', '-l', metavar='<milliseconds>', type=float, default=50.0,
+                        help='Server delay before each response. Default: 50')
+    parser.add_argument('--jitter', '-j', metavar='<milliseconds>', type=float, default=20.0,
+                        help='Random variation in the server delay. Default: 20')
+    parser.add_argument('--error_rate', '-e', metavar='<fraction>', type=float, default=0.0,
+                        help='Fraction of requests that fail with HTTP 503. Default: 0')
+    parser.add_argument('--server_rate', '-s', metavar='<requests per second>', type=float, default=0.0,
+                        help='Server rate limit, above which requests fail with HTTP 429. Default: no limit')
+    parser.add_argument('--output', '-o', metavar='<json_file>',
+                        help='Also write the results to a JSON file')
+    args = parser.parse_args(argv)
+
+    fetchers = [name for name in args.fetchers.split(',') if name]
+    for name in fetchers:
+        if name not in FETCHERS:
+            sys.stderr.write("ERROR: invalid fetcher: {}\n".format(name))
+            sys.exit(1)
+    worker_counts = [int(n) for n in args.workers.split(',') if n]
+
+    server_args = ['--latency', str(args.latency), '--jitter', str(args.jitter),
+                   '--error_rate', str(args.error_rate), '--rate', str(args.server_rate)]
+
+    # the same block of tiles for both scripts - as a tile list and as bounds
+    nx = max(1, int(np.sqrt(args.tiles)))
+    ny = (args.tiles + nx - 1) // nx
+    block = (mapswipe_synthetic.ORIGIN_X, mapswipe_synthetic.ORIGIN_Y, nx, ny)
+    tile_ids = mapswipe_synthetic.block_tile_ids(nx, ny)
+
+    list_file = tempfile.NamedTemporaryFile('wt', suffix='.lst', delete=False)
+    with list_file:
+        list_file.write('\n'.join(tile_ids) + '\n')
+
+    results = []
+    print("{:8s} {:>7} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8} {:>7} {:>5} {:>5} {:>6}".format(
+        'fetcher', 'workers', 'tiles', 'seconds', 'tiles/s', 'p50 ms', 'p90 ms', 'p99 ms',
+        'retries', '429', '503', 'failed'))
+    try:
+        for fetcher in fetchers:
+            for n_workers in worker_counts:
+                result = run_fetch(fetcher, n_workers, args, server_args, list_file.name, block)
+                results.append(result)
+                print("{:8s} {:>7} {:>6} {:8.2f} {:8.1f} {:8.1f} {:8.1f} {:8.1f} {:>7} {:>5} {:>5} {:>6}".format(
+                    fetcher, n_workers, result['tiles'], result['seconds'], result['tiles_per_second'],
+                    result['latency_p50_ms'], result['latency_p90_ms'], result['latency_p99_ms'],
+                    result['retries'], result['status_429'], result['status_503'], result['failed']), flush=True)
+    finally:
+        os.remove(list_file.name)
+
+    if args.output:
+        with open(args.output, 'wt') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
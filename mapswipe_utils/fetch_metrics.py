@@ -0,0 +1,303 @@
+# mapswipe_utils/fetch_metrics.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Counters, a request latency histogram and progress estimates for a fetch job
+# Used by fetch_engine.py
+
+# The metrics can be written out every few seconds while a job runs, so a long fetch can be
+# watched for stalls and throttling. If the file name ends in .prom it is written in the
+# Prometheus text format, for the node_exporter textfile collector, otherwise as JSON.
+# Files are written to a temporary name and renamed so a reader never sees half a file.
+#
+# The ETA is the longer of two estimates - the remaining tiles at the rate tiles have been
+# completing over the last minute, and the time the rate limiter needs to hand out a request
+# for each of them, which includes waiting for the daily quota to refill.
+
+import os
+import json
+import time
+import threading
+import collections
+
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = [0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# seconds of history used for the current rate
+RATE_WINDOW = 60.0
+
+DEFAULT_REPORT_INTERVAL = 10.0
+
+PERCENTILES = [50, 90, 99]
+
+METRIC_PREFIX = 'mapswipe_fetch'
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        # one count per bucket plus one for anything slower than the last bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def add(self, seconds):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += seconds
+        self.n += 1
+
+    # Estimate a percentile by interpolating within the bucket it falls in
+    def percentile(self, p):
+        if self.n == 0:
+            return 0.0
+        rank = self.n * p / 100.0
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return low
+                return low + (self.buckets[i] - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class FetchMetrics:
+    def __init__(self, total=None, limiter=None):
+        self.total = total
+        self.limiter = limiter
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.start_monotonic = time.monotonic()
+        self.last_completed = None
+
+        # placeholder is a 'no imagery' tile that was fetched but not stored (see tile_dedup.py)
+        self.tiles = collections.OrderedDict([('fetched', 0), ('skipped', 0), ('failed', 0), ('placeholder', 0)])
+        self.requests = {}
+        self.n_retries = 0
+        self.n_bytes = 0
+        # fetched tiles stored as a link to an identical tile
+        self.n_duplicates = 0
+        self.duplicate_bytes = 0
+        self.latency = LatencyHistogram()
+
+        # (time, tiles completed) samples for the current rate
+        self.samples = collections.deque([(self.start_monotonic, 0)])
+
+    def tile_done(self, outcome, n_bytes=0):
+        with self.lock:
+            self.tiles[outcome] += 1
+            self.n_bytes += n_bytes
+            if outcome != 'skipped':
+                self.last_completed = time.monotonic()
+            return self.tiles[outcome]
+
+    # status is the HTTP status or 'error' for a request that got no response
+    def request_done(self, status, seconds):
+        with self.lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+            self.latency.add(seconds)
+
+    def retry(self):
+        with self.lock:
+            self.n_retries += 1
+
+    def duplicate(self, n_bytes):
+        with self.lock:
+            self.n_duplicates += 1
+            self.duplicate_bytes += n_bytes
+
+    # A dict of the current values
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            completed = self.tiles['fetched'] + self.tiles['failed'] + self.tiles['placeholder']
+            self.samples.append((now, completed))
+            while len(self.samples) > 2 and now - self.samples[1][0] >= RATE_WINDOW:
+                self.samples.popleft()
+            then, completed_then = self.samples[0]
+            rate = (completed - completed_then) / (now - then) if now > then else 0.0
+
+            result = {
+                'start_time': self.start,
+                'update_time': time.time(),
+                'elapsed_seconds': now - self.start_monotonic,
+                'tiles': dict(self.tiles),
+                'tiles_total': self.total,
+                'requests': {str(status): n for status, n in sorted(self.requests.items(), key=lambda item: str(item[0]))},
+                'retries': self.n_retries,
+                'bytes': self.n_bytes,
+                'duplicates': self.n_duplicates,
+                'duplicate_bytes': self.duplicate_bytes,
+                'tiles_per_second': rate,
+                'seconds_since_last_tile': now - self.last_completed if self.last_completed is not None else None,
+                'latency': {
+                    'buckets': self.latency.buckets,
+                    'counts': list(self.latency.counts),
+                    'sum_seconds': self.latency.total,
+                    'count': self.latency.n,
+                },
+            }
+            for p in PERCENTILES:
+                result['latency']['p{}_seconds'.format(p)] = self.latency.percentile(p)
+
+        if self.limiter is not None:
+            result['quota_used'] = self.limiter.used()
+            result['quota_daily_limit'] = self.limiter.requests_per_day
+            result['rate_limit'] = self.limiter.requests_per_second
+
+        remaining = None
+        if self.total is not None:
+            remaining = max(0, self.total - sum(self.tiles.values()))
+        result['tiles_remaining'] = remaining
+        result['eta_seconds'] = self.eta(remaining, rate)
+        return result
+
+    def eta(self, remaining, rate):
+        if remaining is None:
+            return None
+        if remaining == 0:
+            return 0.0
+        estimates = []
+        if rate > 0:
+            estimates.append(remaining / rate)
+        if self.limiter is not None:
+            estimates.append(self.limiter.wait_for(remaining))
+        return max(estimates) if estimates else None
+
+    def progress_line(self, snapshot=None):
+        s = snapshot or self.snapshot()
+        tiles = s['tiles']
+        line = "{} tiles fetched, {} skipped, {} failed".format(tiles['fetched'], tiles['skipped'], tiles['failed'])
+        if tiles['placeholder']:
+            line += ", {} placeholders".format(tiles['placeholder'])
+        if s['tiles_total'] is not None:
+            line += " of {}".format(s['tiles_total'])
+        line += ", {:.1f} tiles/s, {} retries, p50 {:.0f} ms p99 {:.0f} ms".format(
+            s['tiles_per_second'], s['retries'],
+            s['latency']['p50_seconds'] * 1000, s['latency']['p99_seconds'] * 1000)
+        if s['eta_seconds'] is not None and s['tiles_remaining']:
+            line += ", ETA {}".format(format_duration(s['eta_seconds']))
+        return line
+
+    def summary(self):
+        s = self.snapshot()
+        lines = [self.progress_line(s)]
+        lines.append("{:.1f} seconds, {:.1f} MB, {} requests{}".format(
+            s['elapsed_seconds'], s['bytes'] / 1e6, sum(s['requests'].values()),
+            ''.join(", status {}: {}".format(status, n) for status, n in s['requests'].items())))
+        latency = s['latency']
+        if latency['count']:
+            lines.append("request latency p50 {:.0f} ms, p90 {:.0f} ms, p99 {:.0f} ms, mean {:.0f} ms".format(
+                latency['p50_seconds'] * 1000, latency['p90_seconds'] * 1000, latency['p99_seconds'] * 1000,
+                latency['sum_seconds'] / latency['count'] * 1000))
+        if s['duplicates']:
+            lines.append("{} tiles were duplicates of a stored tile, {:.1f} MB not stored".format(
+                s['duplicates'], s['duplicate_bytes'] / 1e6))
+        if 'quota_used' in s:
+            lines.append("quota used {} of {} in the last 24 hours".format(s['quota_used'], s['quota_daily_limit']))
+        return '\n'.join(lines)
+
+    def write(self, path, snapshot=None):
+        s = snapshot or self.snapshot()
+        if path.endswith('.prom'):
+            text = prometheus_text(s)
+        else:
+            text = json.dumps(s, indent=2) + '\n'
+        with open(path + '.part', 'wt') as f:
+            f.write(text)
+        os.replace(path + '.part', path)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 86400:
+        return "{}d {:02d}h {:02d}m".format(seconds // 86400, seconds % 86400 // 3600, seconds % 3600 // 60)
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+# The metrics in the Prometheus text exposition format
+def prometheus_text(s):
+    lines = []
+
+    def metric(name, kind, help_text, values):
+        full_name = METRIC_PREFIX + '_' + name
+        lines.append("# HELP {} {}".format(full_name, help_text))
+        lines.append("# TYPE {} {}".format(full_name, kind))
+        for labels, value in values:
+            if value is None:
+                continue
+            label_text = ','.join('{}="{}"'.format(k, v) for k, v in labels)
+            lines.append("{}{} {}".format(full_name, '{' + label_text + '}' if label_text else '', value))
+
+    metric('tiles_total', 'counter', 'Tiles by outcome',
+           [([('outcome', outcome)], n) for outcome, n in s['tiles'].items()])
+    metric('requests_total', 'counter', 'HTTP requests by status',
+           [([('status', status)], n) for status, n in s['requests'].items()])
+    metric('retries_total', 'counter', 'Requests that were retries', [([], s['retries'])])
+    metric('bytes_total', 'counter', 'Bytes of tiles fetched', [([], s['bytes'])])
+    metric('duplicates_total', 'counter', 'Fetched tiles stored as a link to an identical tile', [([], s['duplicates'])])
+    metric('duplicate_bytes_total', 'counter', 'Bytes of tiles not stored because they were duplicates', [([], s['duplicate_bytes'])])
+
+    latency = s['latency']
+    name = METRIC_PREFIX + '_request_duration_seconds'
+    lines.append("# HELP {} Time taken by each HTTP request".format(name))
+    lines.append("# TYPE {} histogram".format(name))
+    n = 0
+    for bound, count in zip(latency['buckets'] + ['+Inf'], latency['counts']):
+        n += count
+        lines.append('{}_bucket{{le="{}"}} {}'.format(name, bound, n))
+    lines.append("{}_sum {}".format(name, latency['sum_seconds']))
+    lines.append("{}_count {}".format(name, latency['count']))
+
+    metric('job_tiles', 'gauge', 'Tiles in the job', [([], s['tiles_total'])])
+    metric('tiles_remaining', 'gauge', 'Tiles still to fetch', [([], s['tiles_remaining'])])
+    metric('tiles_per_second', 'gauge', 'Tiles completed per second over the last minute', [([], s['tiles_per_second'])])
+    metric('eta_seconds', 'gauge', 'Estimated seconds until the job is done', [([], s['eta_seconds'])])
+    metric('quota_used', 'gauge', 'Requests made in the last 24 hours against the daily quota', [([], s.get('quota_used'))])
+    metric('quota_daily_limit', 'gauge', 'Daily request quota', [([], s.get('quota_daily_limit'))])
+    metric('rate_limit', 'gauge', 'Requests per second allowed by the rate limiter', [([], s.get('rate_limit'))])
+    metric('start_time_seconds', 'gauge', 'Unix time the job started', [([], s['start_time'])])
+    metric('last_update_seconds', 'gauge', 'Unix time of this update', [([], s['update_time'])])
+    return '\n'.join(lines) + '\n'
+
+
+# A thread that prints a progress line and writes the metrics file every interval seconds
+class MetricsReporter:
+    def __init__(self, metrics, path=None, interval=DEFAULT_REPORT_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval and self.interval > 0:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        snapshot = self.metrics.snapshot()
+        print(self.metrics.progress_line(snapshot), flush=True)
+        if self.path:
+            self.metrics.write(self.path, snapshot)
+
+    # stop reporting and write the final metrics
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.path:
+            self.metrics.write(self.path)
@@ -0,0 +1,372 @@
+# mapswipe_utils/fetch_project_json.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Fetch a project JSON file and write list files for
+# positive, ambiguous and bad tiles
+
+# Fetch JSON file from api.mapswipe.org  e.g. http://api.mapswipe.org/projects/4877.json
+
+# With --projects a list of projects, e.g. 4877,5000-5010, is fetched on a pool of --workers
+# threads sharing one pool of keep-alive connections (see http_pool.py). Each project is written
+# to its own directory just as with --project, and a line is printed for each project with the
+# time it took and whether it failed. A project that fails doesn't stop the others.
+
+# With --stream the tile records are parsed while the response is still downloading,
+# the raw bytes are copied to project.json as they arrive and the tile ids are sorted
+# in bounded memory, so memory use stays flat however large the project is
+
+# With --sync the project is only downloaded if it has changed since the last sync, using
+# a conditional request, and the JSON file and tile lists are not rewritten if it hasn't.
+# Each version is kept as a snapshot and the changes since the last version are written as
+# a diff (see project_sync.py) and as tile lists that downstream tools can work from:
+#
+#   new_<category>_tiles.lst       tiles added to the category - new tiles or tiles whose
+#                                  decision moved them into it
+#   dropped_<category>_tiles.lst   tiles that left the category
+#
+# These are empty when nothing has changed
+
+# The mapswipe API is defined in:
+# https://docs.google.com/document/d/1RwN4BNhgMT5Nj9EWYRBWxIZck5iaawg9i_5FdAAderw/
+
+# example record
+# {
+#   "bad_imagery_count": 0,
+#   "maybe_count": 0,
+#   "yes_count": 8,
+#   "id": "18-86142-119266",
+#   "user_id": "3tE8WVBSUoOImzL1fDZVsSBOoSH2",
+#   "project": 8210,
+#   "timestamp": 1505686483197,
+#   "task_x": "86142",
+#   "task_y": "119266",
+#   "task_z": "18",
+#   "decision": 1
+# },
+
+import argparse
+import sys
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import http_pool as mapswipe_http_pool
+from mapswipe_utils import project_json as mapswipe_project_json
+from mapswipe_utils import project_sync as mapswipe_project_sync
+
+np = lazy_import('numpy')
+
+
+PROJECT_API_URL = "http://api.mapswipe.org/projects/"
+
+CATEGORIES = ['positive', 'ambiguous', 'bad']
+
+# projects fetched at once with --projects
+DEFAULT_WORKERS = 8
+
+
+# Assign a tile to a category based on its aggregate decision
+def decision_category(decision):
+    decision = float(decision)
+    if decision <= 1.0:
+        return 'positive'
+    elif decision <= 2.0:
+        return 'ambiguous'
+    return 'bad'
+
+
+# The category of each of an array of decisions, as an index into CATEGORIES
+def decision_categories(decision):
+    return np.searchsorted([1.0, 2.0], np.asarray(decision, dtype=np.float64), side='left')
+
+
+def project_url(project_id):
+    return "{}{}.json".format(PROJECT_API_URL, project_id)
+
+
+# The fetch functions take client, an http_pool.ConnectionPool to share between projects,
+# or None for a connection of their own, and return the number of tiles
+# project.json is downloaded to a temporary file and renamed into place once the tile lists
+# are written, so a failed fetch leaves the previous version alone
+
+def fetch_project(url_string, json_out_path, project_path, categories, client=None):
+    tile_category = {}
+    for category in categories:
+      tile_category[category] = []
+
+    # fetch the JSON file and partition the tile_ids into 3 arrays
+    with mapswipe_http_pool.open_url(url_string, client) as url:
+      json_text = url.read().decode()
+
+    # partition tile ids into positive, ambiguous, bad categories
+    tiles = json.loads(json_text)
+    for tile in tiles:
+      tile_category[decision_category(tile['decision'])].append(tile['id'])
+
+    # dump the raw json to a file
+    partial_path = json_out_path + '.part'
+    with open(partial_path, 'wt') as f:
+      f.write(json_text)
+
+    # write the tile ids to files
+    for category in categories:
+      tile_out_path = os.path.join(project_path, "all_{}_tiles.lst".format(category))
+      with open(tile_out_path + '.part', 'wt') as f:
+        for tile_id in sorted(tile_category[category]):
+          f.write(tile_id + '\n')
+      os.replace(tile_out_path + '.part', tile_out_path)
+
+    os.replace(partial_path, json_out_path)
+    return len(tiles)
+
+
+# Parse the tile records as they are downloaded, copying the raw bytes to json_out_path,
+# and sort the tile ids for each category in bounded memory
+def fetch_project_streaming(url_string, json_out_path, project_path, categories, client=None):
+    sorters = {}
+    for category in categories:
+      sorters[category] = mapswipe_project_json.ExternalSorter()
+
+    n_tiles = 0
+    partial_path = json_out_path + '.part'
+    try:
+      with mapswipe_http_pool.open_url(url_string, client) as url, open(partial_path, 'wb') as json_file:
+        for tile in mapswipe_project_json.iter_tile_records(url, tee=json_file):
+          sorters[decision_category(tile['decision'])].add(tile['id'])
+          n_tiles += 1
+    except BaseException:
+      for sorter in sorters.values():
+        sorter.close()
+      if os.path.exists(partial_path):
+        os.remove(partial_path)
+      raise
+
+    # write the tile ids to files
+    for category in categories:
+      tile_out_path = os.path.join(project_path, "all_{}_tiles.lst".format(category))
+      sorters[category].write(tile_out_path + '.part')
+      os.replace(tile_out_path + '.part', tile_out_path)
+
+    os.replace(partial_path, json_out_path)
+    return n_tiles
+
+
+# Write the sorted tile ids of each category of a project, given as columns
+def write_category_lists(project_path, columns, categories, prefix, mask=None):
+    codes = decision_categories(columns['decision'])
+    keys = np.asarray(columns['key'])
+    if mask is None:
+        mask = np.ones(len(keys), dtype=bool)
+    for i, category in enumerate(categories):
+      tile_out_path = os.path.join(project_path, "{}_{}_tiles.lst".format(prefix, category))
+      tile_ids = sorted(mapswipe_tile_math.keys_to_tile_ids(keys[mask & (codes == i)]))
+      with open(tile_out_path + '.part', 'wt') as f:
+        for tile_id in tile_ids:
+          f.write(tile_id + '\n')
+      os.replace(tile_out_path + '.part', tile_out_path)
+
+
+# Download the project only if it has changed since the last sync, and write the tiles
+# that have entered or left each category since then
+# Returns a short description of what changed
+def sync_project(url_string, json_out_path, project_path, categories, client=None):
+    empty = {'key': np.zeros(0, dtype=np.uint64), 'decision': np.zeros(0)}
+    result = mapswipe_project_sync.ProjectSync(project_path).sync(url_string, json_out_path, client)
+    if result is None:
+      write_category_lists(project_path, empty, categories, 'new')
+      write_category_lists(project_path, empty, categories, 'dropped')
+      return "unchanged"
+
+    old, new, diff = result['old'], result['new'], result['diff']
+    write_category_lists(project_path, new, categories, 'all')
+    if diff is None:
+      # the first version - every tile is new
+      write_category_lists(project_path, new, categories, 'new')
+      write_category_lists(project_path, empty, categories, 'dropped')
+      return "version {}: {} tiles".format(result['version'], len(new['key']))
+
+    # a tile enters a category if it is new or its category changed
+    old_codes = decision_categories(old['decision'])
+    new_codes = decision_categories(new['decision'])
+    moved = ~diff['added'] & (old_codes[diff['old_rows']] != new_codes)
+    write_category_lists(project_path, new, categories, 'new', diff['added'] | moved)
+
+    # and leaves one if it was removed or moved to another - the old columns say which
+    moved_out = np.zeros(len(old['key']), dtype=bool)
+    moved_out[diff['old_rows'][moved]] = True
+    write_category_lists(project_path, old, categories, 'dropped', diff['removed'] | moved_out)
+
+    return "version {}: {} tiles added, {} removed, {} changed".format(
+        result['version'], np.count_nonzero(diff['added']), np.count_nonzero(diff['removed']),
+        np.count_nonzero(diff['changed']))
+
+
+# write a basic README file
+def write_readme(project_path, project_id, url_string):
+    readme_path = os.path.join(project_path, "README")
+    text = "MapSwipe Project {}\n\nproject JSON file downloaded from {}\n\n".format(project_id, url_string)
+    with open(readme_path, 'wt') as f:
+      f.write(text)
+
+
+# Fetch one project into its own directory in output_dir, in the way given by mode - 'sync',
+# 'stream' or 'fetch' - with requests on client if one is given
+# Returns a short description of what was fetched
+def fetch_project_dir(project_id, output_dir, mode, client=None):
+    project_id = str(project_id)
+
+    # does project subdirectory exist? if not then create it
+    project_path = os.path.join(output_dir, project_id)
+    os.makedirs(project_path, exist_ok=True)
+
+    categories = CATEGORIES
+
+    # construct the URL
+    url_string = project_url(project_id)
+
+    json_out_path = os.path.join(project_path, "project.json")
+
+    if mode == 'sync':
+        message = sync_project(url_string, json_out_path, project_path, categories, client)
+    elif mode == 'stream':
+        message = "{} tiles".format(fetch_project_streaming(url_string, json_out_path, project_path, categories, client))
+    else:
+        message = "{} tiles".format(fetch_project(url_string, json_out_path, project_path, categories, client))
+
+    write_readme(project_path, project_id, url_string)
+    return message
+
+
+# Parse a list of project IDs and ranges of IDs, e.g. 4877,5000-5010
+def parse_project_ids(text):
+    project_ids = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                first, last = [int(x) for x in part.split('-', 1)]
+                if last < first:
+                    raise ValueError(part)
+                project_ids.extend(range(first, last + 1))
+            else:
+                project_ids.append(int(part))
+        except ValueError:
+            raise ValueError("invalid project ID or range: {}".format(part))
+    # in the order given, without repeats
+    return list(dict.fromkeys(project_ids))
+
+
+# Fetch one project for fetch_projects, returning its ID, seconds taken, bytes, message and
+# any error - an error fetching one project, including a malformed record, doesn't stop the others
+def _fetch_one(project_id, output_dir, mode, client):
+    start = time.monotonic()
+    try:
+        message = fetch_project_dir(project_id, output_dir, mode, client)
+        error = None
+    except Exception as e:
+        message = None
+        error = "{}: {}".format(type(e).__name__, e)
+    json_path = os.path.join(output_dir, str(project_id), "project.json")
+    n_bytes = os.path.getsize(json_path) if error is None and os.path.exists(json_path) else 0
+    return project_id, time.monotonic() - start, n_bytes, message, error
+
+
+# Fetch many projects at once on a pool of worker threads, which share one pool of
+# keep-alive connections, printing a line for each project as it finishes
+# Returns the IDs of the projects that failed
+def fetch_projects(project_ids, output_dir, mode, workers=DEFAULT_WORKERS, connections_per_host=None):
+    if connections_per_host is None:
+        connections_per_host = workers
+    start = time.monotonic()
+    failed = []
+    n_bytes = 0
+
+    print("{:>8s}  {:6s}  {:>8s}  {:>8s}  {}".format('project', 'status', 'seconds', 'MB', 'details'))
+    with mapswipe_http_pool.ConnectionPool(connections_per_host) as client, \
+         ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(_fetch_one, project_id, output_dir, mode, client) for project_id in project_ids]
+        for future in as_completed(futures):
+            project_id, seconds, size, message, error = future.result()
+            if error is not None:
+                failed.append(project_id)
+            n_bytes += size
+            print("{:>8d}  {:6s}  {:8.2f}  {:8.1f}  {}".format(project_id, 'failed' if error else 'ok', seconds,
+                                                              size / 1e6, error or message))
+            sys.stdout.flush()
+
+    seconds = time.monotonic() - start
+    print("{} projects fetched, {} failed, {:.1f} MB in {:.1f} seconds".format(
+        len(project_ids) - len(failed), len(failed), n_bytes / 1e6, seconds))
+    if failed:
+        sys.stderr.write("failed projects: {}\n".format(','.join(str(x) for x in sorted(failed))))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch the JSON file for a MapSwipe Project")
+    projects = parser.add_mutually_exclusive_group(required=True)
+    projects.add_argument('--project', '-p', metavar='<project_id>', type=int,
+                          help='MapSwipe Project ID to retrieve')
+    projects.add_argument('--projects', '-P', metavar='<project_ids>',
+                          help='Comma separated MapSwipe Project IDs and ranges to retrieve, e.g. 4877,5000-5010')
+
+    parser.add_argument('--outdir', '-o', metavar='<output_directory>', default='.',
+                        help='Output directory in which to store downloaded data. Default: "."')
+
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument('--stream', '-s', action='store_true',
+                       help='Parse the JSON while it downloads, using bounded memory')
+
+    modes.add_argument('--sync', action='store_true',
+                       help='Only download the project if it has changed, keep a snapshot of each version and write the changes')
+
+    parser.add_argument('--workers', '-w', metavar='<number of workers>', type=int, default=DEFAULT_WORKERS,
+                        help='Number of projects to fetch at once with --projects. Default: {}'.format(DEFAULT_WORKERS))
+    parser.add_argument('--connections_per_host', metavar='<connections per host>', type=int,
+                        help='Maximum open connections to the server with --projects. Default: the number of workers')
+
+
+    args = parser.parse_args(argv)
+
+    output_dir = args.outdir
+
+    # does projects_dir exist?
+    if not os.path.isdir(output_dir):
+      print("Error: output_dir does not exist")
+      sys.exit(1)
+
+    if args.sync:
+        mode = 'sync'
+    elif args.stream:
+        mode = 'stream'
+    else:
+        mode = 'fetch'
+
+    if args.projects is not None:
+        try:
+            project_ids = parse_project_ids(args.projects)
+        except ValueError as e:
+            sys.stderr.write("ERROR: {}\n".format(e))
+            sys.exit(1)
+        failed = fetch_projects(project_ids, output_dir, mode, args.workers, args.connections_per_host)
+        if failed:
+            sys.exit(1)
+        return
+
+    message = fetch_project_dir(args.project, output_dir, mode)
+    if mode == 'sync':
+        print("project {}: {}".format(args.project, message))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# mapswipe_utils/fetch_quota.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# A record of the tile requests made with an API key over the last 24 hours
+# Used by the rate limiter in fetch_engine.py
+
+# The Bing Maps quota is per key and per day, not per run, so the requests each run makes are
+# written to a quota file and the next run - or the fetch of the negatives after the positives -
+# starts with only what is left of the quota. Requests are counted per minute:
+#
+#   {"version": 1, "minutes": {"29034712": 120, "29034713": 598, ...}}
+#
+# where each key is a Unix time in minutes. Counts older than 24 hours are dropped when the
+# file is written. The default file is one per key, named by a hash of the key, in
+# ~/.mapswipe_utils so runs into different output directories share it.
+#
+# Each run reads the file when it starts and adds its own requests to it as it goes, under a
+# lock, so runs one after another are counted exactly. Runs at the same time each only see the
+# other's requests from before they started.
+
+import os
+import json
+import hashlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+QUOTA_FILE_VERSION = 1
+
+# seconds of history the daily quota applies to
+QUOTA_WINDOW = 24 * 60 * 60
+
+QUOTA_DIRNAME = '.mapswipe_utils'
+
+
+def default_quota_file(api_key):
+    name = "quota_{}.json".format(hashlib.sha1(api_key.encode()).hexdigest()[:16])
+    return os.path.join(os.path.expanduser('~'), QUOTA_DIRNAME, name)
+
+
+def _minutes(path):
+    try:
+        with open(path, 'rt') as f:
+            state = json.load(f)
+        if state.get('version') != QUOTA_FILE_VERSION:
+            return {}
+        return dict((int(minute), int(n)) for minute, n in state['minutes'].items())
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+
+# The requests in the quota file made within the last 24 hours before now, as a dict of
+# minute -> number of requests
+def read_quota_file(path, now):
+    first = int((now - QUOTA_WINDOW) // 60)
+    return dict((minute, n) for minute, n in _minutes(path).items() if minute >= first)
+
+
+# Add counts, a dict of minute -> number of requests, to the quota file
+def update_quota_file(path, counts, now):
+    quota_dir = os.path.dirname(path)
+    if quota_dir and not os.path.isdir(quota_dir):
+        os.makedirs(quota_dir, exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        minutes = read_quota_file(path, now)
+        for minute, n in counts.items():
+            minutes[minute] = minutes.get(minute, 0) + n
+        with open(path + '.part', 'wt') as f:
+            json.dump({'version': QUOTA_FILE_VERSION,
+                       'minutes': dict((str(minute), n) for minute, n in sorted(minutes.items()))}, f)
+        os.replace(path + '.part', path)
@@ -0,0 +1,52 @@
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# mapswipe_utils/fetch_single_tile.py
+
+#Fetch a single Bing maps tile
+
+import argparse
+import sys
+import os
+
+from mapswipe_utils import fetch_engine as mapswipe_fetch_engine
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tileid', '-f', metavar='<tile_id>', required=True,
+                        help='Tile ID')
+    parser.add_argument('--outdir', '-o', metavar='<output_directory>', default='tiles',
+                        help='Output directory or .tiles archive to download to. Default: "."')
+    parser.add_argument('--keyfile', '-k', metavar='<bing maps key file>',
+                        help='File containing the Bing maps API key')
+    parser.add_argument('--tile_url', '-u', metavar='<tile url template>',
+                        default=mapswipe_fetch_engine.BING_MAPS_TILE_URL,
+                        help='Tile URL with {quadkey}, {shard} and {key} fields. Default: Bing Maps')
+    args = parser.parse_args(argv)
+
+    # construct the tile URL - the bing maps api key is only needed for Bing Maps
+    # The request counts against the daily quota of the key like those of the other fetch scripts
+    try:
+        tile_url = mapswipe_fetch_engine.tile_url_function(args.tile_url, args.keyfile)
+        quota_file = mapswipe_fetch_engine.default_quota_file(args.tile_url, args.keyfile)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
+    output_dir = args.outdir
+    tile_id = args.tileid
+
+    limiter = mapswipe_fetch_engine.RateLimiter(quota_file=quota_file)
+
+    # The fetcher creates the output directory and skips the tile if we already have it
+    fetcher = mapswipe_fetch_engine.TileFetcher(output_dir, tile_url, limiter, workers=1, report_interval=0)
+    fetcher.fetch([tile_id])
+
+
+if __name__ == '__main__':
+    main()
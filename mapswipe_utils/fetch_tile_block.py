@@ -0,0 +1,124 @@
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# mapswipe_utils/fetch_tile_block.py
+
+# Fetc a rectangular block of Bing Map image tiles given the bounds
+
+# This script is based on
+# https://github.com/mapswipe/tile-downloader by Ivan Gayton
+# https://github.com/philiptromans/mapswipe-ml-dataset-generator by Philip Tromans
+
+# The Bing Maps API key file contains a single line with the api key
+
+import argparse
+import sys
+import os
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import fetch_engine as mapswipe_fetch_engine
+from mapswipe_utils import fetch_metrics as mapswipe_fetch_metrics
+from mapswipe_utils import tile_dedup as mapswipe_tile_dedup
+from mapswipe_utils import tile_math as mapswipe_tile_math
+
+np = lazy_import('numpy')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch a block of Bing Maps image tiles")
+    parser.add_argument('--outdir', '-o', metavar='<output_directory>', default='.',
+                        help='Output directory or .tiles archive to download to. Default: "."')
+    parser.add_argument('--keyfile', '-k', metavar='<bing maps key file>',
+                        help='File containing the Bing maps API key')
+    parser.add_argument('--tile_url', '-u', metavar='<tile url template>',
+                        default=mapswipe_fetch_engine.BING_MAPS_TILE_URL,
+                        help='Tile URL with {quadkey}, {shard} and {key} fields. Default: Bing Maps')
+    parser.add_argument('--x', metavar='<x dimension low bound tile id>', required=True,
+                        help='X dimension lower bound')
+    parser.add_argument('--y', metavar='<y dimension low bound tile id>', required=True,
+                        help='Y dimension lower bound')
+
+    parser.add_argument('--nx', metavar='<number of tiles in x dimension>', required=True,
+                        help='number of tiles in X dimension')
+    parser.add_argument('--ny', metavar='<number of tiles in y dimension>', required=True,
+                        help='number of tiles in Y dimension')
+
+    parser.add_argument('--zoom', metavar='<bing maps zoom level>', default=18, type=int,
+                        help='Bing Maps zoom level - default 18')
+
+    parser.add_argument('--workers', '-w', metavar='<number of workers>', type=int,
+                        default=mapswipe_fetch_engine.DEFAULT_WORKERS,
+                        help='Number of concurrent downloads. Default: {}'.format(mapswipe_fetch_engine.DEFAULT_WORKERS))
+    parser.add_argument('--rate', '-r', metavar='<requests per second>', type=float,
+                        default=mapswipe_fetch_engine.DEFAULT_REQUESTS_PER_SECOND,
+                        help='Maximum requests per second. Default: {}'.format(mapswipe_fetch_engine.DEFAULT_REQUESTS_PER_SECOND))
+    parser.add_argument('--daily_limit', metavar='<requests per day>', type=int,
+                        default=mapswipe_fetch_engine.BING_MAPS_DAILY_LIMIT,
+                        help='Maximum requests per day. Default: {}'.format(mapswipe_fetch_engine.BING_MAPS_DAILY_LIMIT))
+    parser.add_argument('--quota_file', metavar='<quota file>',
+                        help='File counting the requests made in the last 24 hours, shared by every run with the same key. Default: one per API key in ~/.mapswipe_utils')
+    parser.add_argument('--connections_per_host', metavar='<connections per host>', type=int,
+                        default=mapswipe_fetch_engine.DEFAULT_CONNECTIONS_PER_HOST,
+                        help='Maximum open connections to each tile server. Default: {}'.format(mapswipe_fetch_engine.DEFAULT_CONNECTIONS_PER_HOST))
+    parser.add_argument('--metrics', '-m', metavar='<metrics file>',
+                        help='Write fetch metrics to this file as the job runs - Prometheus text format if it ends in .prom, otherwise JSON')
+    parser.add_argument('--report_interval', metavar='<seconds>', type=float,
+                        default=mapswipe_fetch_metrics.DEFAULT_REPORT_INTERVAL,
+                        help='Seconds between progress reports, 0 for none. Default: {}'.format(mapswipe_fetch_metrics.DEFAULT_REPORT_INTERVAL))
+    parser.add_argument('--dedup', action='store_true',
+                        help='Store each distinct tile image once, with the tile files hard links to it')
+    parser.add_argument('--placeholders', choices=mapswipe_tile_dedup.PLACEHOLDER_MODES, default='keep',
+                        help='What to do with "no imagery" placeholder tiles - keep them, skip them or skip and list them. Default: keep')
+    parser.add_argument('--placeholder_hashes', metavar='<hash file>',
+                        help='File of SHA1 hashes of known placeholder tiles, one per line')
+
+
+    args = parser.parse_args(argv)
+
+    output_dir = args.outdir
+
+    # tile id bounds are inclusive
+    x_lo = int(args.x)
+    y_lo = int(args.y)
+
+    nx = int(args.nx)
+    ny = int(args.ny)
+    zoom = int(args.zoom)
+
+    # construct the tile URLs - the bing maps api key is only needed for Bing Maps
+    try:
+        tile_url = mapswipe_fetch_engine.tile_url_function(args.tile_url, args.keyfile)
+
+        placeholder_hashes = None
+        if args.placeholder_hashes:
+            placeholder_hashes = mapswipe_fetch_engine.read_placeholder_hashes(args.placeholder_hashes)
+
+        quota_file = args.quota_file or mapswipe_fetch_engine.default_quota_file(args.tile_url, args.keyfile)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
+    # Generate a list of the tile ids, row by row
+    ys, xs = np.mgrid[y_lo:y_lo+ny, x_lo:x_lo+nx]
+    zooms = np.full(nx * ny, zoom)
+    tile_ids = mapswipe_tile_math.format_tile_ids(zooms, xs.ravel(), ys.ravel())
+
+    # Fetch the tiles
+    # Bing Maps limits access to 50,000 records per day - the rate limiter
+    # spreads requests from all the workers within that budget
+    limiter = mapswipe_fetch_engine.RateLimiter(args.rate, args.daily_limit, quota_file)
+    fetcher = mapswipe_fetch_engine.TileFetcher(output_dir, tile_url, limiter, workers=args.workers,
+                                                connections_per_host=args.connections_per_host,
+                                                report_interval=args.report_interval, metrics_file=args.metrics,
+                                                dedup=args.dedup, placeholders=args.placeholders,
+                                                placeholder_hashes=placeholder_hashes)
+    fetcher.fetch(tile_ids)
+
+    print(fetcher.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# mapswipe_utils/filter_tile_list.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Given a list of bing map tiles and a mapswipe project JSON file
+# output those that match the supplied constraints
+# For example: yes_count >= 3
+#              task_y eq 123699
+
+# It's primary use is to filter a list of tiles based on the yes_count
+# but the other modea might be useful at times
+
+# A single constraint is given with
+
+# --attribute
+# --value
+# --operator   lt, le, eq, ge, gt
+
+# or a compound query with --query, e.g.
+
+# --query 'yes_count >= 2 and bad_imagery_count == 0'
+
+# Queries can use lt, le, eq, ne, ge, gt or <, <=, ==, !=, >=, >
+# combined with and, or, not and parentheses - see tile_query.py
+
+# Can only be applied to numeric attributes
+#   bad_imagery_count
+#   maybe_count
+#   yes_count
+#   task_x
+#   task_y
+#   task_z
+#   decision
+
+# The query is evaluated over all the tiles in the project at once and the tile list
+# is matched using integer tile keys, so this is fast even for very large projects
+
+# This could be done using 'jq' but the syntax of that is realtively complex
+
+# The project JSON is read through a columnar cache (see project_cache.py)
+# which is built on the first run and makes later runs on the same project much faster
+
+# The mapswipe API is defined in:
+# https://docs.google.com/document/d/1RwN4BNhgMT5Nj9EWYRBWxIZck5iaawg9i_5FdAAderw/
+
+# example record
+# {
+#   "bad_imagery_count": 0,
+#   "maybe_count": 0,
+#   "yes_count": 8,
+#   "id": "18-86142-119266",
+#   "user_id": "3tE8WVBSUoOImzL1fDZVsSBOoSH2",
+#   "project": 8210,
+#   "timestamp": 1505686483197,
+#   "task_x": "86142",
+#   "task_y": "119266",
+#   "task_z": "18",
+#   "decision": 1
+# },
+
+import argparse
+import sys
+import re
+
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import project_cache as mapswipe_project_cache
+from mapswipe_utils import tile_query as mapswipe_tile_query
+
+TILE_ID_PATTERN = re.compile(r'\d+-\d+-\d+$')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Filter a list of MapSwipe Tile IDs using user-supplied criteria")
+    parser.add_argument('--jsonfile', '-j', metavar='<project_json_file>', required=True,
+                        help='MapSwipe Project JSON file')
+
+# need this ? - yes
+    parser.add_argument('--tilelist', '-t', metavar='<tile_list_file>', required=True,
+                        help='File of tile IDs')
+
+    parser.add_argument('--query', '-q', metavar='<query>',
+                        help='Query expression, e.g. "yes_count >= 2 and bad_imagery_count == 0"')
+
+    parser.add_argument('--attribute', '-a', metavar='<json_attribute>',
+                        help='Name of JSON attribute to filter on')
+    parser.add_argument('--value', '-v', metavar='<value>', type=int,
+                        help='value')
+    parser.add_argument('--operator', '-o', metavar='<operator>',
+                        help='Operator [lt, le, eq, ge, gt]')
+
+
+    args = parser.parse_args(argv)
+
+    valid_attributes = [ 'bad_imagery_count', 'maybe_count', 'yes_count', 'task_x', 'task_y', 'task_z' ]
+    valid_operators  = [ 'lt', 'le', 'eq', 'ge', 'gt' ]
+
+
+    tile_list_file = args.tilelist
+    json_file      = args.jsonfile
+
+    if args.query is not None:
+        query_text = args.query
+    else:
+        attribute_name = args.attribute
+        operator       = args.operator
+        if attribute_name is None or operator is None or args.value is None:
+            sys.stderr.write("ERROR: supply either --query or --attribute, --operator and --value\n")
+            sys.exit(1)
+
+        # check for valid attributes and operators
+        if not attribute_name in valid_attributes:
+            sys.stderr.write("ERROR: invalid attribute: {}\n".format(attribute_name))
+            sys.exit(1)
+        if not operator in valid_operators:
+            sys.stderr.write("ERROR: invalid operators: {}\n".format(operator))
+            sys.exit(1)
+        query_text = "{} {} {}".format(attribute_name, operator, int(args.value))
+
+    try:
+        query = mapswipe_tile_query.compile_query(query_text)
+    except mapswipe_tile_query.QueryError as e:
+        sys.stderr.write("ERROR: invalid query: {}\n".format(e))
+        sys.exit(1)
+
+    # Load the tile IDs - lines that aren't tile IDs, like a header, can't match a tile and are skipped
+    with open(tile_list_file, 'rt') as f:
+        lines = [x for x in f.read().splitlines() if x]
+    tile_ids = [x for x in lines if TILE_ID_PATTERN.match(x)]
+    if len(tile_ids) < len(lines):
+        sys.stderr.write("Warning: skipped {} lines in {} that are not tile IDs\n".format(len(lines) - len(tile_ids), tile_list_file))
+    tile_keys = mapswipe_tile_math.tile_ids_to_keys(tile_ids)
+
+    # Load in the project and select the listed tiles that match the query
+    project = mapswipe_project_cache.load_project(json_file)
+
+    mask = mapswipe_tile_query.key_membership(project['key'], tile_keys)
+    mask &= query.mask(project)
+    output_tile_ids = mapswipe_tile_math.keys_to_tile_ids(project['key'][mask])
+
+    # output the tile_ids
+    if output_tile_ids:
+        sys.stdout.write('\n'.join(output_tile_ids) + '\n')
+
+
+if __name__ == '__main__':
+    main()
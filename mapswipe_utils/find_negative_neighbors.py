@@ -0,0 +1,96 @@
+# mapswipe_utils/find_negative_neighbors.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Given a mapswipe project json file and a file of positive tiles, look for
+# tiles near to the positives that are not explicitly tagged as positive, ambiguous or bad imagery
+# and therefore they should be negatives
+
+# The Output is a list of tile IDs, one per line
+
+# The project JSON is read through a columnar cache (see project_cache.py)
+
+import argparse
+import sys
+import random
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import project_cache as mapswipe_project_cache
+from mapswipe_utils import negative_sampling as mapswipe_negative_sampling
+
+np = lazy_import('numpy')
+
+
+# For each positive look for a nearby tile that is not in the project
+# This searches systematically for an immediate neighbor
+# if it can't find one then it searches systematically 2 tiles away
+# and then further out, ring by ring, up to 50 tiles away
+#
+# The idea is that we want to select negative tiles that are likely to have
+# similar terrain to the positives
+#
+# This approach seems to work well in practice
+#
+# The search itself is in negative_sampling.py
+#
+# With --workers the positives are split up by area across several processes.
+# The output depends only on --seed, not on the number of workers
+
+
+# Find negatives near the positives, given as zoom, x and y arrays, in a loaded project
+# Returns an array of the packed keys of the negatives - positives with no free neighbor
+# have already been reported. emit and mp_context are passed on to sample_negatives
+def find_negative_keys(project, zooms, xs, ys, seed, workers=1, emit=None, mp_context=None):
+    # Index the tiles that are taken - everything in the project and the positives
+    project_zooms, project_xs, project_ys = mapswipe_tile_math.unpack_tiles(project['key'])
+    index = mapswipe_negative_sampling.OccupancyIndex(np.concatenate([project_zooms, zooms]),
+                                                      np.concatenate([project_xs, xs]),
+                                                      np.concatenate([project_ys, ys]))
+
+    negatives = mapswipe_negative_sampling.sample_negatives(index, zooms, xs, ys, seed, workers,
+                                                            emit, mp_context)
+    return negatives[negatives != 0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Identify negative MapSwipe tiles near to positive tiles")
+    parser.add_argument('--jsonfile', '-f', metavar='<json_file>', required=True,
+                        help='MapSwipe Project JSON file')
+    parser.add_argument('--tilelist', '-p', metavar='<tile_id_file>', required=True,
+                        help='File of positive tile IDs')
+    parser.add_argument('--seed', '-s', metavar='<seed>', type=int,
+                        help='Seed for the random choice of negatives - the same seed gives the same output')
+    parser.add_argument('--workers', '-w', metavar='<number of workers>', type=int, default=1,
+                        help='Number of processes to use (default 1)')
+
+    args = parser.parse_args(argv)
+    json_file = args.jsonfile
+    tile_list_file = args.tilelist
+
+    seed = args.seed
+    if seed is None:
+        seed = random.randrange(1 << 32)
+        sys.stderr.write("Using seed {}\n".format(seed))
+
+    # Load all the IDs from the project
+    project = mapswipe_project_cache.load_project(json_file)
+
+    # Load the positive IDs
+    with open(tile_list_file, 'rt') as f:
+        positive_tile_ids = [x for x in f.read().splitlines() if x]
+    zooms, xs, ys = mapswipe_tile_math.parse_tile_ids(positive_tile_ids)
+
+    # For each positive, find a free neighbor
+    negatives = find_negative_keys(project, zooms, xs, ys, seed, max(1, args.workers))
+    for tile_id in mapswipe_tile_math.keys_to_tile_ids(negatives):
+      print(tile_id)
+
+
+# worker processes may import this script, which must not run main() again
+if __name__ == '__main__':
+    main()
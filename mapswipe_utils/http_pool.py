@@ -0,0 +1,201 @@
+# mapswipe_utils/http_pool.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# A small pooled HTTP client that keeps connections alive between requests
+
+# Opening a new TCP connection (and doing a DNS lookup) for every tile dominates
+# the time taken to fetch a small image, so idle connections are kept per host
+# and reused. At most max_per_host connections are open to any one host at a time.
+#
+# get() reads the whole body, which suits image tiles. stream() hands back the response for
+# the body to be read as it arrives, which suits large project JSON files, and follows redirects.
+
+import threading
+import queue
+import contextlib
+import collections
+import http.client
+import urllib.parse
+
+
+Response = collections.namedtuple('Response', ['status', 'headers', 'body'])
+
+# errors that mean a kept-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                           ConnectionResetError, BrokenPipeError)
+
+REDIRECT_STATUS_CODES = [301, 302, 303, 307, 308]
+MAX_REDIRECTS = 5
+
+
+# A response with a status the caller didn't expect
+class HTTPStatusError(OSError):
+    def __init__(self, url, status, reason=''):
+        if reason:
+            status_text = "{} {}".format(status, reason)
+        else:
+            status_text = str(status)
+        OSError.__init__(self, "HTTP {} from {}".format(status_text, url))
+        self.url = url
+        self.status = status
+
+
+class HostPool:
+    def __init__(self, scheme, host, port, max_connections, timeout):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_connections)
+
+    def new_connection(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def get_connection(self):
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self.new_connection(), False
+
+    def close(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+
+class ConnectionPool:
+    def __init__(self, max_per_host=4, timeout=30):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def host_pool(self, scheme, host, port):
+        key = (scheme, host, port)
+        with self.lock:
+            pool = self.hosts.get(key)
+            if pool is None:
+                pool = HostPool(scheme, host, port, self.max_per_host, self.timeout)
+                self.hosts[key] = pool
+        return pool
+
+    def prepare(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        pool = self.host_pool(parts.scheme, parts.hostname, parts.port)
+        request_headers = {'Connection': 'keep-alive'}
+        if headers:
+            request_headers.update(headers)
+        return pool, path, request_headers
+
+    # Send a GET on a connection from pool and return the connection and the response,
+    # with the body still to be read. The caller must hold one of the pool's slots
+    def request(self, pool, path, headers):
+        conn, reused = pool.get_connection()
+        while True:
+            try:
+                conn.request('GET', path, headers=headers)
+                return conn, conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # the server closed an idle connection - try again on a fresh one
+                conn, reused = pool.new_connection(), False
+            except Exception:
+                conn.close()
+                raise
+
+    # Keep the connection for another request if the whole body was read
+    def release(self, pool, conn, response):
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            pool.idle.put(conn)
+
+    # GET a URL over a pooled connection and return a Response
+    # Blocks while max_per_host requests to the same host are in flight
+    def get(self, url, headers=None):
+        pool, path, request_headers = self.prepare(url, headers)
+        with pool.slots:
+            conn, response = self.request(pool, path, request_headers)
+            try:
+                body = response.read()
+            except Exception:
+                conn.close()
+                raise
+            self.release(pool, conn, response)
+
+        return Response(response.status, response.headers, body)
+
+    # GET a URL over a pooled connection and yield the response, for the body to be read as it
+    # arrives, e.g.
+    #
+    #   with client.stream(url) as response:
+    #       for chunk in iter(lambda: response.read(65536), b''):
+    #           ...
+    #
+    # Redirects are followed and a status not in ok_status raises HTTPStatusError
+    # The connection goes back to the pool if the body was read to the end
+    @contextlib.contextmanager
+    def stream(self, url, headers=None, ok_status=(200,)):
+        for redirect in range(MAX_REDIRECTS + 1):
+            pool, path, request_headers = self.prepare(url, headers)
+            with pool.slots:
+                conn, response = self.request(pool, path, request_headers)
+                location = response.getheader('Location')
+                if response.status in REDIRECT_STATUS_CODES and location:
+                    response.read()
+                    self.release(pool, conn, response)
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+                if response.status not in ok_status:
+                    conn.close()
+                    raise HTTPStatusError(url, response.status, response.reason)
+                try:
+                    yield response
+                except BaseException:
+                    conn.close()
+                    raise
+                self.release(pool, conn, response)
+                return
+        raise HTTPStatusError(url, response.status, "too many redirects")
+
+    def close(self):
+        with self.lock:
+            pools = list(self.hosts.values())
+            self.hosts = {}
+        for pool in pools:
+            pool.close()
+
+
+# Stream a URL on client, a shared ConnectionPool, or on a connection of its own
+@contextlib.contextmanager
+def open_url(url, client=None, headers=None, ok_status=(200,)):
+    if client is not None:
+        with client.stream(url, headers, ok_status) as response:
+            yield response
+        return
+    with ConnectionPool(1) as client:
+        with client.stream(url, headers, ok_status) as response:
+            yield response
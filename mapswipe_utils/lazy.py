@@ -0,0 +1,39 @@
+# mapswipe_utils/lazy.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Import a module the first time one of its attributes is used, rather than at import time
+
+# NumPy and PIL take longer to import than most of the commands take to parse their arguments,
+# and many command lines - --help, a single tile fetch, a resumed fetch with nothing left to do -
+# never use them. Modules in this package import them with
+#
+#   np = lazy_import('numpy')
+#
+# which gives a stand-in module that imports the real one on first use and then takes on all
+# of its attributes, so later uses cost the same as with a normal import.
+#
+# The real import goes through importlib.import_module, which holds the import lock, so it is
+# safe when several threads make the first use at once. (importlib.util.LazyLoader is not,
+# before Python 3.12.)
+
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
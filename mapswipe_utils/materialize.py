@@ -0,0 +1,168 @@
+# mapswipe_utils/materialize.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Put copies of tile files into another directory without necessarily copying the data
+
+# Splitting a set of tiles into train, validation and test directories does not need a
+# second copy of every image. The mode says how each file is placed:
+#
+#   copy      an ordinary copy of the file
+#   link      a hard link to the same file - no extra space, but both names share the data
+#   symlink   a symbolic link to the absolute path of the original
+#   reflink   a copy on write clone of the file on filesystems that support it (btrfs, XFS)
+#             otherwise copy_file_range, which lets the kernel copy without going through
+#             user space, and finally an ordinary copy
+#
+# A hard link that can't be made, for example because the directories are on different
+# filesystems, falls back to a reflink and then to a copy. A file that is already linked
+# to the original is left alone, so rebuilding a linked split is quick.
+#
+# Files are placed under a temporary name and renamed into place.
+
+import os
+import sys
+import errno
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+MODES = ['copy', 'link', 'symlink', 'reflink']
+
+DEFAULT_WORKERS = 8
+
+# ioctl request to clone a whole file on Linux - _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+COPY_CHUNK_SIZE = 1 << 30
+
+
+# Try to clone src into the open file dst - returns True if it worked
+def _clone(src_fd, dst_fd):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+# Copy with copy_file_range - returns True if it worked
+def _copy_range(src_fd, dst_fd, size):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK_SIZE, size - copied))
+            if n == 0:
+                break
+            copied += n
+    except OSError:
+        if copied == 0:
+            return False
+        raise
+    return copied == size
+
+
+# Reflink src to path, falling back to copy_file_range and then an ordinary copy
+# Returns the method that was used
+def _reflink(src, path):
+    with open(src, 'rb') as fsrc, open(path, 'wb') as fdst:
+        if _clone(fsrc.fileno(), fdst.fileno()):
+            return 'reflink'
+        if _copy_range(fsrc.fileno(), fdst.fileno(), os.fstat(fsrc.fileno()).st_size):
+            return 'copy_file_range'
+        fdst.seek(0)
+        fdst.truncate()
+        fsrc.seek(0)
+        shutil.copyfileobj(fsrc, fdst)
+    return 'copy'
+
+
+def _already_linked(src, dst, mode):
+    try:
+        if mode == 'link':
+            return not os.path.islink(dst) and os.path.samefile(src, dst)
+        if mode == 'symlink':
+            return os.path.islink(dst) and os.readlink(dst) == os.path.abspath(src)
+    except OSError:
+        pass
+    return False
+
+
+# Place src at dst using mode
+# Returns the method that was actually used - copy, link, symlink, reflink, copy_file_range
+# or existing if dst was already linked to src
+def materialize_file(src, dst, mode='copy'):
+    if mode not in MODES:
+        raise ValueError("invalid mode: {}".format(mode))
+    if _already_linked(src, dst, mode):
+        return 'existing'
+
+    partial_path = "{}.part{}".format(dst, threading.get_ident())
+    if os.path.lexists(partial_path):
+        os.remove(partial_path)
+    try:
+        method = None
+        if mode == 'link':
+            try:
+                os.link(src, partial_path)
+                method = 'link'
+            except OSError:
+                # different filesystems, no hard links on this filesystem, too many links...
+                method = None
+        elif mode == 'symlink':
+            # a symlink can be made to a file that doesn't exist - don't leave a dangling one
+            if not os.path.exists(src):
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), src)
+            os.symlink(os.path.abspath(src), partial_path)
+            method = 'symlink'
+        elif mode == 'copy':
+            shutil.copyfile(src, partial_path)
+            method = 'copy'
+        if method is None:
+            method = _reflink(src, partial_path)
+        os.replace(partial_path, dst)
+    except BaseException:
+        if os.path.lexists(partial_path):
+            os.remove(partial_path)
+        raise
+    return method
+
+
+# Place many files on a pool of threads
+# pairs is an iterable of (src, dst) paths
+# With missing_ok a src that doesn't exist is skipped and counted as missing
+# Returns a dict of the number of files placed by each method
+def materialize_files(pairs, mode='copy', workers=DEFAULT_WORKERS, missing_ok=False):
+    def place(pair):
+        try:
+            return materialize_file(pair[0], pair[1], mode)
+        except FileNotFoundError:
+            if missing_ok and not os.path.lexists(pair[0]):
+                return 'missing'
+            raise
+
+    counts = {}
+    if workers <= 1:
+        for pair in pairs:
+            method = place(pair)
+            counts[method] = counts.get(method, 0) + 1
+        return counts
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for method in pool.map(place, pairs):
+            counts[method] = counts.get(method, 0) + 1
+    return counts
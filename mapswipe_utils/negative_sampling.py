@@ -0,0 +1,400 @@
+# mapswipe_utils/negative_sampling.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Find negative tiles near to positive tiles, used by mapswipe_find_negative_neighbors.py
+
+# A negative is a tile that is not in the project at all - it was not tagged as positive,
+# ambiguous or bad imagery. For each positive we pick a free tile from the nearest ring of
+# tiles around it that has one:
+#
+#   ring 1 is the 8 immediate neighbors, ring 2 the 16 tiles 2 steps away and so on
+#
+# choosing at random within that ring. The idea is that nearby tiles should have similar
+# terrain to the positives. Rings are searched out to MAX_RADIUS tiles.
+#
+# Which tiles are taken is held in an OccupancyIndex - a bitmap over the bounding box of the
+# project, or a set of packed integer tile keys if the box is too large for a bitmap. Each
+# negative that is picked is added to the index so it is not picked twice.
+#
+# sample_negatives does the same for a large list of positives on several processes, with
+# output that depends only on the seed and not on the number of processes:
+#
+#   - positives are grouped into cells of CELL_SIZE x CELL_SIZE tiles
+#   - each cell is sampled on its own, with a random generator seeded from the seed and the
+#     cell, against the project and the positives but not the negatives of other cells
+#   - the cells are then merged in a fixed order - a negative already taken by an earlier cell
+#     is picked again, with a generator seeded from the seed and the positive
+#
+# Only cells within MAX_RADIUS tiles of each other can pick the same tile, so there are few
+# conflicts to resolve.
+
+import sys
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+
+np = lazy_import('numpy')
+
+
+MAX_RADIUS = 50
+
+# use a set of keys rather than a bitmap for boxes with more cells than this
+MAX_BITMAP_CELLS = 1 << 28
+
+
+# Offsets of every tile within MAX_RADIUS of the origin, ordered by ring
+# Each ring starts due north and goes clockwise
+def _ring_offsets(radius):
+    if radius == 0:
+        return [(0, 0)]
+    offsets = []
+    for dx in range(0, radius + 1):
+        offsets.append((dx, -radius))
+    for dy in range(-radius + 1, radius + 1):
+        offsets.append((radius, dy))
+    for dx in range(radius - 1, -radius - 1, -1):
+        offsets.append((dx, radius))
+    for dy in range(radius - 1, -radius - 1, -1):
+        offsets.append((-radius, dy))
+    for dx in range(-radius + 1, 0):
+        offsets.append((dx, -radius))
+    return offsets
+
+
+def _all_offsets(max_radius):
+    dx = []
+    dy = []
+    ring_start = [0]
+    for radius in range(1, max_radius + 1):
+        for x, y in _ring_offsets(radius):
+            dx.append(x)
+            dy.append(y)
+        ring_start.append(len(dx))
+    return np.array(dx, dtype=np.int64), np.array(dy, dtype=np.int64), ring_start
+
+
+OFFSET_DX, OFFSET_DY, RING_START = _all_offsets(MAX_RADIUS)
+
+# rings are searched in stages out to these radii
+SEARCH_STAGES = [1, 2, 5, MAX_RADIUS]
+
+
+# Occupancy of the tiles at one zoom level, as a bitmap over a bounding box
+# Tiles outside the box are kept in a set of packed keys
+
+class BitmapOccupancy:
+    def __init__(self, zoom, xs, ys, padding):
+        self.zoom = zoom
+        self.x0 = int(xs.min()) - padding
+        self.y0 = int(ys.min()) - padding
+        width = int(xs.max()) + padding + 1 - self.x0
+        height = int(ys.max()) + padding + 1 - self.y0
+        self.grid = np.zeros((height, width), dtype=bool)
+        self.grid[ys - self.y0, xs - self.x0] = True
+        self.outside = KeySetOccupancy(zoom, xs[:0], ys[:0])
+
+    def inside(self, xs, ys):
+        return ((xs >= self.x0) & (ys >= self.y0) &
+                (xs < self.x0 + self.grid.shape[1]) & (ys < self.y0 + self.grid.shape[0]))
+
+    def occupied(self, xs, ys):
+        inside = self.inside(xs, ys)
+        result = np.empty(len(xs), dtype=bool)
+        result[inside] = self.grid[ys[inside] - self.y0, xs[inside] - self.x0]
+        if not inside.all():
+            result[~inside] = self.outside.occupied(xs[~inside], ys[~inside])
+        return result
+
+    def add(self, x, y):
+        if self.x0 <= x < self.x0 + self.grid.shape[1] and self.y0 <= y < self.y0 + self.grid.shape[0]:
+            self.grid[y - self.y0, x - self.x0] = True
+        else:
+            self.outside.add(x, y)
+
+    def discard(self, x, y):
+        if self.x0 <= x < self.x0 + self.grid.shape[1] and self.y0 <= y < self.y0 + self.grid.shape[0]:
+            self.grid[y - self.y0, x - self.x0] = False
+        else:
+            self.outside.discard(x, y)
+
+
+# Occupancy of the tiles at one zoom level as a set of packed keys
+
+class KeySetOccupancy:
+    def __init__(self, zoom, xs, ys):
+        self.zoom = zoom
+        self.keys = set(mapswipe_tile_math.pack_tiles(np.full(len(xs), zoom), xs, ys).tolist())
+
+    def occupied(self, xs, ys):
+        keys = mapswipe_tile_math.pack_tiles(np.full(len(xs), self.zoom), xs, ys).tolist()
+        return np.array([key in self.keys for key in keys], dtype=bool)
+
+    def add(self, x, y):
+        self.keys.add(mapswipe_tile_math.pack_tile(self.zoom, x, y))
+
+    def discard(self, x, y):
+        self.keys.discard(mapswipe_tile_math.pack_tile(self.zoom, x, y))
+
+
+class OccupancyIndex:
+    def __init__(self, zooms, xs, ys, padding=MAX_RADIUS):
+        zooms = np.asarray(zooms, dtype=np.int64)
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        self.padding = padding
+        self.levels = {}
+        for zoom in np.unique(zooms).tolist():
+            at_zoom = zooms == zoom
+            self.levels[zoom] = self.new_level(zoom, xs[at_zoom], ys[at_zoom])
+
+    @classmethod
+    def from_keys(cls, keys, padding=MAX_RADIUS):
+        return cls(*mapswipe_tile_math.unpack_tiles(keys), padding=padding)
+
+    def new_level(self, zoom, xs, ys):
+        if len(xs) == 0:
+            return KeySetOccupancy(zoom, xs, ys)
+        width = int(xs.max()) - int(xs.min()) + 2 * self.padding + 1
+        height = int(ys.max()) - int(ys.min()) + 2 * self.padding + 1
+        if width * height > MAX_BITMAP_CELLS:
+            return KeySetOccupancy(zoom, xs, ys)
+        return BitmapOccupancy(zoom, xs, ys, self.padding)
+
+    def level(self, zoom):
+        if zoom not in self.levels:
+            empty = np.zeros(0, dtype=np.int64)
+            self.levels[zoom] = KeySetOccupancy(zoom, empty, empty)
+        return self.levels[zoom]
+
+    # Which of the tiles at xs, ys are taken
+    # Tiles off the edge of the map count as taken so they are never picked
+    def occupied(self, zoom, xs, ys):
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        off_map = (xs < 0) | (ys < 0) | (xs >= 1 << zoom) | (ys >= 1 << zoom)
+        result = np.ones(len(xs), dtype=bool)
+        on_map = ~off_map
+        result[on_map] = self.level(zoom).occupied(xs[on_map], ys[on_map])
+        return result
+
+    def add(self, zoom, x, y):
+        self.level(zoom).add(x, y)
+
+    def discard(self, zoom, x, y):
+        self.level(zoom).discard(x, y)
+
+    # The nearest free tile to x, y as (x, y), chosen at random from the nearest ring
+    # that has a free tile - None if there are none within max_radius
+    def nearest_free(self, zoom, x, y, rng=random, max_radius=MAX_RADIUS):
+        searched = 0
+        for stage in SEARCH_STAGES:
+            radius = min(stage, max_radius)
+            end = RING_START[radius]
+            if end > searched:
+                free = ~self.occupied(zoom, x + OFFSET_DX[searched:end], y + OFFSET_DY[searched:end])
+                if free.any():
+                    # keep the free tiles in the nearest ring
+                    found = np.flatnonzero(free) + searched
+                    ring = np.searchsorted(RING_START, found[0], side='right')
+                    found = found[found < RING_START[ring]]
+                    i = found[rng.randrange(len(found))] if len(found) > 1 else found[0]
+                    return x + int(OFFSET_DX[i]), y + int(OFFSET_DY[i])
+                searched = end
+            if radius == max_radius:
+                break
+        return None
+
+
+def report_no_neighbor(zoom, x, y):
+    print("{} has no neighbor".format(mapswipe_tile_math.format_tile_id(zoom, x, y)), file=sys.stderr)
+
+
+# Given a tile ID find a neighbor that is not in the index, and add it to the index
+# Returns the new tile ID or None
+
+def find_neighbor(index, tile_id, rng=random):
+    zoom, tile_x, tile_y = mapswipe_tile_math.parse_tile_id(tile_id)
+    found = index.nearest_free(zoom, tile_x, tile_y, rng)
+    if found is None:
+        report_no_neighbor(zoom, tile_x, tile_y)
+        return None
+    index.add(zoom, found[0], found[1])
+    return mapswipe_tile_math.format_tile_id(zoom, found[0], found[1])
+
+
+# Find a negative for each of a batch of positives, given as zoom, x and y arrays
+# Returns an array of packed keys, with 0 for positives that have no free tile nearby
+#
+# The immediate neighbors of all the positives are checked in one go, which is all
+# that is needed for most positives. Only when those are all taken, by the project
+# or by a negative picked earlier in the batch, does a positive need a wider search.
+
+def find_negatives(index, zooms, xs, ys, rng=random, report=True):
+    zooms = np.asarray(zooms, dtype=np.int64)
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    n = len(xs)
+    negatives = np.zeros(n, dtype=np.uint64)
+    if n == 0:
+        return negatives
+
+    ring_dx = OFFSET_DX[:RING_START[1]]
+    ring_dy = OFFSET_DY[:RING_START[1]]
+    cand_x = xs[:, None] + ring_dx
+    cand_y = ys[:, None] + ring_dy
+    cand_z = np.repeat(zooms[:, None], len(ring_dx), axis=1)
+
+    free = np.zeros(cand_x.shape, dtype=bool)
+    for zoom in np.unique(zooms).tolist():
+        rows = zooms == zoom
+        free[rows] = ~index.occupied(zoom, cand_x[rows].ravel(), cand_y[rows].ravel()).reshape(-1, len(ring_dx))
+
+    cand_keys = mapswipe_tile_math.pack_tiles(cand_z, np.maximum(cand_x, 0), np.maximum(cand_y, 0)).tolist()
+    free = free.tolist()
+    picked = set()
+
+    for i in range(n):
+        candidates = [key for key, is_free in zip(cand_keys[i], free[i]) if is_free and key not in picked]
+        if len(candidates) == 1:
+            key = candidates[0]
+        elif len(candidates) > 1:
+            key = candidates[rng.randrange(len(candidates))]
+        else:
+            zoom, x, y = int(zooms[i]), int(xs[i]), int(ys[i])
+            found = index.nearest_free(zoom, x, y, rng)
+            if found is None:
+                if report:
+                    report_no_neighbor(zoom, x, y)
+                continue
+            key = mapswipe_tile_math.pack_tile(zoom, found[0], found[1])
+
+        zoom, x, y = mapswipe_tile_math.unpack_tile(key)
+        index.add(zoom, x, y)
+        picked.add(key)
+        negatives[i] = key
+
+    return negatives
+
+
+# Parallel sampling
+
+CELL_BITS = 8
+CELL_SIZE = 1 << CELL_BITS
+
+# roughly this many tasks per process, so that busy and quiet areas even out
+TASKS_PER_WORKER = 8
+
+# the index used by each worker process, set when the process starts
+_worker_index = None
+
+
+def cell_rng(seed, zoom, cell_x, cell_y):
+    return random.Random("{} {} {} {}".format(seed, zoom, cell_x, cell_y))
+
+
+def tile_rng(seed, key):
+    return random.Random("{} {}".format(seed, key))
+
+
+# Sample each cell on its own and return the negatives for each
+# Picks are removed from the index after each cell so that cells never see each other
+def sample_cells(index, seed, cells):
+    results = []
+    for cell, zooms, xs, ys in cells:
+        negatives = find_negatives(index, zooms, xs, ys, cell_rng(seed, *cell), report=False)
+        picked = negatives[negatives != 0]
+        for zoom, x, y in zip(*[a.tolist() for a in mapswipe_tile_math.unpack_tiles(picked)]):
+            index.discard(zoom, x, y)
+        results.append(negatives)
+    return results
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _sample_cells_worker(seed, cells):
+    return sample_cells(_worker_index, seed, cells)
+
+
+# Find a negative for each positive, on up to workers processes
+# Returns an array of packed keys in the order of the positives, with 0 where none was found
+# The result is the same for any number of workers
+#
+# emit, if given, is called with an array of the negatives of each cell as soon as they are
+# final. With several workers the cells are merged as the tasks complete, so the first
+# negatives are ready long before the last. mp_context is passed to the process pool
+def sample_negatives(index, zooms, xs, ys, seed, workers=1, emit=None, mp_context=None):
+    zooms = np.asarray(zooms, dtype=np.int64)
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    negatives = np.zeros(len(xs), dtype=np.uint64)
+    if len(xs) == 0:
+        return negatives
+
+    # group the positives by cell, keeping the order of the list within each cell
+    cell_x = xs >> CELL_BITS
+    cell_y = ys >> CELL_BITS
+    order = np.lexsort((cell_x, cell_y, zooms))
+    boundaries = np.flatnonzero((np.diff(zooms[order]) != 0) | (np.diff(cell_y[order]) != 0) |
+                                (np.diff(cell_x[order]) != 0)) + 1
+    members = np.split(order, boundaries)
+    cells = []
+    for rows in members:
+        i = rows[0]
+        cell = (int(zooms[i]), int(cell_x[i]), int(cell_y[i]))
+        cells.append((cell, zooms[rows], xs[rows], ys[rows]))
+
+    # merge the cells in order, picking again where a tile was taken by an earlier cell
+    def merge(cell_negatives):
+        taken = set()
+        for rows, picks in zip(members, cell_negatives):
+            for i, key in zip(rows.tolist(), picks.tolist()):
+                if key != 0 and key in taken:
+                    zoom, x, y = int(zooms[i]), int(xs[i]), int(ys[i])
+                    found = index.nearest_free(zoom, x, y, tile_rng(seed, mapswipe_tile_math.pack_tile(zoom, x, y)))
+                    key = 0 if found is None else mapswipe_tile_math.pack_tile(zoom, found[0], found[1])
+                if key == 0:
+                    report_no_neighbor(int(zooms[i]), int(xs[i]), int(ys[i]))
+                    continue
+                zoom, x, y = mapswipe_tile_math.unpack_tile(key)
+                index.add(zoom, x, y)
+                taken.add(key)
+                negatives[i] = key
+            if emit is not None:
+                cell_keys = negatives[rows]
+                emit(cell_keys[cell_keys != 0])
+
+    # sample the cells in tasks of consecutive cells of about the same number of positives
+    if workers > 1:
+        task_size = max(1, len(xs) // (workers * TASKS_PER_WORKER))
+        tasks = []
+        task = []
+        n = 0
+        for cell in cells:
+            task.append(cell)
+            n += len(cell[1])
+            if n >= task_size:
+                tasks.append(task)
+                task = []
+                n = 0
+        if task:
+            tasks.append(task)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,),
+                                 mp_context=mp_context) as pool:
+            # the workers have their own copies of the index, so the merge can run alongside them
+            results = pool.map(_sample_cells_worker, [seed] * len(tasks), tasks)
+            merge(negatives for result in results for negatives in result)
+    else:
+        # every cell must be sampled before the merge adds any negatives to the index
+        merge(sample_cells(index, seed, cells))
+
+    return negatives
@@ -0,0 +1,291 @@
+# mapswipe_utils/partition_tiles.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Given two directories of positive and negative image tiles
+# partition these for input to a Convolutional Nerual Network
+# with three directories - train, validation and test
+# User specifes the fraction of file for each of these
+
+# This assumes that the number of positives and negatives are the same
+
+# Output directory structure is
+# /train
+#    /positives
+#    /negatives
+# /validation
+#    /positives
+#    /negatives
+# /test
+#    /positives
+#    /negatives
+
+# The positives and negatives can be directories of tiles or .tiles archives
+# With --archive each output set is written as a .tiles archive instead of a directory
+# e.g. /train/positives.tiles
+
+# Between directories, --mode can place each tile as a hard link, symlink or reflink to the
+# input tile rather than a copy (see materialize.py) so rebuilding the splits takes
+# little time and no extra space. Tiles are placed on a pool of --workers threads
+#
+# With --split_by hash each tile goes to a split according to a hash of its tile ID, so adding
+# tiles to the inputs doesn't move the tiles that were already there. The assignment is saved
+# in partition_manifest.json in the output directory, along with a signature of each input
+# tile (see tile_store.py). With --incremental only the tiles that have been added, changed -
+# fetched again, say - or removed since the last run are placed or deleted.
+#
+# Any other run, or an incremental run whose inputs, --archive or --mode differ from the last
+# one, places every tile and removes the tiles left in the output by earlier runs
+
+import argparse
+import sys
+import os
+import json
+import shutil
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import materialize as mapswipe_materialize
+
+np = lazy_import('numpy')
+
+
+splits = ['train', 'validation', 'test']
+split_labels = {'train': 'training', 'validation': 'validation', 'test': 'test'}
+
+categories = ['positives', 'negatives']
+
+MANIFEST_FILENAME = 'partition_manifest.json'
+MANIFEST_VERSION = 2
+
+
+# Assign tile IDs to splits, returning a dict of split -> list of tile IDs
+#
+# order - the first train_frac of the tiles in listing order go to train and so on
+# hash  - each tile goes to a split according to a hash of its tile key, so a tile always
+#         goes to the same split however many other tiles there are
+def assign_splits(tile_ids, fractions, split_by):
+    assignment = {}
+    if split_by == 'order':
+        j = 0
+        for split in splits:
+            k = j + int(len(tile_ids) * fractions[split])
+            assignment[split] = tile_ids[j:k]
+            j = k
+        return assignment
+
+    tile_ids = sorted(tile_ids)
+    position = hash_fraction(mapswipe_tile_math.tile_ids_to_keys(tile_ids))
+    lower = 0.0
+    for split in splits:
+        upper = lower + fractions[split]
+        if split == splits[-1]:
+            upper = 1.0
+        selected = np.flatnonzero((position >= lower) & (position < upper))
+        assignment[split] = [tile_ids[i] for i in selected.tolist()]
+        lower = upper
+    return assignment
+
+
+# Map packed tile keys to evenly spread numbers in [0, 1) with the splitmix64 mixing function
+def hash_fraction(keys):
+    with np.errstate(over='ignore'):
+        z = np.asarray(keys, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def read_manifest(path):
+    try:
+        with open(path, 'rt') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(path, manifest):
+    with open(path + '.part', 'wt') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.part', path)
+
+
+# Remove what earlier runs left in the output - tiles that are not in the current assignment
+# and the output sets written in the other form, as archives rather than directories or the
+# other way around
+def remove_stale_output(output_dir, output_stores, assignment, archive):
+    n_removed = 0
+    for (split, category), output_store in output_stores.items():
+        current_ids = set(assignment[category][split])
+        for tile_id in output_store.tile_ids():
+            if tile_id not in current_ids:
+                output_store.delete(tile_id)
+                n_removed += 1
+
+        path = os.path.join(output_dir, split, category)
+        if archive and os.path.isdir(path):
+            shutil.rmtree(path)
+        elif not archive and os.path.isfile(path + mapswipe_tile_store.ARCHIVE_SUFFIX):
+            os.remove(path + mapswipe_tile_store.ARCHIVE_SUFFIX)
+    return n_removed
+
+
+# Partition the tiles in the positives and negatives tile stores into output_dir
+# fractions is a dict of split -> fraction of the tiles
+# tile_ids, if given, is a dict of category -> the tile IDs to partition, in place of
+# every tile in each input store
+def partition(positives, negatives, output_dir, fractions, archive=False, mode='copy', split_by='order',
+              incremental=False, workers=mapswipe_materialize.DEFAULT_WORKERS, tile_ids=None):
+    input_stores = {}
+    input_stores['positives'] = mapswipe_tile_store.open_tile_store(positives)
+    input_stores['negatives'] = mapswipe_tile_store.open_tile_store(negatives)
+
+    # Directories for our training, validation and test splits
+    # created if they don't exist
+
+    output_stores = {}
+    for split in splits:
+        split_dir = os.path.join(output_dir, split)
+        if not os.path.exists(split_dir):
+            os.makedirs(split_dir)
+        for category in categories:
+            path = os.path.join(split_dir, category)
+            if archive:
+                path += mapswipe_tile_store.ARCHIVE_SUFFIX
+            output_stores[(split, category)] = mapswipe_tile_store.open_tile_store(path, 'w')
+
+
+    # Assign each input tile to a split
+    assignment = {}
+    for category in categories:
+        if tile_ids is not None:
+            category_tile_ids = list(tile_ids[category])
+        else:
+            category_tile_ids = input_stores[category].tile_ids()
+        assignment[category] = assign_splits(category_tile_ids, fractions, split_by)
+
+    # the signature of each input tile tells a tile that was written again since the last run
+    signatures = {}
+    for category in categories:
+        input_store = input_stores[category]
+        signatures[category] = dict((tile_id, input_store.signature(tile_id))
+                                    for split in splits for tile_id in assignment[category][split])
+
+    # With --incremental only the changes since the last run are made
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    previous = read_manifest(manifest_path) if incremental else None
+    settings = {
+        'inputs': {'positives': os.path.abspath(positives), 'negatives': os.path.abspath(negatives)},
+        'archive': archive,
+        'mode': mode,
+    }
+    if previous is not None:
+        for name, value in settings.items():
+            if previous.get(name) != value:
+                sys.stderr.write("Warning: {} differs from the last run - placing all tiles\n".format(name))
+                previous = None
+                break
+
+    # otherwise every tile is placed and anything else in the output is removed
+    n_removed = 0
+    if previous is None:
+        n_removed = remove_stale_output(output_dir, output_stores, assignment, archive)
+
+    methods = {}
+    for category in categories:
+        input_store = input_stores[category]
+        previous_signatures = previous['signatures'].get(category, {}) if previous is not None else {}
+        for split in splits:
+            output_store = output_stores[(split, category)]
+            split_tile_ids = assignment[category][split]
+            if previous is not None:
+                previous_ids = set(previous['tiles'].get(category, {}).get(split, []))
+                current_ids = set(split_tile_ids)
+                for tile_id in previous_ids - current_ids:
+                    output_store.delete(tile_id)
+                    n_removed += 1
+                split_tile_ids = [tile_id for tile_id in split_tile_ids
+                                  if tile_id not in previous_ids or
+                                  previous_signatures.get(tile_id) != signatures[category][tile_id]]
+            counts = mapswipe_tile_store.copy_tiles(input_store, output_store, split_tile_ids,
+                                                    mode, workers)
+            for method, n in counts.items():
+                methods[method] = methods.get(method, 0) + n
+
+    if incremental or n_removed > 0:
+        print("{} tiles placed, {} removed".format(sum(methods.values()), n_removed))
+
+    manifest = dict(settings)
+    manifest.update({
+        'version': MANIFEST_VERSION,
+        'split_by': split_by,
+        'fractions': fractions,
+        'tiles': assignment,
+        'signatures': signatures,
+    })
+    write_manifest(manifest_path, manifest)
+
+    # let the user know if tiles could not be placed the way they asked
+    if mode != 'copy' and methods.get('copy', 0) > 0:
+        sys.stderr.write("Warning: {} tiles could not be placed with mode {} and were copied\n".format(methods['copy'], mode))
+
+
+    for split in splits:
+        for category in categories:
+            output_store = output_stores[(split, category)]
+            label = "{} {} images".format(split_labels[split], category[:-1])
+            print('total {}:'.format(label), len(output_store.tile_ids()))
+            output_store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--positives', '-p', metavar='<directory_of_positives>', required=True,
+                        help='Directory or .tiles archive of Positive images')
+    parser.add_argument('--negatives', '-n', metavar='<directory_of_negatives>', required=True,
+                        help='Directory or .tiles archive of Negative images')
+    parser.add_argument('--outdir', '-o', metavar='<output_directory>', required=True,
+                        help='Output Directory')
+    parser.add_argument('--train_frac', '-t', metavar='<fraction for training>', type=float,
+                        help='Fraction of images to use for training', default=0.6)
+    parser.add_argument('--validation_frac', '-v', metavar='<fraction for validation>', type=float,
+                        help='Fraction of images to use for validation', default=0.2)
+    parser.add_argument('--archive', action='store_true',
+                        help='Write each output set as a .tiles archive instead of a directory')
+    parser.add_argument('--mode', '-m', choices=mapswipe_materialize.MODES, default='copy',
+                        help='How to place each tile in the output directories (default copy)')
+    parser.add_argument('--split_by', '-s', choices=['order', 'hash'], default='order',
+                        help='Split the tiles in the order they are listed (default) or by a hash of the tile ID')
+    parser.add_argument('--incremental', '-i', action='store_true',
+                        help='Only place new tiles and remove old ones, using the manifest of the last run')
+    parser.add_argument('--workers', '-w', metavar='<number of threads>', type=int,
+                        default=mapswipe_materialize.DEFAULT_WORKERS,
+                        help='Number of threads placing tiles (default {})'.format(mapswipe_materialize.DEFAULT_WORKERS))
+
+
+    args = parser.parse_args(argv)
+
+    frac_train      = float(args.train_frac)
+    frac_validation = float(args.validation_frac)
+    if frac_train + frac_validation > 1.0:
+        sys.stderr.write("ERROR: fraction arguments must be <= 1.0\n")
+        sys.exit(1)
+    frac_test = 1.0 - (frac_train + frac_validation)
+
+    fractions = {'train': frac_train, 'validation': frac_validation, 'test': frac_test}
+
+    partition(args.positives, args.negatives, args.outdir, fractions, args.archive, args.mode,
+              args.split_by, args.incremental, args.workers)
+
+
+if __name__ == '__main__':
+    main()
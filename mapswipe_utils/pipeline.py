@@ -0,0 +1,577 @@
+# mapswipe_utils/pipeline.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Run the whole workflow for a project in one process, from a JSON config file
+#
+#   fetch_project_json -> filter_tile_list -> find_negative_neighbors -> fetch_tiles -> partition_tiles
+#
+# e.g.
+#
+# {
+#     "project":   4877,
+#     "outdir":    "projects",
+#     "filter":    {"query": "yes_count >= 2 and bad_imagery_count == 0"},
+#     "negatives": {"seed": 42, "workers": 4},
+#     "fetch":     {"keyfile": "maps_api_key", "workers": 8},
+#     "partition": {"split_by": "hash", "mode": "link"}
+# }
+#
+# The project is loaded once and the tile sets are passed between the stages as arrays of packed
+# tile keys (see tile_math.py) rather than through text files. The files the separate scripts
+# would write are still written, in the usual project directory (see the README):
+#
+#   <outdir>/<project_id>/
+#      project.json  all_<category>_tiles.lst  README
+#      selected_positive_tiles.lst  selected_negative_tiles.lst
+#      positive_tiles  negative_tiles           directories or .tiles archives
+#      partitioned                              train, validation and test
+#      pipeline_state.json
+#
+# With "sync": true the project is fetched with fetch_project_json.sync_project on every run,
+# which costs one conditional request when it hasn't changed, so a nightly run of the pipeline
+# picks up changes to the project and otherwise does nothing.
+#
+# Instead of "project" a local "jsonfile" can be given, in which case "outdir" is the project
+# directory. Paths in the config are relative to the directory of the config file, except the
+# partition outdir which is relative to the project directory.
+# Leave out a section to leave out that stage - partition needs fetch and negatives.
+#
+# pipeline_state.json records a hash of the inputs and settings of each stage and a hash of
+# what it produced. A stage whose inputs haven't changed and whose output is still there is
+# skipped, so running the pipeline again only does the work that a changed config or project
+# calls for. --force runs every stage.
+#
+# Fetching starts as soon as the positives are known and goes on while the negatives are found.
+# The negatives are fed to a second fetcher as they are picked. Both fetchers share one rate
+# limiter so together they stay within the request quota, which like the separate fetch scripts
+# counts the requests made with the same key in the last 24 hours (see fetch_quota.py).
+
+import argparse
+import sys
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+import multiprocessing
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import tile_query as mapswipe_tile_query
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import project_cache as mapswipe_project_cache
+from mapswipe_utils import fetch_engine as mapswipe_fetch_engine
+from mapswipe_utils import fetch_metrics as mapswipe_fetch_metrics
+from mapswipe_utils import tile_dedup as mapswipe_tile_dedup
+from mapswipe_utils import materialize as mapswipe_materialize
+from mapswipe_utils import fetch_project_json as mapswipe_fetch_project_json
+from mapswipe_utils import find_negative_neighbors as mapswipe_find_negative_neighbors
+from mapswipe_utils import partition_tiles as mapswipe_partition_tiles
+
+np = lazy_import('numpy')
+
+
+PIPELINE_VERSION = 1
+STATE_FILENAME = 'pipeline_state.json'
+
+# top level settings and their defaults
+SETTINGS = {
+    'project':     None,
+    'project_url': None,
+    'jsonfile':    None,
+    'outdir':      '.',
+    'stream':      False,
+    'sync':        False,
+}
+
+# the settings in each section and their defaults
+SECTIONS = {
+    'filter': {
+        'query': None,
+    },
+    'negatives': {
+        'seed':    1,
+        'workers': 1,
+    },
+    'fetch': {
+        'tile_url':             mapswipe_fetch_engine.BING_MAPS_TILE_URL,
+        'keyfile':              None,
+        'archive':              False,
+        'workers':              mapswipe_fetch_engine.DEFAULT_WORKERS,
+        'rate':                 mapswipe_fetch_engine.DEFAULT_REQUESTS_PER_SECOND,
+        'daily_limit':          mapswipe_fetch_engine.BING_MAPS_DAILY_LIMIT,
+        'quota_file':           None,
+        'connections_per_host': mapswipe_fetch_engine.DEFAULT_CONNECTIONS_PER_HOST,
+        'report_interval':      mapswipe_fetch_metrics.DEFAULT_REPORT_INTERVAL,
+        'dedup':                False,
+        'placeholders':         'keep',
+        'placeholder_hashes':   None,
+    },
+    'partition': {
+        'outdir':          'partitioned',
+        'train_frac':      0.6,
+        'validation_frac': 0.2,
+        'archive':         False,
+        'mode':            'copy',
+        'split_by':        'order',
+        'workers':         mapswipe_materialize.DEFAULT_WORKERS,
+    },
+}
+
+# settings that change how a stage runs but not what it produces - these are left out of
+# the hash of its inputs, so changing them doesn't make the stage run again
+UNHASHED_SETTINGS = {
+    'negatives': ['workers'],
+    'fetch':     ['keyfile', 'workers', 'rate', 'daily_limit', 'quota_file', 'connections_per_host', 'report_interval', 'dedup'],
+    'partition': ['workers'],
+}
+
+
+def config_error(message):
+    sys.stderr.write("ERROR: {}\n".format(message))
+    sys.exit(1)
+
+
+# Read and check a config file, filling in the defaults
+# Returns a dict of the top level settings with a dict of settings for each section given
+def read_config(path):
+    try:
+        with open(path, 'rt') as f:
+            config = json.load(f)
+    except OSError as e:
+        config_error("could not read config file {}: {}".format(path, e))
+    except ValueError as e:
+        config_error("invalid config file {}: {}".format(path, e))
+    if not isinstance(config, dict):
+        config_error("the config file must hold a JSON object")
+
+    for name in config:
+        if name not in SETTINGS and name not in SECTIONS:
+            config_error("unknown setting in config file: {}".format(name))
+
+    settings = dict(SETTINGS)
+    for name in SETTINGS:
+        if name in config:
+            settings[name] = config[name]
+    for section, defaults in SECTIONS.items():
+        if section not in config:
+            continue
+        if not isinstance(config[section], dict):
+            config_error("{} must be a JSON object".format(section))
+        for name in config[section]:
+            if name not in defaults:
+                config_error("unknown setting in {}: {}".format(section, name))
+        settings[section] = dict(defaults)
+        settings[section].update(config[section])
+
+    if (settings['project'] is None) == (settings['jsonfile'] is None):
+        config_error("give either a project or a jsonfile")
+    if settings['stream'] and settings['sync']:
+        config_error("give either stream or sync, not both")
+    if 'partition' in settings and ('fetch' not in settings or 'negatives' not in settings):
+        config_error("partition needs the fetch and negatives stages")
+    if 'filter' in settings and settings['filter']['query'] is not None:
+        try:
+            mapswipe_tile_query.compile_query(settings['filter']['query'])
+        except mapswipe_tile_query.QueryError as e:
+            config_error("invalid query: {}".format(e))
+    if 'fetch' in settings:
+        try:
+            mapswipe_fetch_engine.check_tile_url(settings['fetch']['tile_url'])
+        except ValueError as e:
+            config_error(str(e))
+        if settings['fetch']['placeholders'] not in mapswipe_tile_dedup.PLACEHOLDER_MODES:
+            config_error("invalid fetch placeholders: {}".format(settings['fetch']['placeholders']))
+    if 'partition' in settings:
+        partition = settings['partition']
+        if partition['train_frac'] + partition['validation_frac'] > 1.0:
+            config_error("fraction settings must add up to <= 1.0")
+        if partition['mode'] not in mapswipe_materialize.MODES:
+            config_error("invalid partition mode: {}".format(partition['mode']))
+        if partition['split_by'] not in ['order', 'hash']:
+            config_error("invalid partition split_by: {}".format(partition['split_by']))
+
+    # paths are relative to the config file
+    base_dir = os.path.dirname(os.path.abspath(path))
+    settings['outdir'] = os.path.join(base_dir, settings['outdir'])
+    if settings['jsonfile'] is not None:
+        settings['jsonfile'] = os.path.join(base_dir, settings['jsonfile'])
+    if 'fetch' in settings and settings['fetch']['keyfile'] is not None:
+        settings['fetch']['keyfile'] = os.path.join(base_dir, settings['fetch']['keyfile'])
+    if 'fetch' in settings and settings['fetch']['quota_file'] is not None:
+        settings['fetch']['quota_file'] = os.path.join(base_dir, settings['fetch']['quota_file'])
+    if 'fetch' in settings and settings['fetch']['placeholder_hashes'] is not None:
+        settings['fetch']['placeholder_hashes'] = os.path.join(base_dir, settings['fetch']['placeholder_hashes'])
+    return settings
+
+
+def keys_hash(keys):
+    return hashlib.sha1(np.ascontiguousarray(keys, dtype='<u8').tobytes()).hexdigest()
+
+
+def read_tile_list(path):
+    with open(path, 'rt') as f:
+        tile_ids = [x for x in f.read().splitlines() if x]
+    return mapswipe_tile_math.tile_ids_to_keys(tile_ids)
+
+
+def write_tile_list(path, keys):
+    tile_ids = mapswipe_tile_math.keys_to_tile_ids(keys)
+    with open(path + '.part', 'wt') as f:
+        if tile_ids:
+            f.write('\n'.join(tile_ids) + '\n')
+    os.replace(path + '.part', path)
+
+
+# The hashes of the inputs and output of each stage from the last run, in pipeline_state.json
+class PipelineState:
+    def __init__(self, path, force=False):
+        self.path = path
+        self.stages = {}
+        if not force:
+            try:
+                with open(path, 'rt') as f:
+                    state = json.load(f)
+                if state.get('version') == PIPELINE_VERSION:
+                    self.stages = state['stages']
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def input_hash(self, stage, settings, inputs):
+        text = json.dumps({'stage': stage, 'settings': settings, 'inputs': inputs}, sort_keys=True)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def output_hash(self, stage, input_hash):
+        record = self.stages.get(stage)
+        if record is None or record['input'] != input_hash:
+            return None
+        return record['output']
+
+    def record(self, stage, input_hash, output_hash):
+        self.stages[stage] = {'input': input_hash, 'output': output_hash}
+        with open(self.path + '.part', 'wt') as f:
+            json.dump({'version': PIPELINE_VERSION, 'stages': self.stages}, f, indent=2, sort_keys=True)
+        os.replace(self.path + '.part', self.path)
+
+
+# An iterable of tile IDs that are added while it is being read - reading blocks until
+# there are more tile IDs or the feed is closed
+class TileFeed:
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def put(self, tile_ids):
+        for tile_id in tile_ids:
+            self.queue.put(tile_id)
+
+    def close(self):
+        self.queue.put(None)
+
+    def __iter__(self):
+        while True:
+            tile_id = self.queue.get()
+            if tile_id is None:
+                return
+            yield tile_id
+
+
+# A TileFetcher running on its own thread
+class FetchJob:
+    def __init__(self, stage, fetcher, tile_ids, input_hash=None):
+        self.stage = stage
+        self.fetcher = fetcher
+        self.tile_ids = tile_ids
+        self.input_hash = input_hash
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.fetcher.fetch(self.tile_ids)
+        except BaseException as e:
+            self.error = e
+
+    def join(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class Pipeline:
+    def __init__(self, settings, force=False):
+        self.settings = settings
+        if settings['project'] is not None:
+            self.project_dir = os.path.join(settings['outdir'], str(settings['project']))
+        else:
+            self.project_dir = settings['outdir']
+        if not os.path.isdir(self.project_dir):
+            os.makedirs(self.project_dir)
+        self.state = PipelineState(os.path.join(self.project_dir, STATE_FILENAME), force)
+
+        self.limiter = None
+        self.tile_url = None
+        self.placeholder_hashes = None
+        if 'fetch' in settings:
+            fetch = settings['fetch']
+            # both fetchers share the rate limiter, so together they stay within the quota
+            quota_file = fetch['quota_file'] or mapswipe_fetch_engine.default_quota_file(fetch['tile_url'], fetch['keyfile'])
+            self.limiter = mapswipe_fetch_engine.RateLimiter(fetch['rate'], fetch['daily_limit'], quota_file)
+            self.tile_url = mapswipe_fetch_engine.tile_url_function(fetch['tile_url'], fetch['keyfile'])
+            if fetch['placeholder_hashes'] is not None:
+                self.placeholder_hashes = mapswipe_fetch_engine.read_placeholder_hashes(fetch['placeholder_hashes'])
+
+    def path(self, name):
+        return os.path.join(self.project_dir, name)
+
+    def report(self, stage, message, start=None):
+        if start is not None:
+            message += " ({:.1f} s)".format(time.monotonic() - start)
+        print("{:16s} {}".format(stage, message))
+        sys.stdout.flush()
+
+    def hashed_settings(self, section):
+        unhashed = UNHASHED_SETTINGS.get(section, [])
+        return dict((name, value) for name, value in self.settings[section].items() if name not in unhashed)
+
+    # The keys a stage wrote to a tile list file on an earlier run, if they are still up to date
+    def cached_keys(self, stage, input_hash, path):
+        output_hash = self.state.output_hash(stage, input_hash)
+        if output_hash is None or not os.path.exists(path):
+            return None
+        keys = read_tile_list(path)
+        if keys_hash(keys) != output_hash:
+            return None
+        return keys
+
+    def run(self):
+        start = time.monotonic()
+        project, project_hash = self.load_project()
+        positives, positives_hash = self.select_positives(project, project_hash)
+
+        # the positives are fetched while the negatives are found
+        jobs = []
+        if 'fetch' in self.settings:
+            jobs.append(self.start_fetch('fetch_positives', 'positive_tiles', positives, positives_hash))
+
+        negatives = None
+        negatives_hash = None
+        if 'negatives' in self.settings:
+            negatives, negatives_hash, job = self.find_negatives(project, project_hash, positives, positives_hash)
+            jobs.append(job)
+
+        n_failed = 0
+        for job in jobs:
+            if job is None:
+                continue
+            job.join()
+            self.report(job.stage, job.fetcher.summary().replace('\n', '\n' + ' ' * 17))
+            if job.fetcher.n_failed > 0:
+                n_failed += job.fetcher.n_failed
+            else:
+                self.state.record(job.stage, job.input_hash, job.input_hash)
+        if n_failed > 0:
+            sys.stderr.write("ERROR: {} tiles could not be fetched - run the pipeline again to retry them\n".format(n_failed))
+            sys.exit(1)
+
+        if 'partition' in self.settings:
+            self.partition(positives_hash, negatives_hash, positives, negatives)
+
+        self.report('pipeline', 'done', start)
+
+    def load_project(self):
+        start = time.monotonic()
+        if self.settings['jsonfile'] is not None:
+            json_path = self.settings['jsonfile']
+            input_hash = self.state.input_hash('project', {'jsonfile': json_path}, [])
+        else:
+            json_path = self.path('project.json')
+            project_id = str(self.settings['project'])
+            url_string = self.settings['project_url'] or mapswipe_fetch_project_json.project_url(project_id)
+            input_hash = self.state.input_hash('project', {'url': url_string}, [])
+
+            categories = mapswipe_fetch_project_json.CATEGORIES
+            output_hash = self.state.output_hash('project', input_hash)
+            if self.settings['sync']:
+                # a conditional request - the later stages run again only if the project changed
+                message = mapswipe_fetch_project_json.sync_project(url_string, json_path, self.project_dir, categories)
+                mapswipe_fetch_project_json.write_readme(self.project_dir, project_id, url_string)
+                self.report('project', "sync {} - {}".format(url_string, message), start)
+            elif output_hash is None or not os.path.exists(json_path) or \
+               mapswipe_project_cache.project_hash(json_path) != output_hash:
+                if self.settings['stream']:
+                    mapswipe_fetch_project_json.fetch_project_streaming(url_string, json_path, self.project_dir, categories)
+                else:
+                    mapswipe_fetch_project_json.fetch_project(url_string, json_path, self.project_dir, categories)
+                mapswipe_fetch_project_json.write_readme(self.project_dir, project_id, url_string)
+                self.report('project', "downloaded {}".format(url_string), start)
+
+        project = mapswipe_project_cache.load_project(json_path)
+        project_hash = mapswipe_project_cache.project_hash(json_path)
+        self.state.record('project', input_hash, project_hash)
+        self.report('project', "{} tiles".format(len(project)), start)
+        return project, project_hash
+
+    def select_positives(self, project, project_hash):
+        start = time.monotonic()
+        settings = self.settings.get('filter', SECTIONS['filter'])
+        input_hash = self.state.input_hash('filter', settings, [project_hash])
+        path = self.path('selected_positive_tiles.lst')
+
+        keys = self.cached_keys('filter', input_hash, path)
+        if keys is not None:
+            self.report('filter', "up to date - {} positive tiles".format(len(keys)))
+            return keys, keys_hash(keys)
+
+        # positives as in fetch_project_json.decision_category
+        mask = project['decision'] <= 1.0
+        if settings['query'] is not None:
+            mask &= mapswipe_tile_query.compile_query(settings['query']).mask(project)
+        keys = np.asarray(project['key'][mask])
+
+        write_tile_list(path, keys)
+        output_hash = keys_hash(keys)
+        self.state.record('filter', input_hash, output_hash)
+        self.report('filter', "{} positive tiles".format(len(keys)), start)
+        return keys, output_hash
+
+    # Find the negatives, feeding them to a fetcher as they are picked
+    # Returns the keys, their hash and the fetch job, if there is one
+    def find_negatives(self, project, project_hash, positives, positives_hash):
+        start = time.monotonic()
+        settings = self.settings['negatives']
+        input_hash = self.state.input_hash('negatives', self.hashed_settings('negatives'),
+                                           [project_hash, positives_hash])
+        path = self.path('selected_negative_tiles.lst')
+
+        keys = self.cached_keys('negatives', input_hash, path)
+        if keys is not None:
+            self.report('negatives', "up to date - {} negative tiles".format(len(keys)))
+            output_hash = keys_hash(keys)
+            job = None
+            if 'fetch' in self.settings:
+                job = self.start_fetch('fetch_negatives', 'negative_tiles', keys, output_hash)
+            return keys, output_hash, job
+
+        job = None
+        emit = None
+        if 'fetch' in self.settings:
+            feed = TileFeed()
+            job = FetchJob('fetch_negatives', self.fetcher('negative_tiles'), feed)
+            self.report('fetch_negatives', "started")
+
+            def emit(cell_keys):
+                feed.put(mapswipe_tile_math.keys_to_tile_ids(cell_keys))
+
+        # the worker processes are started from a fresh server process rather than forked
+        # from this one, which has fetcher threads running
+        mp_context = multiprocessing.get_context('forkserver') if settings['workers'] > 1 else None
+        zooms, xs, ys = mapswipe_tile_math.unpack_tiles(positives)
+        try:
+            keys = mapswipe_find_negative_neighbors.find_negative_keys(project, zooms, xs, ys, settings['seed'],
+                                                                       max(1, settings['workers']), emit, mp_context)
+        finally:
+            if job is not None:
+                feed.close()
+
+        write_tile_list(path, keys)
+        output_hash = keys_hash(keys)
+        self.state.record('negatives', input_hash, output_hash)
+        self.report('negatives', "{} negative tiles".format(len(keys)), start)
+
+        if job is not None:
+            job.input_hash = self.fetch_input_hash('fetch_negatives', output_hash)
+        return keys, output_hash, job
+
+    def fetch_output(self, name):
+        if self.settings['fetch']['archive']:
+            name += mapswipe_tile_store.ARCHIVE_SUFFIX
+        return self.path(name)
+
+    def fetch_input_hash(self, stage, tiles_hash):
+        return self.state.input_hash(stage, self.hashed_settings('fetch'), [tiles_hash])
+
+    def fetcher(self, name):
+        fetch = self.settings['fetch']
+        return mapswipe_fetch_engine.TileFetcher(self.fetch_output(name), self.tile_url, self.limiter,
+                                                 workers=fetch['workers'],
+                                                 connections_per_host=fetch['connections_per_host'],
+                                                 report_interval=fetch['report_interval'],
+                                                 dedup=fetch['dedup'], placeholders=fetch['placeholders'],
+                                                 placeholder_hashes=self.placeholder_hashes)
+
+    # Start fetching a set of tiles, unless they were all fetched on an earlier run
+    def start_fetch(self, stage, name, keys, tiles_hash):
+        input_hash = self.fetch_input_hash(stage, tiles_hash)
+        if self.state.output_hash(stage, input_hash) == input_hash and os.path.exists(self.fetch_output(name)):
+            self.report(stage, "up to date")
+            return None
+        self.report(stage, "started - {} tiles".format(len(keys)))
+        return FetchJob(stage, self.fetcher(name), mapswipe_tile_math.keys_to_tile_ids(keys), input_hash)
+
+    # The keys in keys that are in the fetched tiles
+    def fetched_keys(self, name, keys):
+        with mapswipe_tile_store.open_tile_store(self.fetch_output(name)) as store:
+            return keys[np.isin(keys, store.keys())]
+
+    def partition(self, positives_hash, negatives_hash, positives, negatives):
+        start = time.monotonic()
+        settings = self.settings['partition']
+        input_hash = self.state.input_hash('partition', self.hashed_settings('partition'),
+                                           [positives_hash, negatives_hash, self.settings['fetch']['archive'],
+                                            self.settings['fetch']['placeholders']])
+        output_dir = self.path(settings['outdir'])
+        manifest_path = os.path.join(output_dir, mapswipe_partition_tiles.MANIFEST_FILENAME)
+        if self.state.output_hash('partition', input_hash) == input_hash and os.path.exists(manifest_path):
+            self.report('partition', "up to date")
+            return
+
+        fractions = {
+            'train':      settings['train_frac'],
+            'validation': settings['validation_frac'],
+            'test':       1.0 - (settings['train_frac'] + settings['validation_frac']),
+        }
+        # placeholder tiles that were skipped when fetching are left out
+        if self.settings['fetch']['placeholders'] != 'keep':
+            positives = self.fetched_keys('positive_tiles', positives)
+            negatives = self.fetched_keys('negative_tiles', negatives)
+        tile_ids = {
+            'positives': mapswipe_tile_math.keys_to_tile_ids(positives),
+            'negatives': mapswipe_tile_math.keys_to_tile_ids(negatives),
+        }
+        # always incremental, so tiles dropped from the sets since the last run are removed
+        mapswipe_partition_tiles.partition(self.fetch_output('positive_tiles'), self.fetch_output('negative_tiles'),
+                                           output_dir, fractions, settings['archive'], settings['mode'],
+                                           settings['split_by'], True, settings['workers'], tile_ids)
+        self.state.record('partition', input_hash, input_hash)
+        self.report('partition', output_dir, start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the MapSwipe workflow for a project from a config file")
+    parser.add_argument('--config', '-c', metavar='<config_file>', required=True,
+                        help='JSON pipeline config file')
+    parser.add_argument('--force', '-f', action='store_true',
+                        help='Run every stage, even those that are up to date')
+
+    args = parser.parse_args(argv)
+
+    settings = read_config(args.config)
+    # the key file and placeholder hashes are read when the pipeline is set up
+    try:
+        pipeline = Pipeline(settings, args.force)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+    pipeline.run()
+
+
+# worker processes may import this module, which must not run main() again
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+# mapswipe_utils/project_cache.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Columnar binary cache of a MapSwipe project JSON file
+
+# Parsing a large project.json takes a while and the analysis tools are run many times
+# on the same project, so the numeric attributes of every tile are cached as NumPy arrays,
+# one .npy file per column, in a directory next to the JSON file:
+#
+#   project.json.cache/
+#      meta.json            size, mtime and SHA1 hash of the JSON file the cache was built from
+#      key.npy              packed tile keys (see tile_math.py)
+#      task_x.npy  task_y.npy  task_z.npy
+#      yes_count.npy  maybe_count.npy  bad_imagery_count.npy
+#      decision.npy
+#
+# Rows are in the same order as the records in the JSON file.
+#
+# The cache is built the first time it is needed and rebuilt when the JSON file changes.
+# A change of size or mtime triggers a check of the hash so a file that was rewritten with
+# the same content does not need a rebuild. The columns are memory mapped when loaded, so
+# loading is near instant and only the columns a tool uses are read from disk.
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import project_json as mapswipe_project_json
+
+np = lazy_import('numpy')
+
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.cache'
+
+# column name and dtype - the names match the JSON attributes
+COLUMNS = [
+    ('key',               'uint64'),
+    ('task_x',            'int64'),
+    ('task_y',            'int64'),
+    ('task_z',            'int64'),
+    ('yes_count',         'int64'),
+    ('maybe_count',       'int64'),
+    ('bad_imagery_count', 'int64'),
+    ('decision',          'float64'),
+]
+
+# tile ids are converted to keys in batches of this size while building
+BUILD_BATCH_SIZE = 100000
+
+
+class ProjectTable:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['key'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def tile_ids(self):
+        return mapswipe_tile_math.keys_to_tile_ids(self.columns['key'])
+
+    # Yield one dict per tile, like the records in the JSON file
+    def records(self):
+        names = [name for name, dtype in COLUMNS if name != 'key']
+        values = [self.columns[name].tolist() for name in names]
+        for tile_id, row in zip(self.tile_ids(), zip(*values)):
+            record = dict(zip(names, row))
+            record['id'] = tile_id
+            yield record
+
+
+def cache_path(json_path):
+    return json_path + CACHE_SUFFIX
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# The SHA1 hash of a project JSON file, taken from the cache when that is up to date
+def project_hash(json_path):
+    cache_dir = cache_path(json_path)
+    if cache_is_valid(json_path, cache_dir, os.stat(json_path)):
+        try:
+            with open(os.path.join(cache_dir, 'meta.json'), 'rt') as f:
+                return json.load(f)['sha1']
+        except (OSError, ValueError, KeyError):
+            pass
+    return file_hash(json_path)
+
+
+# Load the columns for a project JSON file, building or rebuilding the cache if needed
+def load_project(json_path, rebuild=False):
+    cache_dir = cache_path(json_path)
+    stat = os.stat(json_path)
+
+    if not rebuild and cache_is_valid(json_path, cache_dir, stat):
+        return read_cache(cache_dir)
+
+    return cache_columns(json_path, build_columns(json_path))
+
+
+# Write the cache for the columns of a project JSON file, already parsed with build_columns
+def cache_columns(json_path, columns):
+    cache_dir = cache_path(json_path)
+    stat = os.stat(json_path)
+    try:
+        write_cache(cache_dir, columns, {
+            'version': CACHE_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha1': file_hash(json_path),
+        })
+    except OSError as e:
+        # not being able to write the cache is not fatal
+        sys.stderr.write("Warning: could not write project cache {}: {}\n".format(cache_dir, e))
+        return ProjectTable(columns)
+    return read_cache(cache_dir)
+
+
+def cache_is_valid(json_path, cache_dir, stat):
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    try:
+        with open(meta_path, 'rt') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if meta.get('version') != CACHE_VERSION:
+        return False
+    if meta.get('size') == stat.st_size and meta.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    if meta.get('size') != stat.st_size or meta.get('sha1') != file_hash(json_path):
+        return False
+
+    # same content with a new mtime - remember the new mtime so the hash isn't checked again
+    meta['mtime_ns'] = stat.st_mtime_ns
+    try:
+        with open(meta_path + '.part', 'wt') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.part', meta_path)
+    except OSError:
+        pass
+    return True
+
+
+def read_cache(cache_dir):
+    columns = {}
+    for name, dtype in COLUMNS:
+        columns[name] = np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r')
+    return ProjectTable(columns)
+
+
+# Write into a temporary directory and rename it into place so readers never see a partial cache
+# The old cache is renamed aside before the new one takes its place and only then removed, so
+# a reader sees the old cache, the new one or none at all, which it rebuilds
+def write_cache(cache_dir, columns, meta):
+    tmp_dir = "{}.tmp{}".format(cache_dir, os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    for name, dtype in COLUMNS:
+        np.save(os.path.join(tmp_dir, name + '.npy'), columns[name])
+    with open(os.path.join(tmp_dir, 'meta.json'), 'wt') as f:
+        json.dump(meta, f)
+
+    old_dir = "{}.old{}".format(cache_dir, os.getpid())
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    if os.path.exists(cache_dir):
+        os.rename(cache_dir, old_dir)
+    os.rename(tmp_dir, cache_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+
+# Parse the project JSON file one record at a time into column arrays
+def build_columns(json_path):
+    names = [name for name, dtype in COLUMNS if name != 'key']
+    values = {}
+    for name in names:
+        values[name] = []
+    keys = []
+    tile_ids = []
+
+    with open(json_path, 'rb') as f:
+        for tile in mapswipe_project_json.iter_tile_records(f):
+            tile_ids.append(tile['id'])
+            for name in names:
+                values[name].append(tile[name])
+            if len(tile_ids) >= BUILD_BATCH_SIZE:
+                keys.append(mapswipe_tile_math.tile_ids_to_keys(tile_ids))
+                tile_ids = []
+    keys.append(mapswipe_tile_math.tile_ids_to_keys(tile_ids))
+
+    columns = {'key': np.concatenate(keys).astype(np.uint64)}
+    for name, dtype in COLUMNS:
+        if name != 'key':
+            # task_x, task_y and task_z are strings in the JSON
+            columns[name] = np.array(values[name], dtype=np.float64).astype(dtype)
+    return columns
@@ -0,0 +1,133 @@
+# mapswipe_utils/project_json.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Bounded memory helpers for large MapSwipe project JSON files
+
+# A project JSON file is one large array of flat tile records. Rather than reading
+# the whole thing into a string and calling json.loads, iter_tile_records parses
+# the records one at a time as the bytes arrive, from a file or straight from the
+# HTTP response, optionally copying the raw bytes to another file as it goes.
+#
+# ExternalSorter sorts any number of lines in bounded memory by writing sorted runs
+# to temporary files and merging them at the end.
+
+import json
+import codecs
+import heapq
+import tempfile
+
+
+CHUNK_SIZE = 1 << 16
+
+# lines held in memory by an ExternalSorter before a run is written to disk
+SORT_RUN_SIZE = 200000
+
+_WHITESPACE = ' \t\n\r'
+
+
+# Yield each record of a JSON array read from a binary stream
+# If tee is a binary file, every byte read is also written to it
+def iter_tile_records(stream, tee=None, chunk_size=CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # skip whitespace and the separators between records
+        while pos < len(buf) and (buf[pos] in _WHITESPACE or (started and buf[pos] == ',')):
+            pos += 1
+
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError("project JSON must be an array of tile records")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                # drain the rest of the stream so the tee gets all of it
+                while not eof:
+                    eof = _read_chunk(stream, tee, chunk_size) is None
+                return
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # the record is incomplete - read more unless there is no more
+                if eof:
+                    raise
+            else:
+                pos = end
+                yield record
+                continue
+        elif eof:
+            raise ValueError("unexpected end of project JSON")
+
+        # keep only the unparsed part of the buffer and read the next chunk
+        buf = buf[pos:]
+        pos = 0
+        chunk = _read_chunk(stream, tee, chunk_size)
+        if chunk is None:
+            eof = True
+            buf += text_decoder.decode(b'', final=True)
+        else:
+            buf += text_decoder.decode(chunk)
+
+
+def _read_chunk(stream, tee, chunk_size):
+    chunk = stream.read(chunk_size)
+    if not chunk:
+        return None
+    if tee is not None:
+        tee.write(chunk)
+    return chunk
+
+
+# Sort lines in bounded memory
+# add() lines in any order, then write() them in sorted order to a file
+
+class ExternalSorter:
+    def __init__(self, run_size=SORT_RUN_SIZE, tmp_dir=None):
+        self.run_size = run_size
+        self.tmp_dir = tmp_dir
+        self.lines = []
+        self.runs = []
+
+    def add(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.run_size:
+            self.write_run()
+
+    def write_run(self):
+        self.lines.sort()
+        f = tempfile.TemporaryFile('w+t', dir=self.tmp_dir)
+        for line in self.lines:
+            f.write(line + '\n')
+        f.seek(0)
+        self.runs.append(f)
+        self.lines = []
+
+    # merge the sorted runs with whatever is still in memory
+    def __iter__(self):
+        self.lines.sort()
+        runs = [(line.rstrip('\n') for line in f) for f in self.runs]
+        return heapq.merge(self.lines, *runs)
+
+    def write(self, path):
+        with open(path, 'wt') as f:
+            for line in self:
+                f.write(line + '\n')
+        self.close()
+
+    def close(self):
+        for f in self.runs:
+            f.close()
+        self.runs = []
+        self.lines = []
@@ -0,0 +1,244 @@
+# mapswipe_utils/project_sync.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Keep a local copy of a project JSON file up to date, used by mapswipe_fetch_project_json.py --sync
+
+# Each sync sends a conditional request, with the ETag and Last-Modified of the last download,
+# so a project that hasn't changed costs one small request and a 304 response. A server that
+# ignores these sends the whole file again, but if its content is the same as the last
+# version nothing else is done.
+#
+# Each new version of the project is kept as a snapshot of its columns (see project_cache.py)
+# and the changes from the version before are written as a diff, in a sync directory next to
+# the JSON file:
+#
+#   sync/
+#      sync.json                   URL, ETag, Last-Modified and a list of the versions
+#      v0001.npz  v0002.npz ...    compressed snapshot of the columns of each version
+#      diff_v0001_v0002.json       changes from one version to the next
+#
+# A diff lists the tile IDs that were added and removed, and for each tile whose counts or
+# decision changed the old and new values of what changed:
+#
+#   {"from_version": 1, "to_version": 2, "added": ["18-1-2"], "removed": [],
+#    "changed": {"18-3-4": {"yes_count": [2, 3], "decision": [1.5, 1.0]}}}
+
+import os
+import sys
+import json
+import time
+import hashlib
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import http_pool as mapswipe_http_pool
+from mapswipe_utils import project_cache as mapswipe_project_cache
+
+np = lazy_import('numpy')
+
+
+SYNC_DIRNAME = 'sync'
+STATE_FILENAME = 'sync.json'
+STATE_VERSION = 1
+
+# the columns compared between versions
+DIFF_COLUMNS = ['yes_count', 'maybe_count', 'bad_imagery_count', 'decision']
+
+CHUNK_SIZE = 1 << 16
+
+
+def snapshot_name(version):
+    return "v{:04d}.npz".format(version)
+
+
+def diff_name(from_version, to_version):
+    return "diff_v{:04d}_v{:04d}.json".format(from_version, to_version)
+
+
+# GET url into out_path, unless it hasn't changed since the response with these validators
+# client is an http_pool.ConnectionPool to share, or None for a connection of its own
+# Returns None for 304 Not Modified, otherwise the response headers and the SHA1 hash of the body
+def conditional_download(url_string, out_path, etag=None, last_modified=None, client=None):
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    h = hashlib.sha1()
+    with mapswipe_http_pool.open_url(url_string, client, headers, ok_status=(200, 304)) as response:
+        if response.status == 304:
+            response.read()
+            return None
+        with open(out_path, 'wb') as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+                f.write(chunk)
+        return response.headers, h.hexdigest()
+
+
+def write_snapshot(path, columns):
+    tmp_path = path + '.part.npz'
+    np.savez_compressed(tmp_path, **dict((name, np.asarray(columns[name])) for name, dtype in mapswipe_project_cache.COLUMNS))
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    with np.load(path) as snapshot:
+        return dict((name, snapshot[name]) for name in snapshot.files)
+
+
+# Compare two versions of a project, given as dicts of columns
+# Returns a dict of masks over the rows of each:
+#   added    - new rows whose tile isn't in the old version
+#   removed  - old rows whose tile isn't in the new version
+#   changed  - new rows whose counts or decision differ from the old version
+# and old_rows, the row in the old version of each new row (where there is one)
+def diff_columns(old, new):
+    old_keys = np.asarray(old['key'])
+    new_keys = np.asarray(new['key'])
+
+    order = np.argsort(old_keys, kind='stable')
+    position = np.searchsorted(old_keys[order], new_keys)
+    position[position == len(old_keys)] = 0
+    old_rows = order[position] if len(old_keys) else np.zeros(len(new_keys), dtype=np.int64)
+    found = (old_keys[old_rows] == new_keys) if len(old_keys) else np.zeros(len(new_keys), dtype=bool)
+
+    changed = np.zeros(len(new_keys), dtype=bool)
+    if len(old_keys):
+        for name in DIFF_COLUMNS:
+            changed |= found & (np.asarray(old[name])[old_rows] != np.asarray(new[name]))
+
+    return {
+        'added':    ~found,
+        'removed':  ~np.isin(old_keys, new_keys),
+        'changed':  changed,
+        'old_rows': old_rows,
+    }
+
+
+def write_diff(path, diff, old, new, from_version, to_version):
+    changes = {}
+    new_rows = np.flatnonzero(diff['changed'])
+    old_rows = diff['old_rows'][new_rows]
+    tile_ids = mapswipe_tile_math.keys_to_tile_ids(np.asarray(new['key'])[new_rows])
+    for name in DIFF_COLUMNS:
+        old_values = np.asarray(old[name])[old_rows].tolist()
+        new_values = np.asarray(new[name])[new_rows].tolist()
+        for tile_id, old_value, new_value in zip(tile_ids, old_values, new_values):
+            if old_value != new_value:
+                changes.setdefault(tile_id, {})[name] = [old_value, new_value]
+
+    text = json.dumps({
+        'from_version': from_version,
+        'to_version':   to_version,
+        'added':        mapswipe_tile_math.keys_to_tile_ids(np.asarray(new['key'])[diff['added']]),
+        'removed':      mapswipe_tile_math.keys_to_tile_ids(np.asarray(old['key'])[diff['removed']]),
+        'changed':      changes,
+    })
+    with open(path + '.part', 'wt') as f:
+        f.write(text)
+    os.replace(path + '.part', path)
+
+
+# The sync state of one project directory
+class ProjectSync:
+    def __init__(self, project_path):
+        self.sync_dir = os.path.join(project_path, SYNC_DIRNAME)
+        self.state_path = os.path.join(self.sync_dir, STATE_FILENAME)
+        self.state = {'version': STATE_VERSION, 'url': None, 'etag': None, 'last_modified': None, 'versions': []}
+        try:
+            with open(self.state_path, 'rt') as f:
+                state = json.load(f)
+            if state.get('version') == STATE_VERSION:
+                self.state = state
+        except (OSError, ValueError):
+            pass
+
+    def latest(self):
+        if not self.state['versions']:
+            return None
+        return self.state['versions'][-1]
+
+    def save(self):
+        if not os.path.isdir(self.sync_dir):
+            os.makedirs(self.sync_dir)
+        with open(self.state_path + '.part', 'wt') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(self.state_path + '.part', self.state_path)
+
+    # Bring json_path up to date with url_string, with requests on client if one is given
+    # Returns None if the project hasn't changed since the last sync, otherwise a dict with the
+    # new version number and the old and new columns - old is None for the first version - and
+    # the diff between them (see diff_columns)
+    def sync(self, url_string, json_path, client=None):
+        latest = self.latest()
+        etag = last_modified = None
+        # the validators only apply if the last version is still there, from the same URL
+        if latest is not None and self.state['url'] == url_string and os.path.exists(json_path):
+            etag = self.state['etag']
+            last_modified = self.state['last_modified']
+
+        tmp_path = json_path + '.part'
+        result = conditional_download(url_string, tmp_path, etag, last_modified, client)
+        if result is None:
+            return None
+        headers, sha1 = result
+
+        self.state['url'] = url_string
+        self.state['etag'] = headers.get('ETag')
+        self.state['last_modified'] = headers.get('Last-Modified')
+
+        # the server sent the whole file but it is the same as the last version
+        if latest is not None and latest['sha1'] == sha1 and os.path.exists(json_path):
+            os.remove(tmp_path)
+            self.save()
+            return None
+
+        # parse the new version before it replaces the last one, so a truncated or malformed
+        # download leaves the last good version in place
+        try:
+            columns = mapswipe_project_cache.build_columns(tmp_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, json_path)
+        project = mapswipe_project_cache.cache_columns(json_path, columns)
+        new = project.columns
+
+        version = 1 if latest is None else latest['version'] + 1
+        if not os.path.isdir(self.sync_dir):
+            os.makedirs(self.sync_dir)
+        write_snapshot(os.path.join(self.sync_dir, snapshot_name(version)), new)
+
+        old = None
+        diff = None
+        if latest is not None:
+            try:
+                old = read_snapshot(os.path.join(self.sync_dir, snapshot_name(latest['version'])))
+            except (OSError, ValueError) as e:
+                sys.stderr.write("Warning: could not read the snapshot of version {}: {}\n".format(latest['version'], e))
+        if old is not None:
+            diff = diff_columns(old, new)
+            write_diff(os.path.join(self.sync_dir, diff_name(latest['version'], version)),
+                       diff, old, new, latest['version'], version)
+
+        record = {
+            'version':  version,
+            'time':     time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'sha1':     sha1,
+            'n_tiles':  len(project),
+        }
+        if diff is not None:
+            record['added'] = int(np.count_nonzero(diff['added']))
+            record['removed'] = int(np.count_nonzero(diff['removed']))
+            record['changed'] = int(np.count_nonzero(diff['changed']))
+        self.state['versions'].append(record)
+        self.save()
+
+        return {'version': version, 'old': old, 'new': new, 'diff': diff}
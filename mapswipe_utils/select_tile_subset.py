@@ -0,0 +1,121 @@
+# mapswipe_utils/select_tile_subset.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Given a directory of bing tile images and a file of tile ids,
+# Copy selected tiles to the output directory
+# includes an --action arg to include or exclude the list
+
+# tilelist can be a list of :
+#  tile_IDs     e.g. 18-146363-145067
+#  file names   e.g. 18-146363-145067.jpg
+#  CSV lines where the ID is the first field
+#     e.g. 18-147207-144806,positive
+
+# The input and output can be directories of tiles or .tiles archives
+# Between directories --mode can link the tiles instead of copying them (see materialize.py)
+# Only files named like tiles - <zoom>-<x>-<y>.jpg - are selected, so with --action exclude
+# other .jpg files in the input directory are no longer copied
+
+# The input directory is only listed when it has to be - to include a list of tiles that
+# is shorter than the directory each tile is simply tried in turn. The fetch journal, if there
+# is one, says how many tiles the directory holds. Otherwise the tiles are compared as packed
+# integer keys (see tile_math.py) and placed on a pool of threads
+
+import argparse
+import sys
+import os
+import re
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import tile_store as mapswipe_tile_store
+from mapswipe_utils import materialize as mapswipe_materialize
+
+np = lazy_import('numpy')
+
+
+# a tile list of up to this many tiles is looked up one by one when the size of the input is not known
+LOOKUP_LIMIT = 10000
+
+tile_id_pattern = re.compile(r'^(\d+-\d+-\d+)', re.MULTILINE)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Select a subset of map tiles based on a file of tile IDs")
+
+    parser.add_argument('--tilelist', '-t', metavar='<tile_list_file>', required=True,
+                        help='File of tile IDs')
+
+
+    parser.add_argument('--indir', '-i', metavar='<input_directory>', required=True,
+                        help='Input Directory or .tiles archive')
+    parser.add_argument('--outdir', '-o', metavar='<output_directory>', required=True,
+                        help='Output Directory or .tiles archive')
+
+    parser.add_argument('--action', '-a', metavar='<action>', default='include',
+                        help='action is to include (default) or exclude the supplied tile IDs')
+    parser.add_argument('--mode', '-m', choices=mapswipe_materialize.MODES, default='copy',
+                        help='How to place each tile in the output directory (default copy)')
+    parser.add_argument('--workers', '-w', metavar='<number of threads>', type=int,
+                        default=mapswipe_materialize.DEFAULT_WORKERS,
+                        help='Number of threads placing tiles (default {})'.format(mapswipe_materialize.DEFAULT_WORKERS))
+
+
+    args = parser.parse_args(argv)
+
+
+    tile_list_file = args.tilelist
+    input_dir      = args.indir
+    output_dir     = args.outdir
+    action         = args.action
+
+    if action not in ('include', 'exclude'):
+        sys.stderr.write("ERROR: action must be include or exclude\n")
+        sys.exit(1)
+
+
+    # Load the tile IDs
+    # Handle various inputs - extract IDs like 18-147209-144812 from the start of each line
+    with open(tile_list_file, 'rt') as f:
+        tile_ids = tile_id_pattern.findall(f.read())
+    list_keys = np.unique(mapswipe_tile_math.tile_ids_to_keys(tile_ids).astype(np.uint64))
+
+    # open the input and create the output directory or archive if it doesn't exist
+    input_store  = mapswipe_tile_store.open_tile_store(input_dir)
+    output_store = mapswipe_tile_store.open_tile_store(output_dir, 'w')
+
+    # Work out which tiles to copy from whichever side is smaller
+    # To include a short list of tiles from a directory, try each tile in the list and skip
+    # those that are not there - otherwise list the input once and compare packed tile keys
+    lookup = False
+    if action == 'include' and isinstance(input_store, mapswipe_tile_store.DirectoryTileStore):
+        n_input = input_store.count_hint()
+        if n_input is None:
+            lookup = len(list_keys) <= LOOKUP_LIMIT
+        else:
+            lookup = len(list_keys) < n_input
+
+    if lookup:
+        keys = list_keys
+    elif action == 'include':
+        keys = np.intersect1d(input_store.keys(), list_keys, assume_unique=True)
+    else:
+        keys = np.setdiff1d(input_store.keys(), list_keys, assume_unique=True)
+
+    methods = mapswipe_tile_store.copy_tiles(input_store, output_store, mapswipe_tile_math.keys_to_tile_ids(keys),
+                                             args.mode, args.workers, missing_ok=lookup)
+
+    # let the user know if tiles could not be placed the way they asked
+    if args.mode != 'copy' and methods.get('copy', 0) > 0:
+        sys.stderr.write("Warning: {} tiles could not be placed with mode {} and were copied\n".format(methods['copy'], args.mode))
+
+    output_store.close()
+
+
+if __name__ == '__main__':
+    main()
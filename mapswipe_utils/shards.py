@@ -0,0 +1,214 @@
+# mapswipe_utils/shards.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Shard files of labelled image tiles, for training jobs that read large sequential files
+# rather than many small ones - used by mapswipe_export_shards.py
+
+# Two formats are supported:
+#
+#   tar      an ordinary tar file with two members per tile, in the layout used by the
+#            webdataset library:
+#               <tile_id>.jpg   the image
+#               <tile_id>.cls   the label as a decimal number
+#
+#   records  a file that starts with the 8 bytes RECORD_MAGIC, followed by one record per tile:
+#               data length     4 bytes, unsigned, little endian
+#               label           1 byte
+#               tile key        8 bytes, unsigned, little endian - see tile_math.py
+#               data            the image
+#
+# Shards are written under a temporary name and renamed when complete.
+# iter_shard() reads either format back as (tile_id, label, data).
+
+import io
+import os
+import struct
+import tarfile
+import hashlib
+
+from mapswipe_utils import tile_math as mapswipe_tile_math
+
+
+FORMATS = ['tar', 'records']
+
+SUFFIXES = {'tar': '.tar', 'records': '.rec'}
+
+RECORD_MAGIC = b'MSWREC1\0'
+RECORD_HEADER = struct.Struct('<IBQ')
+
+
+def shard_filename(split, number, shard_format):
+    return "{}-{:06d}{}".format(split, number, SUFFIXES[shard_format])
+
+
+def open_shard(path, shard_format):
+    if shard_format == 'tar':
+        return TarShardWriter(path)
+    if shard_format == 'records':
+        return RecordShardWriter(path)
+    raise ValueError("invalid shard format: {}".format(shard_format))
+
+
+class ShardWriter:
+    def __init__(self, path):
+        self.path = path
+        self.partial_path = path + '.part'
+        self.n_samples = 0
+        self.label_counts = {}
+        self.hash = hashlib.sha1()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def count(self, label):
+        self.n_samples += 1
+        self.label_counts[label] = self.label_counts.get(label, 0) + 1
+
+    # description of the finished shard for the shard index
+    def info(self):
+        return {
+            'file': os.path.basename(self.path),
+            'n_samples': self.n_samples,
+            'n_bytes': os.path.getsize(self.path),
+            'labels': dict((str(label), n) for label, n in sorted(self.label_counts.items())),
+            'sha1': self.hash.hexdigest(),
+        }
+
+
+def _round_up(n, size):
+    return (n + size - 1) // size * size
+
+
+class TarShardWriter(ShardWriter):
+    def __init__(self, path):
+        ShardWriter.__init__(self, path)
+        self.file = open(self.partial_path, 'wb')
+        self.tar = tarfile.open(fileobj=HashingWriter(self.file, self.hash), mode='w', format=tarfile.USTAR_FORMAT)
+
+    def size(self):
+        return self.file.tell()
+
+    # the size of the finished shard if a tile of n bytes was added -
+    # a header block and the padded data for the image and for the label,
+    # then the end of archive blocks and padding added on closing
+    def size_with(self, n):
+        size = self.size() + tarfile.BLOCKSIZE + _round_up(n, tarfile.BLOCKSIZE) + 2 * tarfile.BLOCKSIZE
+        return _round_up(size + 2 * tarfile.BLOCKSIZE, tarfile.RECORDSIZE)
+
+    def add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        # no timestamps or owners so the same tiles always give the same shard
+        info.mtime = 0
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, tile_id, label, data):
+        self.add_member(tile_id + '.jpg', data)
+        self.add_member(tile_id + '.cls', str(label).encode('ascii'))
+        self.count(label)
+
+    def close(self):
+        self.tar.close()
+        self.file.close()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.partial_path)
+
+
+class RecordShardWriter(ShardWriter):
+    def __init__(self, path):
+        ShardWriter.__init__(self, path)
+        self.file = HashingWriter(open(self.partial_path, 'wb'), self.hash)
+        self.file.write(RECORD_MAGIC)
+
+    def size(self):
+        return self.file.tell()
+
+    # the size of the finished shard if a tile of n bytes was added
+    def size_with(self, n):
+        return self.size() + RECORD_HEADER.size + n
+
+    def write(self, tile_id, label, data):
+        key = mapswipe_tile_math.tile_id_to_key(tile_id)
+        self.file.write(RECORD_HEADER.pack(len(data), label, key))
+        self.file.write(data)
+        self.count(label)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.partial_path)
+
+
+# A binary file that hashes everything written to it
+class HashingWriter:
+    def __init__(self, file, hash):
+        self.file = file
+        self.hash = hash
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+# Yield (tile_id, label, data) for each tile in a shard of either format
+def iter_shard(path):
+    if path.endswith(SUFFIXES['records']):
+        return _iter_records(path)
+    return _iter_tar(path)
+
+
+def _iter_records(path):
+    with open(path, 'rb') as f:
+        if f.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError("not a tile record shard: {}".format(path))
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                raise ValueError("truncated tile record shard: {}".format(path))
+            size, label, key = RECORD_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                raise ValueError("truncated tile record shard: {}".format(path))
+            yield mapswipe_tile_math.key_to_tile_id(key), label, data
+
+
+def _iter_tar(path):
+    # the members of a tile are next to each other - .jpg then .cls
+    tile_id = None
+    data = None
+    with tarfile.open(path, 'r|') as tar:
+        for member in tar:
+            name, ext = os.path.splitext(member.name)
+            content = tar.extractfile(member).read()
+            if ext == '.jpg':
+                tile_id, data = name, content
+            elif ext == '.cls' and name == tile_id:
+                yield tile_id, int(content), data
+                tile_id = None
+                data = None
@@ -0,0 +1,154 @@
+# mapswipe_utils/strip_tiff.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Write a large RGB image to a TIFF file one horizontal strip at a time
+
+# A mosaic of a large block of tiles can be far too big to hold in memory as a single image.
+# StripTiffWriter writes the image in strips of rows_per_strip rows, from the top down, so only
+# one strip needs to be in memory at a time. Each strip is compressed with zlib (the TIFF
+# Adobe Deflate compression) unless compress is False.
+#
+# The strip offsets and sizes are only known once all the strips are written, so the image
+# directory (IFD) goes at the end of the file and the header is updated to point to it.
+#
+# Files that could be larger than 4GB are written as BigTIFF, which has 64 bit offsets.
+# Most image tools read both (libtiff, GDAL, Pillow, ImageMagick, QGIS).
+
+import struct
+import zlib
+
+
+# tags
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC_INTERPRETATION = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIGURATION = 284
+
+# field types - (code, struct format)
+SHORT = (3, 'H')
+LONG = (4, 'I')
+LONG8 = (16, 'Q')
+
+COMPRESSION_NONE = 1
+COMPRESSION_DEFLATE = 8
+PHOTOMETRIC_RGB = 2
+
+SAMPLES = 3
+
+# use BigTIFF if the uncompressed image would be larger than this
+BIGTIFF_THRESHOLD = (1 << 32) - (1 << 24)
+
+
+class StripTiffWriter:
+    def __init__(self, path, width, height, rows_per_strip, compress=True, bigtiff=None):
+        self.width = width
+        self.height = height
+        self.rows_per_strip = rows_per_strip
+        self.compress = compress
+        if bigtiff is None:
+            bigtiff = width * height * SAMPLES > BIGTIFF_THRESHOLD
+        self.bigtiff = bigtiff
+        self.n_strips = (height + rows_per_strip - 1) // rows_per_strip
+        self.strip_offsets = []
+        self.strip_byte_counts = []
+
+        self.f = open(path, 'wb')
+        if bigtiff:
+            # byte order, version 43, offset size 8, then the offset of the IFD
+            self.f.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, 0))
+            self.ifd_offset_position = 8
+        else:
+            self.f.write(b'II' + struct.pack('<HI', 42, 0))
+            self.ifd_offset_position = 4
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # the number of rows in strip i - the last strip can be shorter
+    def strip_height(self, i):
+        return min(self.rows_per_strip, self.height - i * self.rows_per_strip)
+
+    # write the next strip, as raw RGB bytes for strip_height() rows
+    def write_strip(self, data):
+        i = len(self.strip_offsets)
+        if i >= self.n_strips:
+            raise ValueError("too many strips for a TIFF of {} rows".format(self.height))
+        expected = self.strip_height(i) * self.width * SAMPLES
+        if len(data) != expected:
+            raise ValueError("strip {} should be {} bytes, not {}".format(i, expected, len(data)))
+        if self.compress:
+            data = zlib.compress(data, 6)
+        self.strip_offsets.append(self.f.tell())
+        self.strip_byte_counts.append(len(data))
+        self.f.write(data)
+
+    def close(self):
+        if self.f.closed:
+            return
+        if len(self.strip_offsets) != self.n_strips:
+            self.f.close()
+            raise ValueError("only {} of {} strips were written".format(len(self.strip_offsets), self.n_strips))
+
+        offset_type = LONG8 if self.bigtiff else LONG
+        entries = [
+            (IMAGE_WIDTH, LONG, [self.width]),
+            (IMAGE_LENGTH, LONG, [self.height]),
+            (BITS_PER_SAMPLE, SHORT, [8] * SAMPLES),
+            (COMPRESSION, SHORT, [COMPRESSION_DEFLATE if self.compress else COMPRESSION_NONE]),
+            (PHOTOMETRIC_INTERPRETATION, SHORT, [PHOTOMETRIC_RGB]),
+            (STRIP_OFFSETS, offset_type, self.strip_offsets),
+            (SAMPLES_PER_PIXEL, SHORT, [SAMPLES]),
+            (ROWS_PER_STRIP, LONG, [self.rows_per_strip]),
+            (STRIP_BYTE_COUNTS, offset_type, self.strip_byte_counts),
+            (PLANAR_CONFIGURATION, SHORT, [1]),
+        ]
+        self.write_ifd(entries)
+        self.f.close()
+
+    # Write the values that don't fit in their entries, then the IFD, then point the header at it
+    def write_ifd(self, entries):
+        if self.bigtiff:
+            count_format, entry_format, offset_format, value_size = 'Q', '<HHQ', 'Q', 8
+        else:
+            count_format, entry_format, offset_format, value_size = 'H', '<HHI', 'I', 4
+
+        packed_entries = []
+        for tag, (type_code, value_format), values in entries:
+            data = struct.pack('<{}{}'.format(len(values), value_format), *values)
+            if len(data) <= value_size:
+                value = data.ljust(value_size, b'\0')
+            else:
+                self.align()
+                value = struct.pack('<' + offset_format, self.f.tell())
+                self.f.write(data)
+            packed_entries.append(struct.pack(entry_format, tag, type_code, len(values)) + value)
+
+        self.align()
+        ifd_offset = self.f.tell()
+        self.f.write(struct.pack('<' + count_format, len(packed_entries)))
+        for entry in packed_entries:
+            self.f.write(entry)
+        # no more IFDs
+        self.f.write(struct.pack('<' + offset_format, 0))
+
+        self.f.seek(self.ifd_offset_position)
+        self.f.write(struct.pack('<' + offset_format, ifd_offset))
+
+    # offsets in a TIFF must be on a word boundary
+    def align(self):
+        if self.f.tell() % 2:
+            self.f.write(b'\0')
@@ -0,0 +1,200 @@
+# mapswipe_utils/synthetic.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Synthetic MapSwipe projects and image tiles, for benchmarks and for trying out the tools
+# without downloading anything - used by mapswipe_benchmark.py
+
+# A synthetic project looks like a real one:
+#
+#   - the project covers a number of areas of contiguous tiles, like the task groups of a project,
+#     with settlements scattered through them
+#   - the project JSON only lists tiles that at least one volunteer tagged, as the real API does
+#   - tiles near a settlement are likely to be tagged yes by most of the volunteers who saw them,
+#     some tiles get a maybe, and bad imagery comes in patches, like cloud
+#   - decision is the mean of the tags, with yes as 1, maybe as 2 and bad imagery as 3
+#
+# Everything is generated from a seed so the same arguments always give the same files.
+
+import io
+import os
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+ImageDraw = lazy_import('PIL.ImageDraw')
+
+
+ZOOM = 18
+
+# where the synthetic projects are placed - somewhere in East Africa at zoom 18
+ORIGIN_X = 158000
+ORIGIN_Y = 127000
+
+# the number of volunteers who see each tile
+VOLUNTEERS_PER_TILE = (3, 6)
+
+# records written to the JSON file at a time
+WRITE_BATCH_SIZE = 100000
+
+
+# A random number in [0, 1) for each point of a grid, from an integer hash of the point
+def _lattice(gx, gy, seed):
+    with np.errstate(over='ignore'):
+        z = (gx.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) ^ (gy.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F))
+        z = z + np.uint64(seed)
+        z = (z ^ (z >> np.uint64(31))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = z ^ (z >> np.uint64(29))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+# Smooth random values in [0, 1) that vary over about cell tiles
+def _value_noise(xs, ys, cell, seed):
+    gx, fx = np.divmod(xs, cell)
+    gy, fy = np.divmod(ys, cell)
+    fx = fx / cell
+    fy = fy / cell
+    fx = fx * fx * (3 - 2 * fx)
+    fy = fy * fy * (3 - 2 * fy)
+    top = _lattice(gx, gy, seed) * (1 - fx) + _lattice(gx + 1, gy, seed) * fx
+    bottom = _lattice(gx, gy + 1, seed) * (1 - fx) + _lattice(gx + 1, gy + 1, seed) * fx
+    return top * (1 - fy) + bottom * fy
+
+
+# Tiles of a synthetic project as zoom, x and y arrays plus yes, maybe and bad imagery counts
+# n_tiles is the number of tagged tiles, at most about half of the tiles in the project area
+def generate_project_tiles(n_tiles, seed=0):
+    rng = np.random.RandomState(seed)
+
+    # roughly 2 tiles in the area for every tagged tile, in square areas of about 2000 tiles
+    n_area_tiles = 2 * n_tiles
+    area_size = 45
+    n_areas = max(1, n_area_tiles // (area_size * area_size))
+    side = int(np.ceil(np.sqrt(n_areas))) * area_size * 2
+    area_x = ORIGIN_X + rng.randint(0, side, n_areas)
+    area_y = ORIGIN_Y + rng.randint(0, side, n_areas)
+
+    xs = (area_x[:, None, None] + np.arange(area_size)[None, None, :]).repeat(area_size, axis=1).ravel()
+    ys = (area_y[:, None, None] + np.arange(area_size)[None, :, None]).repeat(area_size, axis=2).ravel()
+    keys = np.unique(mapswipe_tile_math.pack_tiles(np.full(len(xs), ZOOM), xs, ys))
+    zooms, xs, ys = mapswipe_tile_math.unpack_tiles(keys)
+
+    # settlements - the chance of a building comes from a smooth random field, high in
+    # patches a few tiles across, with larger scale variation on top
+    field = 0.6 * _value_noise(xs, ys, 8, seed) + 0.4 * _value_noise(xs, ys, 32, seed + 1)
+    p_building = 0.9 * np.clip((field - 0.55) / 0.25, 0, 1) ** 1.5
+
+    # cloud patches for bad imagery - a coarse grid of cells, a few of which are cloudy
+    cloudy = (np.bitwise_xor(xs >> 4, ys >> 4) * 2654435761 + seed) % 23 == 0
+    p_bad = np.where(cloudy, 0.6, 0.01)
+
+    n_volunteers = rng.randint(VOLUNTEERS_PER_TILE[0], VOLUNTEERS_PER_TILE[1] + 1, len(keys))
+    bad = rng.binomial(n_volunteers, p_bad)
+    yes = rng.binomial(n_volunteers - bad, p_building)
+    maybe = rng.binomial(n_volunteers - bad - yes, np.minimum(0.5, p_building + 0.03))
+
+    # keep the tagged tiles, sampled down to n_tiles
+    tagged = np.flatnonzero(yes + maybe + bad > 0)
+    if len(tagged) > n_tiles:
+        tagged = np.sort(rng.choice(tagged, n_tiles, replace=False))
+
+    return {
+        'task_z': zooms[tagged],
+        'task_x': xs[tagged],
+        'task_y': ys[tagged],
+        'yes_count': yes[tagged],
+        'maybe_count': maybe[tagged],
+        'bad_imagery_count': bad[tagged],
+    }
+
+
+# Write a synthetic project JSON file in the format of the MapSwipe API
+def write_project(path, tiles, project_id=1):
+    n = len(tiles['task_x'])
+    tile_ids = mapswipe_tile_math.format_tile_ids(tiles['task_z'], tiles['task_x'], tiles['task_y'])
+    total = tiles['yes_count'] + tiles['maybe_count'] + tiles['bad_imagery_count']
+    decision = (tiles['yes_count'] + 2 * tiles['maybe_count'] + 3 * tiles['bad_imagery_count']) / total
+    timestamp = 1499342969729 + np.arange(n) * 1000
+
+    template = ('{{"bad_imagery_count": {}, "maybe_count": {}, "yes_count": {}, "id": "{}", '
+                '"user_id": "synthetic", "project": {}, "timestamp": {}, '
+                '"task_x": "{}", "task_y": "{}", "task_z": "{}", "decision": {}}}')
+
+    with open(path + '.part', 'wt') as f:
+        f.write('[\n')
+        for start in range(0, n, WRITE_BATCH_SIZE):
+            end = min(n, start + WRITE_BATCH_SIZE)
+            columns = [tiles[name][start:end].tolist() for name in ('bad_imagery_count', 'maybe_count', 'yes_count')]
+            columns.append(tile_ids[start:end])
+            columns.append([project_id] * (end - start))
+            columns.append(timestamp[start:end].tolist())
+            columns.extend(tiles[name][start:end].tolist() for name in ('task_x', 'task_y', 'task_z'))
+            # whole numbers are written as integers, like the real files
+            columns.append([int(d) if d == int(d) else round(d, 4) for d in decision[start:end].tolist()])
+            records = [template.format(*row) for row in zip(*columns)]
+            f.write(',\n'.join(records))
+            f.write(',\n' if end < n else '\n')
+        f.write(']\n')
+    os.replace(path + '.part', path)
+
+
+def generate_project(path, n_tiles, seed=0):
+    tiles = generate_project_tiles(n_tiles, seed)
+    write_project(path, tiles)
+    return tiles
+
+
+# -- image tiles
+
+TILE_SIZE = 256
+N_TEXTURES = 16
+
+
+def ground_textures(rng):
+    # smooth random ground textures - noise at 1/16 scale blown up, with fine noise on top
+    textures = []
+    for i in range(N_TEXTURES):
+        coarse = rng.randint(60, 160, (16, 16, 3)).astype(np.uint8)
+        base = np.asarray(Image.fromarray(coarse).resize((TILE_SIZE, TILE_SIZE), Image.BICUBIC), dtype=np.int16)
+        fine = rng.randint(-12, 13, (TILE_SIZE, TILE_SIZE, 1))
+        textures.append(np.clip(base + fine, 0, 255).astype(np.uint8))
+    return textures
+
+
+# JPEG bytes of a synthetic tile - ground texture with some buildings drawn on it
+def render_tile(textures, key, n_buildings, quality=85):
+    rng = np.random.RandomState(key % (1 << 32))
+    image = Image.fromarray(textures[key % len(textures)])
+    draw = ImageDraw.Draw(image)
+    for i in range(n_buildings):
+        x, y = rng.randint(0, TILE_SIZE - 12, 2)
+        w, h = rng.randint(5, 12, 2)
+        shade = int(rng.randint(150, 230))
+        draw.rectangle([x, y, x + w, y + h], fill=(shade, shade, shade - 20))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+# Write synthetic JPEG tiles to a tile store
+# buildings is an optional array of the number of buildings to draw on each tile
+def generate_tiles(tile_store, tile_ids, seed=0, buildings=None):
+    rng = np.random.RandomState(seed)
+    textures = ground_textures(rng)
+    keys = mapswipe_tile_math.tile_ids_to_keys(tile_ids).tolist()
+    if buildings is None:
+        buildings = rng.poisson(2, len(keys))
+    for tile_id, key, n in zip(tile_ids, keys, np.asarray(buildings).tolist()):
+        tile_store.write(tile_id, render_tile(textures, key, n))
+
+
+# A block of nx by ny tile IDs
+def block_tile_ids(nx, ny, x=ORIGIN_X, y=ORIGIN_Y):
+    xs, ys = np.meshgrid(np.arange(x, x + nx), np.arange(y, y + ny))
+    return mapswipe_tile_math.format_tile_ids(np.full(xs.size, ZOOM), xs.ravel(), ys.ravel())
@@ -0,0 +1,173 @@
+# mapswipe_utils/tile_dedup.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Content addressed storage of fetched tiles and detection of 'no imagery' placeholder tiles
+# Used by fetch_engine.py and fetch_journal.py
+
+# Bing returns the same placeholder JPEG for every tile it has no imagery for, and a project
+# in a sparsely imaged area can have thousands of them. Each tile body is hashed as it is
+# fetched (the SHA1 that goes in the fetch journal) and that hash is used two ways.
+#
+# With --dedup each distinct image is stored once, in an object directory inside the tile
+# directory, and each <tile_id>.jpg is a hard link to its object:
+#
+#   positive_tiles/
+#      .objects/3f/3f786850e387550fdab836ed7e6dc881de23001b.jpg
+#      18-1234-5678.jpg      hard link to the object with its content
+#
+# The tile files look the same as before to every other tool, but identical tiles take the
+# space of one and share one inode, so once one of them has been read the rest come from the
+# page cache. The journal records the hash of each tile, which is its reference to the object.
+# A hard link that can't be made falls back to a copy (see materialize.py).
+#
+# A tile is a placeholder if the server says so - Bing sends X-VE-Tile-Info: no-tile with
+# them - or if its hash is in a file of known placeholder hashes (--placeholder_hashes, one
+# SHA1 per line). A hash seen with the header is remembered for the rest of the job. What is
+# done with placeholders is set with --placeholders:
+#
+#   keep    store them like any other tile (the default)
+#   skip    don't store them - the journal records them so they are not fetched again
+#   list    skip them and append their tile IDs to placeholders.lst in the output directory,
+#           or to <name>_placeholders.lst next to a <name>.tiles archive
+#
+# Hashes that many tiles share are listed in the summary at the end of a fetch. They are not
+# treated as placeholders automatically, as a run of plain water or desert tiles can be
+# identical too, but once checked they can be added to a placeholder hash file.
+
+import os
+import re
+import threading
+import collections
+
+from mapswipe_utils import materialize as mapswipe_materialize
+
+
+OBJECTS_DIRNAME = '.objects'
+
+PLACEHOLDER_MODES = ['keep', 'skip', 'list']
+PLACEHOLDER_LIST_FILENAME = 'placeholders.lst'
+PLACEHOLDER_LIST_SUFFIX = '_placeholders.lst'
+
+# the response header and value Bing uses to mark a tile with no imagery
+PLACEHOLDER_HEADER = 'X-VE-Tile-Info'
+PLACEHOLDER_HEADER_VALUE = 'no-tile'
+
+# hashes shared by at least this many tiles are listed in the summary
+REPEAT_REPORT_THRESHOLD = 10
+REPEAT_REPORT_MAX = 5
+
+SHA1_PATTERN = re.compile(r'[0-9a-f]{40}$')
+
+
+# The list goes in an output directory - positive_tiles/placeholders.lst - or next to an
+# archive - positive_tiles_placeholders.lst for positive_tiles.tiles
+def placeholder_list_path(output, archive=False):
+    if archive:
+        return os.path.splitext(output)[0] + PLACEHOLDER_LIST_SUFFIX
+    return os.path.join(output, PLACEHOLDER_LIST_FILENAME)
+
+
+# Read a file of placeholder hashes - one SHA1 per line, blank lines and # comments ignored
+def read_placeholder_hashes(path):
+    hashes = set()
+    with open(path, 'rt') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip().lower()
+            if not line:
+                continue
+            if not SHA1_PATTERN.match(line):
+                raise ValueError("not a SHA1 hash: {}".format(line))
+            hashes.add(line)
+    return hashes
+
+
+# A directory of tile images named by the SHA1 of their content
+class ObjectStore:
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def object_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest + '.jpg')
+
+    # Store data under its hash, if it isn't there already, and place a hard link to it at path
+    # Returns True if the content was new and False if it was already in the store
+    def place(self, path, data, digest):
+        object_path = self.object_path(digest)
+        is_new = not os.path.exists(object_path)
+        if is_new:
+            is_new = self.add(object_path, data)
+        mapswipe_materialize.materialize_file(object_path, path, 'link')
+        return is_new
+
+    # Write a new object - returns False if another thread stored the same content first
+    # The object is linked into place, which fails if it exists, so the first copy is the one
+    # every tile links to
+    def add(self, object_path, data):
+        object_dir = os.path.dirname(object_path)
+        if not os.path.isdir(object_dir):
+            os.makedirs(object_dir, exist_ok=True)
+        partial_path = "{}.part{}".format(object_path, threading.get_ident())
+        try:
+            with open(partial_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(partial_path, object_path)
+            except FileExistsError:
+                return False
+            except OSError:
+                # no hard links on this filesystem
+                os.replace(partial_path, object_path)
+            return True
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+
+# Decide which tiles are placeholders and count how often each hash is seen
+class PlaceholderDetector:
+    def __init__(self, hashes=None):
+        self.hashes = set(hashes or ())
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.n_placeholders = 0
+
+    # headers are the response headers for the tile, if there are any
+    def check(self, digest, headers=None):
+        marked = headers is not None and (headers.get(PLACEHOLDER_HEADER) or '').strip().lower() == PLACEHOLDER_HEADER_VALUE
+        with self.lock:
+            self.counts[digest] += 1
+            if marked:
+                self.hashes.add(digest)
+            is_placeholder = digest in self.hashes
+            if is_placeholder:
+                self.n_placeholders += 1
+            return is_placeholder
+
+    # Hashes shared by many tiles that aren't known placeholders, most common first
+    def repeated(self, threshold=REPEAT_REPORT_THRESHOLD, limit=REPEAT_REPORT_MAX):
+        with self.lock:
+            return [(digest, n) for digest, n in self.counts.most_common()
+                    if n >= threshold and digest not in self.hashes][:limit]
+
+    def summary(self):
+        with self.lock:
+            n_tiles = sum(self.counts.values())
+            n_distinct = len(self.counts)
+            n_placeholders = self.n_placeholders
+        lines = []
+        if n_tiles > n_distinct:
+            lines.append("{} tiles fetched with {} distinct images, {} placeholders".format(n_tiles, n_distinct, n_placeholders))
+        elif n_placeholders:
+            lines.append("{} placeholders".format(n_placeholders))
+        for digest, n in self.repeated():
+            lines.append("  {} tiles have content {} - a possible placeholder".format(n, digest))
+        return '\n'.join(lines)
@@ -0,0 +1,68 @@
+# mapswipe_utils/tile_loader.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Load tile images at a given display size, on a pool of threads
+# Used by the grid display scripts
+
+# Decoding a 256 x 256 JPEG and then shrinking it throws most of the work away when the
+# display size is small. JPEG decoders can decode straight to 1/2, 1/4 or 1/8 of the full
+# size by skipping part of the inverse DCT, which PIL exposes as draft mode. Tiles are
+# decoded at the smallest of those scales that is still at least the display size, then
+# resized the rest of the way.
+#
+# PIL releases the GIL while it decodes and resizes, so a pool of threads keeps several
+# cores busy.
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from mapswipe_utils.lazy import lazy_import
+
+Image = lazy_import('PIL.Image')
+
+
+DEFAULT_WORKERS = 8
+
+
+# Decode the image bytes of a tile into an RGB image of size x size pixels
+def decode_tile(data, size):
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        img.draft('RGB', (size, size))
+    img = img.convert('RGB')
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.LANCZOS)
+    return img
+
+
+class TileLoader:
+    def __init__(self, tile_store, size, workers=DEFAULT_WORKERS):
+        self.tile_store = tile_store
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # the image for one tile, or None if it is not in the store
+    def load(self, tile_id):
+        try:
+            data = self.tile_store.read(tile_id)
+        except KeyError:
+            return None
+        return decode_tile(data, self.size)
+
+    # the images for a list of tiles, in the same order
+    def load_all(self, tile_ids):
+        return list(self.pool.map(self.load, tile_ids))
+
+    def close(self):
+        self.pool.shutdown()
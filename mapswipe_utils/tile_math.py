@@ -0,0 +1,293 @@
+# mapswipe_utils/tile_math.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Conversions between the different ways of naming a Bing Maps tile
+
+#   tile ID          "18-134732-123781"  zoom-x-y as used by MapSwipe
+#   coordinates      zoom, x, y
+#   quadkey          "120203..."         one base 4 digit per zoom level, used by Bing Maps
+#   packed key       64 bit integer      zoom in the top 6 bits, then the quadkey digits
+#
+# The packed key interleaves the bits of x and y (a Morton or Z-order code) so that its
+# base 4 digits are exactly the quadkey digits. Sorting packed keys at one zoom level therefore
+# sorts tiles in quadkey order, and the parent of a tile is just a shift by 2 bits.
+#
+# Each conversion has a scalar version for single tiles and a batched version that works
+# on NumPy arrays or lists of strings without a Python loop per tile, for whole projects.
+# NumPy is only imported when a batched version is first used.
+
+from mapswipe_utils.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+
+# Zoom levels up to 29 fit in the 58 bits below the zoom field
+MAX_ZOOM = 29
+ZOOM_SHIFT = 58
+MORTON_MASK = (1 << ZOOM_SHIFT) - 1
+
+_DASH = ord('-')
+_NEWLINE = ord('\n')
+_ZERO = ord('0')
+_POWERS_OF_TEN = [10 ** i for i in range(19)]
+
+
+# -- single tiles
+
+def parse_tile_id(tile_id):
+    a = tile_id.split('-')
+    return int(a[0]), int(a[1]), int(a[2])
+
+
+def format_tile_id(zoom, x, y):
+    return "{}-{}-{}".format(zoom, x, y)
+
+
+def _spread_bits(v):
+    v &= 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8))  & 0x00FF00FF00FF00FF
+    v = (v | (v << 4))  & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2))  & 0x3333333333333333
+    v = (v | (v << 1))  & 0x5555555555555555
+    return v
+
+
+def _compact_bits(v):
+    v &= 0x5555555555555555
+    v = (v | (v >> 1))  & 0x3333333333333333
+    v = (v | (v >> 2))  & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4))  & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8))  & 0x0000FFFF0000FFFF
+    v = (v | (v >> 16)) & 0x00000000FFFFFFFF
+    return v
+
+
+def pack_tile(zoom, x, y):
+    return (zoom << ZOOM_SHIFT) | _spread_bits(x) | (_spread_bits(y) << 1)
+
+
+def unpack_tile(key):
+    morton = key & MORTON_MASK
+    return key >> ZOOM_SHIFT, _compact_bits(morton), _compact_bits(morton >> 1)
+
+
+# Convert Tile X and Y to a Bing Maps Quadkey which is used to retrieve a tile
+def tile_coords_and_zoom_to_quadkey(x, y, zoom):
+    if zoom == 0:
+        return ''
+    morton = _spread_bits(x) | (_spread_bits(y) << 1)
+    # the base 4 digits of the morton code are the quadkey, one digit per zoom level
+    digits = []
+    for i in range(zoom):
+        digits.append('0123'[morton & 3])
+        morton >>= 2
+    return ''.join(reversed(digits))
+
+
+def quadkey_to_tile_coords_and_zoom(quadkey):
+    zoom = len(quadkey)
+    morton = int(quadkey, 4) if zoom else 0
+    return _compact_bits(morton), _compact_bits(morton >> 1), zoom
+
+
+def tile_id_to_quadkey(tile_id):
+    zoom, x, y = parse_tile_id(tile_id)
+    return tile_coords_and_zoom_to_quadkey(x, y, zoom)
+
+
+def tile_id_to_key(tile_id):
+    return pack_tile(*parse_tile_id(tile_id))
+
+
+def key_to_tile_id(key):
+    return format_tile_id(*unpack_tile(key))
+
+
+def parent_key(key, levels=1):
+    zoom = key >> ZOOM_SHIFT
+    return ((zoom - levels) << ZOOM_SHIFT) | ((key & MORTON_MASK) >> (2 * levels))
+
+
+def child_keys(key):
+    zoom = key >> ZOOM_SHIFT
+    base = ((zoom + 1) << ZOOM_SHIFT) | ((key & MORTON_MASK) << 2)
+    return [base, base | 1, base | 2, base | 3]
+
+
+# -- batches of tiles
+
+# Parse a sequence of fields separated by '-' or '\n' in one pass over the bytes
+# Returns an int64 array with one value per field
+def _parse_fields(buf):
+    chars = np.frombuffer(buf, dtype=np.uint8)
+    is_sep = (chars == _DASH) | (chars == _NEWLINE)
+    ends = np.flatnonzero(is_sep)
+    lengths = np.diff(ends, prepend=-1) - 1
+    digits = chars[~is_sep].astype(np.int64) - _ZERO
+    if np.any(lengths <= 0) or np.any(lengths > 18) or np.any((digits < 0) | (digits > 9)):
+        raise ValueError("tile IDs must have the form zoom-x-y")
+    # each digit is scaled by 10 to the power of its distance from the end of its field
+    field_ends = np.cumsum(lengths)
+    exponent = np.repeat(field_ends, lengths) - np.arange(len(digits)) - 1
+    values = digits * np.array(_POWERS_OF_TEN, dtype=np.int64)[exponent]
+    return np.add.reduceat(values, field_ends - lengths)
+
+
+# Convert a list of tile IDs to zoom, x and y arrays
+def parse_tile_ids(tile_ids):
+    if len(tile_ids) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+    buf = ('\n'.join(tile_ids) + '\n').encode('ascii')
+    fields = _parse_fields(buf)
+    if len(fields) != 3 * len(tile_ids):
+        raise ValueError("tile IDs must have the form zoom-x-y")
+    fields = fields.reshape(-1, 3)
+    return fields[:, 0], fields[:, 1], fields[:, 2]
+
+
+# ASCII digits of non-negative integers as an (n, width) array plus a mask of the
+# characters to keep, which drops the leading zeros
+def _digit_columns(values):
+    values = np.asarray(values, dtype=np.int64)
+    width = max(1, len(str(int(values.max())))) if len(values) else 1
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    digits = (values[:, None] // powers) % 10
+    keep = (values[:, None] >= powers) | (powers == 1)
+    return (digits + _ZERO).astype(np.uint8), keep
+
+
+# Join rows of character columns, keeping only the masked characters, and split into strings
+def _join_columns(columns, keeps):
+    chars = np.concatenate(columns, axis=1)
+    keep = np.concatenate(keeps, axis=1)
+    return chars[keep].tobytes().decode('ascii').split('\n')[:-1]
+
+
+def _separator_column(n, separator):
+    return np.full((n, 1), ord(separator), dtype=np.uint8), np.ones((n, 1), dtype=bool)
+
+
+# Convert zoom, x and y arrays to a list of tile IDs
+def format_tile_ids(zoom, x, y):
+    n = len(x)
+    if n == 0:
+        return []
+    dash, dash_keep = _separator_column(n, '-')
+    newline, newline_keep = _separator_column(n, '\n')
+    z_digits, z_keep = _digit_columns(zoom)
+    x_digits, x_keep = _digit_columns(x)
+    y_digits, y_keep = _digit_columns(y)
+    return _join_columns([z_digits, dash, x_digits, dash, y_digits, newline],
+                         [z_keep, dash_keep, x_keep, dash_keep, y_keep, newline_keep])
+
+
+def _spread_bits_array(v):
+    v = np.asarray(v).astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8)))  & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4)))  & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2)))  & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1)))  & np.uint64(0x5555555555555555)
+    return v
+
+
+def _compact_bits_array(v):
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0x5555555555555555)
+    v = (v | (v >> np.uint64(1)))  & np.uint64(0x3333333333333333)
+    v = (v | (v >> np.uint64(2)))  & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v >> np.uint64(4)))  & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v >> np.uint64(8)))  & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return v.astype(np.int64)
+
+
+# Pack zoom, x and y arrays into uint64 keys
+def pack_tiles(zoom, x, y):
+    z = np.asarray(zoom).astype(np.uint64) << np.uint64(ZOOM_SHIFT)
+    return z | _spread_bits_array(x) | (_spread_bits_array(y) << np.uint64(1))
+
+
+# Unpack uint64 keys into zoom, x and y arrays
+def unpack_tiles(keys):
+    keys = np.asarray(keys, dtype=np.uint64)
+    morton = keys & np.uint64(MORTON_MASK)
+    zoom = (keys >> np.uint64(ZOOM_SHIFT)).astype(np.int64)
+    return zoom, _compact_bits_array(morton), _compact_bits_array(morton >> np.uint64(1))
+
+
+def tile_ids_to_keys(tile_ids):
+    return pack_tiles(*parse_tile_ids(tile_ids))
+
+
+def keys_to_tile_ids(keys):
+    return format_tile_ids(*unpack_tiles(keys))
+
+
+# Convert zoom, x and y arrays to a list of quadkeys
+def quadkeys_from_arrays(zoom, x, y):
+    n = len(x)
+    if n == 0:
+        return []
+    zoom = np.asarray(zoom, dtype=np.int64)
+    morton = _spread_bits_array(x) | (_spread_bits_array(y) << np.uint64(1))
+    width = int(zoom.max())
+    # digit i of a tile at zoom z is bits 2(z-1-i) and 2(z-1-i)+1 of the morton code
+    i = np.arange(width, dtype=np.int64)
+    shift = 2 * (zoom[:, None] - 1 - i)
+    keep = shift >= 0
+    shift = np.where(keep, shift, 0).astype(np.uint64)
+    digits = ((morton[:, None] >> shift) & np.uint64(3)).astype(np.uint8) + _ZERO
+    newline, newline_keep = _separator_column(n, '\n')
+    return _join_columns([digits, newline], [keep, newline_keep])
+
+
+def tile_ids_to_quadkeys(tile_ids):
+    zoom, x, y = parse_tile_ids(tile_ids)
+    return quadkeys_from_arrays(zoom, x, y)
+
+
+# Convert a list of quadkeys to zoom, x and y arrays
+def quadkeys_to_arrays(quadkeys):
+    n = len(quadkeys)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+    chars = np.frombuffer(('\n'.join(quadkeys) + '\n').encode('ascii'), dtype=np.uint8)
+    is_sep = chars == _NEWLINE
+    ends = np.flatnonzero(is_sep)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    zoom = ends - starts
+    field = (np.cumsum(is_sep) - is_sep)[~is_sep]
+    position = np.flatnonzero(~is_sep)
+    shift = (2 * (ends[field] - position - 1)).astype(np.uint64)
+    digits = (chars[~is_sep] - _ZERO).astype(np.uint64) << shift
+    # every digit sets different bits so summing the digits of a quadkey is the same as or-ing them
+    morton = np.zeros(n, dtype=np.uint64)
+    nonempty = zoom > 0
+    if np.any(nonempty):
+        digit_starts = (starts - np.arange(n))[nonempty]
+        morton[nonempty] = np.add.reduceat(digits, digit_starts)
+    return zoom.astype(np.int64), _compact_bits_array(morton), _compact_bits_array(morton >> np.uint64(1))
+
+
+# Keys of the ancestors of each key, levels zoom levels up
+def parent_keys(keys, levels=1):
+    keys = np.asarray(keys, dtype=np.uint64)
+    zoom = (keys >> np.uint64(ZOOM_SHIFT)) - np.uint64(levels)
+    morton = (keys & np.uint64(MORTON_MASK)) >> np.uint64(2 * levels)
+    return (zoom << np.uint64(ZOOM_SHIFT)) | morton
+
+
+# Keys of the four children of each key as an (n, 4) array in quadkey order
+def children_keys(keys):
+    keys = np.asarray(keys, dtype=np.uint64)
+    zoom = (keys >> np.uint64(ZOOM_SHIFT)) + np.uint64(1)
+    base = (zoom << np.uint64(ZOOM_SHIFT)) | ((keys & np.uint64(MORTON_MASK)) << np.uint64(2))
+    return base[:, None] | np.arange(4, dtype=np.uint64)
@@ -0,0 +1,202 @@
+# mapswipe_utils/tile_query.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Query engine for filtering the tiles of a MapSwipe project
+
+# A query is a boolean expression over the numeric tile attributes, for example
+#
+#    yes_count >= 2 and bad_imagery_count == 0
+#    (yes_count gt 3 or maybe_count ge 2) and not task_y < 123000
+#
+# Comparisons can use either symbols  <  <=  ==  =  !=  >=  >
+# or the words used by mapswipe_filter_tile_list.py  lt  le  eq  ne  ge  gt
+# and are combined with and, or, not and parentheses.
+#
+# A compiled query is evaluated over a whole project at once, as NumPy boolean masks
+# over the columns of the project cache (project_cache.py), rather than one
+# record at a time.
+
+import re
+import operator
+
+from mapswipe_utils.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+
+ATTRIBUTES = ['bad_imagery_count', 'maybe_count', 'yes_count', 'task_x', 'task_y', 'task_z', 'decision']
+
+# operator name -> (scalar function, name of the NumPy array function)
+OPERATORS = {
+    'lt': (operator.lt, 'less'),
+    'le': (operator.le, 'less_equal'),
+    'eq': (operator.eq, 'equal'),
+    'ne': (operator.ne, 'not_equal'),
+    'ge': (operator.ge, 'greater_equal'),
+    'gt': (operator.gt, 'greater'),
+}
+
+SYMBOLS = {'<': 'lt', '<=': 'le', '==': 'eq', '=': 'eq', '!=': 'ne', '>=': 'ge', '>': 'gt'}
+
+# the operator to use when the operands are swapped, e.g. 2 < yes_count
+SWAPPED = {'lt': 'gt', 'le': 'ge', 'eq': 'eq', 'ne': 'ne', 'ge': 'le', 'gt': 'lt'}
+
+_TOKEN_PATTERN = re.compile(r'\s*(?:(\d+\.\d*|\.\d+|\d+)|(<=|>=|==|!=|<|>|=)|([A-Za-z_]\w*)|(\(|\)))')
+
+
+class QueryError(ValueError):
+    pass
+
+
+# Check a single attribute of one tile record against a value
+def check_tile_info(tile, attribute_name, operator_name, value):
+    compare = OPERATORS[operator_name][0]
+    return compare(int(tile[attribute_name]), value)
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_PATTERN.match(text, pos)
+        if m is None:
+            raise QueryError("unexpected character in query at: {}".format(text[pos:]))
+        number, symbol, word, paren = m.groups()
+        if number is not None:
+            tokens.append(('number', float(number) if '.' in number else int(number)))
+        elif symbol is not None:
+            tokens.append(('op', SYMBOLS[symbol]))
+        elif word is not None:
+            lower = word.lower()
+            if lower in OPERATORS:
+                tokens.append(('op', lower))
+            elif lower in ('and', 'or', 'not'):
+                tokens.append((lower, lower))
+            else:
+                tokens.append(('name', word))
+        else:
+            tokens.append((paren, paren))
+        pos = m.end()
+    return tokens
+
+
+# Recursive descent parser producing a tree of tuples
+#   ('or', a, b)  ('and', a, b)  ('not', a)  ('compare', attribute, operator, value)
+
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def take(self, kind=None):
+        if self.pos >= len(self.tokens):
+            raise QueryError("unexpected end of query")
+        token = self.tokens[self.pos]
+        if kind is not None and token[0] != kind:
+            raise QueryError("expected {} but found {}".format(kind, token[1]))
+        self.pos += 1
+        return token
+
+    def parse(self):
+        tree = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise QueryError("unexpected {} in query".format(self.tokens[self.pos][1]))
+        return tree
+
+    def parse_or(self):
+        tree = self.parse_and()
+        while self.peek() == 'or':
+            self.take()
+            tree = ('or', tree, self.parse_and())
+        return tree
+
+    def parse_and(self):
+        tree = self.parse_not()
+        while self.peek() == 'and':
+            self.take()
+            tree = ('and', tree, self.parse_not())
+        return tree
+
+    def parse_not(self):
+        if self.peek() == 'not':
+            self.take()
+            return ('not', self.parse_not())
+        if self.peek() == '(':
+            self.take()
+            tree = self.parse_or()
+            self.take(')')
+            return tree
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.take()
+        op = self.take('op')[1]
+        right = self.take()
+        if left[0] == 'number' and right[0] == 'name':
+            left, right, op = right, left, SWAPPED[op]
+        if left[0] != 'name' or right[0] != 'number':
+            raise QueryError("a comparison needs an attribute and a number")
+        if left[1] not in ATTRIBUTES:
+            raise QueryError("invalid attribute: {}".format(left[1]))
+        return ('compare', left[1], op, right[1])
+
+
+class Query:
+    def __init__(self, text):
+        self.text = text
+        self.tree = Parser(tokenize(text)).parse()
+
+    # the attributes used by the query
+    def attributes(self):
+        names = set()
+        stack = [self.tree]
+        while stack:
+            node = stack.pop()
+            if node[0] == 'compare':
+                names.add(node[1])
+            else:
+                stack.extend(node[1:])
+        return sorted(names)
+
+    # Evaluate the query over a table of columns, returning a boolean mask
+    def mask(self, table):
+        return self._evaluate(self.tree, table)
+
+    def _evaluate(self, node, table):
+        kind = node[0]
+        if kind == 'compare':
+            compare = getattr(np, OPERATORS[node[2]][1])
+            return compare(np.asarray(table[node[1]]), node[3])
+        if kind == 'not':
+            return np.logical_not(self._evaluate(node[1], table))
+        left = self._evaluate(node[1], table)
+        right = self._evaluate(node[2], table)
+        if kind == 'and':
+            return np.logical_and(left, right)
+        return np.logical_or(left, right)
+
+
+def compile_query(text):
+    return Query(text)
+
+
+# Mask of the keys that are in list_keys, using a sorted search instead of a set of strings
+def key_membership(keys, list_keys):
+    keys = np.asarray(keys, dtype=np.uint64)
+    list_keys = np.unique(np.asarray(list_keys, dtype=np.uint64))
+    if len(list_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    index = np.searchsorted(list_keys, keys)
+    index[index == len(list_keys)] = 0
+    return list_keys[index] == keys
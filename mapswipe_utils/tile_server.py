@@ -0,0 +1,233 @@
+# mapswipe_utils/tile_server.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# A local stand-in for the Bing Maps tile servers, for testing the fetch scripts without an API key
+
+# Tiles are requested by quadkey, as from Bing Maps, with any URL path ending in a<quadkey>.jpeg
+# or <quadkey>.jpeg, for example
+#
+#   ./mapswipe_fetch_tiles.py --tile_url 'http://127.0.0.1:8080/tiles/a{quadkey}.jpeg' ...
+#
+# Each tile is a synthetic JPEG (see synthetic.py) which only depends on the quadkey and
+# the seed, so every fetch of a tile gets the same bytes.
+#
+# To look like a real tile server under load, responses can be delayed by --latency milliseconds,
+# give or take --jitter, a fraction --error_rate of them fail with HTTP 503, and requests above
+# --rate per second are turned away with HTTP 429.
+#
+# GET /stats returns the counts of requests by status and the percentiles of the time taken to
+# answer them, as JSON. They are also printed when the server is stopped.
+
+import argparse
+import sys
+import re
+import json
+import time
+import random
+import signal
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import fetch_engine as mapswipe_fetch_engine
+from mapswipe_utils import synthetic as mapswipe_synthetic
+
+np = lazy_import('numpy')
+
+
+QUADKEY_PATTERN = re.compile(r'/a?([0-3]+)\.jpe?g$')
+
+# rendered tiles kept in memory
+CACHE_SIZE = 4096
+
+PERCENTILES = [50, 90, 99]
+
+
+class TileServerStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.status_counts = {}
+        self.latencies = []
+        self.quadkeys = set()
+        self.n_bytes = 0
+
+    def record(self, status, latency, quadkey=None, n_bytes=0):
+        with self.lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            self.latencies.append(latency)
+            if quadkey is not None:
+                self.quadkeys.add(quadkey)
+            self.n_bytes += n_bytes
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000.0
+            result = {
+                'seconds': time.monotonic() - self.start,
+                'requests': len(self.latencies),
+                'status': {str(status): n for status, n in sorted(self.status_counts.items())},
+                'tiles': len(self.quadkeys),
+                'bytes': self.n_bytes,
+            }
+        for p in PERCENTILES:
+            result['latency_p{}_ms'.format(p)] = float(np.percentile(latencies, p)) if len(latencies) else 0.0
+        result['latency_max_ms'] = float(latencies.max()) if len(latencies) else 0.0
+        return result
+
+
+class TileServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, rate=0.0, seed=0,
+                 quality=85, verbose=False):
+        super().__init__(address, TileRequestHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.quality = quality
+        self.stats = TileServerStats()
+
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+        # requests above the rate are refused rather than queued, like a real server
+        self.bucket = mapswipe_fetch_engine.TokenBucket(rate, max(1.0, rate)) if rate > 0 else None
+        self.bucket_lock = threading.Lock()
+
+        self.textures = mapswipe_synthetic.ground_textures(np.random.RandomState(seed))
+        self.tile = functools.lru_cache(maxsize=CACHE_SIZE)(self._render)
+
+    def _render(self, quadkey):
+        x, y, zoom = mapswipe_tile_math.quadkey_to_tile_coords_and_zoom(quadkey)
+        key = mapswipe_tile_math.pack_tile(zoom, x, y)
+        return mapswipe_synthetic.render_tile(self.textures, key, key % 5, self.quality)
+
+    def allow(self):
+        if self.bucket is None:
+            return True
+        with self.bucket_lock:
+            self.bucket.refill(time.monotonic())
+            if self.bucket.tokens < 1.0:
+                return False
+            self.bucket.tokens -= 1.0
+            return True
+
+    # the delay before answering and whether to fail, for one request
+    def draw(self):
+        with self.rng_lock:
+            delay = self.latency + self.jitter * (2.0 * self.rng.random() - 1.0)
+            fail = self.rng.random() < self.error_rate
+        return max(0.0, delay), fail
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    # keep connections alive, and send the headers and the body in one write
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        start = time.monotonic()
+        server = self.server
+        path = self.path.split('?', 1)[0]
+
+        if path == '/stats':
+            self.respond(200, json.dumps(server.stats.summary()).encode('ascii'), 'application/json')
+            return
+
+        match = QUADKEY_PATTERN.search(path)
+        if match is None:
+            self.respond(404, b'Not found\n', 'text/plain')
+            server.stats.record(404, time.monotonic() - start)
+            return
+
+        if not server.allow():
+            self.respond(429, b'Too many requests\n', 'text/plain', {'Retry-After': '1'})
+            server.stats.record(429, time.monotonic() - start)
+            return
+
+        delay, fail = server.draw()
+        if delay > 0:
+            time.sleep(delay)
+
+        if fail:
+            self.respond(503, b'Service unavailable\n', 'text/plain')
+            server.stats.record(503, time.monotonic() - start)
+            return
+
+        quadkey = match.group(1)
+        data = server.tile(quadkey)
+        self.respond(200, data, 'image/jpeg')
+        server.stats.record(200, time.monotonic() - start, quadkey, len(data))
+
+    def respond(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthetic map tiles by quadkey for testing the fetch scripts")
+    parser.add_argument('--host', metavar='<host>', default='127.0.0.1',
+                        help='Address to listen on. Default: 127.0.0.1')
+    parser.add_argument('--port', '-p', metavar='<port>', type=int, default=8080,
+                        help='Port to listen on, 0 for any free port. Default: 8080')
+    parser.add_argument('--latency', '-l', metavar='<milliseconds>', type=float, default=0.0,
+                        help='Delay before each response. Default: 0')
+    parser.add_argument('--jitter', '-j', metavar='<milliseconds>', type=float, default=0.0,
+                        help='Random variation in the delay, plus or minus. Default: 0')
+    parser.add_argument('--error_rate', '-e', metavar='<fraction>', type=float, default=0.0,
+                        help='Fraction of requests that fail with HTTP 503. Default: 0')
+    parser.add_argument('--rate', '-r', metavar='<requests per second>', type=float, default=0.0,
+                        help='Requests per second above which requests fail with HTTP 429. Default: no limit')
+    parser.add_argument('--seed', '-s', metavar='<seed>', type=int, default=0,
+                        help='Seed for the tile images and the errors. Default: 0')
+    parser.add_argument('--quality', '-q', metavar='<jpeg quality>', type=int, default=85,
+                        help='JPEG quality of the tiles. Default: 85')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Log every request')
+    args = parser.parse_args(argv)
+
+    if not 0.0 <= args.error_rate <= 1.0:
+        sys.stderr.write("ERROR: the error rate must be between 0 and 1\n")
+        sys.exit(1)
+
+    server = TileServer((args.host, args.port), args.latency / 1000.0, args.jitter / 1000.0,
+                        args.error_rate, args.rate, args.seed, args.quality, args.verbose)
+
+    # stop cleanly on SIGTERM as well as Ctrl-C
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    host, port = server.server_address[:2]
+    print("Serving tiles on http://{}:{}/tiles/a{{quadkey}}.jpeg".format(host, port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+    print(json.dumps(server.stats.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
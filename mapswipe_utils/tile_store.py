@@ -0,0 +1,294 @@
+# mapswipe_utils/tile_store.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Storage for collections of image tiles
+
+# By default tiles are stored one JPEG per file as <tile_id>.jpg in a directory.
+# With hundreds of thousands of small tiles that is hard on the filesystem and on backups,
+# so tiles can also be kept in a single packed archive file instead.
+#
+# An archive is a SQLite database with one row per tile, keyed by the packed 64 bit tile key
+# from tile_math.py. The key orders tiles by quadkey so neighboring tiles are stored
+# together. Reads go through SQLite's memory mapped I/O.
+#
+# Any path ending in .tiles is treated as an archive, anything else as a directory. In a
+# directory only files named <zoom>-<x>-<y>.jpg are tiles.
+# Both kinds of store have the same methods so the tools can use either:
+#
+#   store.tile_ids()          list of the tile IDs in the store
+#   tile_id in store          is a tile present
+#   store.read(tile_id)       the image bytes - raises KeyError if the tile is missing
+#   store.write(tile_id, data)
+#   store.delete(tile_id)
+#   store.keys()              packed tile keys of the tiles in the store, sorted
+#   store.count_hint()        the number of tiles if it can be found quickly, otherwise None
+#   store.signature(tile_id)  a string that changes when the tile is written again
+#   store.close()
+
+import os
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mapswipe_utils.lazy import lazy_import
+from mapswipe_utils import tile_math as mapswipe_tile_math
+from mapswipe_utils import materialize as mapswipe_materialize
+from mapswipe_utils import fetch_journal as mapswipe_fetch_journal
+
+np = lazy_import('numpy')
+
+
+ARCHIVE_SUFFIX = '.tiles'
+
+# map up to 16GB of an archive into memory for reads
+ARCHIVE_MMAP_SIZE = 1 << 34
+
+# commit archive writes in batches
+ARCHIVE_COMMIT_EVERY = 500
+
+TILE_FILENAME_PATTERN = mapswipe_fetch_journal.TILE_FILENAME_PATTERN
+
+
+def is_archive(path):
+    return path.endswith(ARCHIVE_SUFFIX)
+
+
+# Open a directory or archive of tiles
+# mode is 'r' to read an existing store, 'w' to create it if needed and write to it
+def open_tile_store(path, mode='r'):
+    if is_archive(path):
+        return ArchiveTileStore(path, mode)
+    return DirectoryTileStore(path, mode)
+
+
+# Copy one tile between stores - a plain file copy between two directories
+def copy_tile(src_store, dst_store, tile_id):
+    if isinstance(src_store, DirectoryTileStore) and isinstance(dst_store, DirectoryTileStore):
+        shutil.copyfile(src_store.tile_path(tile_id), dst_store.tile_path(tile_id))
+    else:
+        dst_store.write(tile_id, src_store.read(tile_id))
+
+
+# Copy many tiles between stores on a pool of threads
+# Between two directories mode can be any of the materialize.py modes so tiles can be
+# hard linked, symlinked or reflinked instead of copied - archives always hold their own copy
+# Returns a dict of the number of tiles placed by each method
+# With missing_ok tiles that are not in src_store are skipped and counted as missing
+def copy_tiles(src_store, dst_store, tile_ids, mode='copy', workers=mapswipe_materialize.DEFAULT_WORKERS,
+               missing_ok=False):
+    if isinstance(src_store, DirectoryTileStore) and isinstance(dst_store, DirectoryTileStore):
+        pairs = ((src_store.tile_path(tile_id), dst_store.tile_path(tile_id)) for tile_id in tile_ids)
+        return mapswipe_materialize.materialize_files(pairs, mode, workers, missing_ok)
+
+    def copy_one(tile_id):
+        try:
+            data = src_store.read(tile_id)
+        except KeyError:
+            if missing_ok:
+                return 'missing'
+            raise
+        dst_store.write(tile_id, data)
+        return 'copy'
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for method in pool.map(copy_one, tile_ids):
+            counts[method] = counts.get(method, 0) + 1
+    return counts
+
+
+class DirectoryTileStore:
+    def __init__(self, path, mode='r'):
+        self.path = path
+        if mode == 'r':
+            if not os.path.isdir(path):
+                raise FileNotFoundError("tile directory not found: {}".format(path))
+        elif not os.path.exists(path):
+            os.makedirs(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, tile_id):
+        return os.path.exists(self.tile_path(tile_id))
+
+    def tile_path(self, tile_id):
+        return os.path.join(self.path, "{}.jpg".format(tile_id))
+
+    # other .jpg files in the directory are ignored
+    def tile_ids(self):
+        return [x[:-len(".jpg")] for x in os.listdir(self.path) if TILE_FILENAME_PATTERN.match(x)]
+
+    # packed keys of all the tiles, in quadkey order
+    # other .jpg files in the directory are ignored
+    def keys(self):
+        with os.scandir(self.path) as entries:
+            tile_ids = [entry.name[:-len(".jpg")] for entry in entries if TILE_FILENAME_PATTERN.match(entry.name)]
+        return np.sort(mapswipe_tile_math.tile_ids_to_keys(tile_ids).astype(np.uint64))
+
+    # A guess at the number of tiles without listing the directory - the number of tiles the
+    # fetch journal records as fetched if there is one (see fetch_journal.py), otherwise None
+    def count_hint(self):
+        try:
+            entries = mapswipe_fetch_journal.read_journal(os.path.join(self.path, mapswipe_fetch_journal.JOURNAL_FILENAME))
+        except (OSError, ValueError):
+            return None
+        return sum(1 for status, size, digest in entries.values() if status == mapswipe_fetch_journal.STATUS_OK)
+
+    def read(self, tile_id):
+        try:
+            with open(self.tile_path(tile_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(tile_id)
+
+    # the size, modification time and inode of the file - a tile that is fetched again is a
+    # new file, even if the content is the same
+    def signature(self, tile_id):
+        try:
+            stat = os.stat(self.tile_path(tile_id))
+        except FileNotFoundError:
+            raise KeyError(tile_id)
+        return "{}-{}-{}".format(stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    # write to a temporary file and rename it so a tile is never left half written
+    def write(self, tile_id, data):
+        path = self.tile_path(tile_id)
+        partial_path = path + '.part'
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+        os.replace(partial_path, path)
+
+    def delete(self, tile_id):
+        try:
+            os.remove(self.tile_path(tile_id))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        pass
+
+
+class ArchiveTileStore:
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.n_pending = 0
+        self.complete = None
+
+        if mode == 'r':
+            if not os.path.exists(path):
+                raise FileNotFoundError("tile archive not found: {}".format(path))
+            self.db = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True, check_same_thread=False)
+        else:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS tiles (key INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            # placeholder tiles that were skipped when fetching, so they are not fetched again
+            self.db.execute("CREATE TABLE IF NOT EXISTS placeholders (key INTEGER PRIMARY KEY)")
+            self.db.execute("INSERT OR IGNORE INTO metadata VALUES ('format', 'jpg')")
+            self.db.commit()
+        self.db.execute("PRAGMA mmap_size={}".format(ARCHIVE_MMAP_SIZE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, tile_id):
+        key = mapswipe_tile_math.tile_id_to_key(tile_id)
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM tiles WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    # packed keys of all the tiles, in quadkey order
+    def keys(self):
+        with self.lock:
+            rows = self.db.execute("SELECT key FROM tiles ORDER BY key").fetchall()
+        return np.array([row[0] for row in rows], dtype=np.uint64)
+
+    def tile_ids(self):
+        return mapswipe_tile_math.keys_to_tile_ids(self.keys())
+
+    def count_hint(self):
+        with self.lock:
+            return self.db.execute("SELECT count(*) FROM tiles").fetchone()[0]
+
+    def read(self, tile_id):
+        key = mapswipe_tile_math.tile_id_to_key(tile_id)
+        with self.lock:
+            row = self.db.execute("SELECT data FROM tiles WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(tile_id)
+        return row[0]
+
+    # the SHA1 hash of the tile
+    def signature(self, tile_id):
+        return mapswipe_fetch_journal.content_hash(self.read(tile_id))
+
+    def write(self, tile_id, data):
+        key = mapswipe_tile_math.tile_id_to_key(tile_id)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?)", (key, sqlite3.Binary(data)))
+            self.n_pending += 1
+            if self.n_pending >= ARCHIVE_COMMIT_EVERY:
+                self.db.commit()
+                self.n_pending = 0
+            if self.complete is not None:
+                self.complete.add(key)
+
+    def delete(self, tile_id):
+        key = mapswipe_tile_math.tile_id_to_key(tile_id)
+        with self.lock:
+            self.db.execute("DELETE FROM tiles WHERE key = ?", (key,))
+            self.n_pending += 1
+            if self.complete is not None:
+                self.complete.discard(key)
+
+    # The fetch engine writes to an archive the same way as to a journaled directory
+    # The archive itself is the record of what has been fetched - the keys are read
+    # once and a committed row is always a complete tile
+    # Tiles are not deduplicated in an archive
+    # The set is built once, by the first of the fetch workers to get here
+    def is_complete(self, tile_id):
+        if self.complete is None:
+            with self.lock:
+                if self.complete is None:
+                    complete = set(row[0] for row in self.db.execute("SELECT key FROM tiles"))
+                    complete.update(row[0] for row in self.db.execute("SELECT key FROM placeholders"))
+                    self.complete = complete
+        return mapswipe_tile_math.tile_id_to_key(tile_id) in self.complete
+
+    def write_tile(self, tile_id, data, digest=None):
+        self.write(tile_id, data)
+        return True
+
+    # Skipped placeholders are kept so they are not fetched again
+    # Failed fetches are not kept - a missing tile is fetched again next time
+    def record(self, tile_id, status, size=0, digest='-'):
+        if status != mapswipe_fetch_journal.STATUS_PLACEHOLDER:
+            return
+        key = mapswipe_tile_math.tile_id_to_key(tile_id)
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO placeholders VALUES (?)", (key,))
+            self.n_pending += 1
+            if self.complete is not None:
+                self.complete.add(key)
+
+    def close(self):
+        with self.lock:
+            if self.mode != 'r':
+                self.db.commit()
+            self.db.close()
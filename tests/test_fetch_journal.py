@@ -0,0 +1,92 @@
+# tests/test_fetch_journal.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Resuming from the fetch journal and adopting a directory fetched without one
+
+import os
+
+from mapswipe_utils import fetch_journal
+from mapswipe_utils import tile_store
+
+
+JPEG = b'\xff\xd8tile\xff\xd9'
+
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_resume(tmp_path):
+    output_dir = str(tmp_path / 'tiles')
+    journal = fetch_journal.FetchJournal(output_dir)
+    journal.write_tile('18-1-1', JPEG)
+    journal.record('18-1-2', fetch_journal.STATUS_FAILED)
+    journal.record('18-1-3', fetch_journal.STATUS_PLACEHOLDER, 10, 'a' * 40)
+    journal.record('18-1-4', fetch_journal.STATUS_FAILED)
+    journal.write_tile('18-1-4', JPEG)
+    journal.close()
+
+    # a line cut short by a crash is ignored
+    with open(os.path.join(output_dir, fetch_journal.JOURNAL_FILENAME), 'at') as f:
+        f.write('18-1-5\tok\t12')
+
+    journal = fetch_journal.FetchJournal(output_dir)
+    assert journal.is_complete('18-1-1')
+    assert not journal.is_complete('18-1-2')
+    assert journal.is_complete('18-1-3')
+    # the last line for a tile wins
+    assert journal.is_complete('18-1-4')
+    assert not journal.is_complete('18-1-5')
+    assert sorted(journal.complete_tile_ids()) == ['18-1-1', '18-1-4']
+    assert journal.entries['18-1-1'] == ('ok', len(JPEG), fetch_journal.content_hash(JPEG))
+    journal.close()
+
+    with open(os.path.join(output_dir, '18-1-1.jpg'), 'rb') as f:
+        assert f.read() == JPEG
+
+
+def test_adopt_existing_tiles(tmp_path):
+    output_dir = str(tmp_path)
+    write_file(os.path.join(output_dir, '18-1-1.jpg'), JPEG)
+    write_file(os.path.join(output_dir, '18-1-2.jpg'), JPEG[:-2])
+    write_file(os.path.join(output_dir, '18-1-3.jpg'), b'')
+    write_file(os.path.join(output_dir, '18-1-4.jpg.part'), JPEG[:4])
+    write_file(os.path.join(output_dir, 'photo.jpg'), JPEG)
+    write_file(os.path.join(output_dir, 'notes.part'), b'notes')
+
+    journal = fetch_journal.FetchJournal(output_dir)
+    journal.close()
+
+    # only complete tiles are adopted and only the partial tile is removed
+    assert list(journal.entries) == ['18-1-1']
+    assert sorted(os.listdir(output_dir)) == [fetch_journal.JOURNAL_FILENAME, '18-1-1.jpg', '18-1-2.jpg',
+                                              '18-1-3.jpg', 'notes.part', 'photo.jpg']
+
+    # the adopted journal is used from then on, so the truncated tile is fetched again
+    journal = fetch_journal.FetchJournal(output_dir)
+    assert journal.is_complete('18-1-1')
+    assert not journal.is_complete('18-1-2')
+    journal.close()
+
+
+def test_count_hint_counts_distinct_fetched_tiles(tmp_path):
+    output_dir = str(tmp_path)
+    store = tile_store.open_tile_store(output_dir)
+    assert store.count_hint() is None
+
+    journal = fetch_journal.FetchJournal(output_dir)
+    journal.record('18-1-1', fetch_journal.STATUS_FAILED)
+    journal.write_tile('18-1-1', JPEG)
+    journal.write_tile('18-1-1', JPEG)
+    journal.write_tile('18-1-2', JPEG)
+    journal.record('18-1-3', fetch_journal.STATUS_PLACEHOLDER, 10, 'a' * 40)
+    journal.record('18-1-4', fetch_journal.STATUS_FAILED)
+    journal.close()
+
+    assert store.count_hint() == 2
@@ -0,0 +1,162 @@
+# tests/test_project_sync.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Diffs between versions of a project and syncing a project from a local HTTP server
+
+import os
+import json
+import functools
+import threading
+import http.server
+
+import numpy as np
+import pytest
+
+from mapswipe_utils import tile_math
+from mapswipe_utils import project_sync
+from mapswipe_utils import fetch_project_json
+
+
+def columns(rows):
+    keys = tile_math.tile_ids_to_keys([row[0] for row in rows])
+    table = {'key': np.asarray(keys, dtype=np.uint64)}
+    for i, name in enumerate(project_sync.DIFF_COLUMNS):
+        table[name] = np.array([row[i + 1] for row in rows], dtype=np.float64 if name == 'decision' else np.int64)
+    return table
+
+
+#         tile ID      yes  maybe  bad  decision
+OLD = [('18-10-10',    3,   0,     0,   1.0),
+       ('18-10-11',    0,   2,     0,   2.0),
+       ('18-10-12',    1,   0,     0,   1.0),
+       ('18-10-13',    0,   0,     2,   3.0)]
+
+NEW = [('18-10-13',    0,   0,     2,   3.0),
+       ('18-10-11',    2,   1,     0,   1.0),
+       ('18-10-10',    3,   0,     0,   1.0),
+       ('18-10-14',    1,   0,     0,   1.0)]
+
+
+def test_diff_columns():
+    old = columns(OLD)
+    new = columns(NEW)
+    diff = project_sync.diff_columns(old, new)
+    assert diff['added'].tolist() == [False, False, False, True]
+    assert diff['removed'].tolist() == [False, False, True, False]
+    assert diff['changed'].tolist() == [False, True, False, False]
+    # the old row of each new row that was there before, whatever the order
+    assert diff['old_rows'][~diff['added']].tolist() == [3, 1, 0]
+
+
+def test_diff_against_empty_version():
+    diff = project_sync.diff_columns(columns([]), columns(NEW))
+    assert diff['added'].all()
+    assert not diff['changed'].any()
+    assert len(diff['removed']) == 0
+
+
+def test_write_diff(tmp_path):
+    old = columns(OLD)
+    new = columns(NEW)
+    path = str(tmp_path / 'diff.json')
+    project_sync.write_diff(path, project_sync.diff_columns(old, new), old, new, 1, 2)
+    with open(path, 'rt') as f:
+        diff = json.load(f)
+    assert diff['from_version'] == 1 and diff['to_version'] == 2
+    assert diff['added'] == ['18-10-14']
+    assert diff['removed'] == ['18-10-12']
+    assert diff['changed'] == {'18-10-11': {'yes_count': [0, 2], 'maybe_count': [2, 1], 'decision': [2.0, 1.0]}}
+
+
+def write_project(path, rows, mtime):
+    records = []
+    for tile_id, yes, maybe, bad, decision in rows:
+        zoom, x, y = tile_math.parse_tile_id(tile_id)
+        records.append({'id': tile_id, 'task_x': str(x), 'task_y': str(y), 'task_z': str(zoom),
+                        'yes_count': yes, 'maybe_count': maybe, 'bad_imagery_count': bad, 'decision': decision})
+    with open(path, 'wt') as f:
+        json.dump(records, f)
+    # the server's Last-Modified has one second resolution
+    os.utime(path, (mtime, mtime))
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+# A local server for the files in a directory - it answers If-Modified-Since with 304
+@pytest.fixture
+def server(tmp_path):
+    www = tmp_path / 'www'
+    www.mkdir()
+    handler = functools.partial(QuietHandler, directory=str(www))
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield str(www), "http://127.0.0.1:{}/".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read_list(path):
+    with open(path, 'rt') as f:
+        return f.read().split()
+
+
+def test_sync_project(tmp_path, server):
+    www, base_url = server
+    url = base_url + 'project.json'
+    project_dir = str(tmp_path / 'project')
+    os.makedirs(project_dir)
+    json_path = os.path.join(project_dir, 'project.json')
+    categories = fetch_project_json.CATEGORIES
+
+    write_project(os.path.join(www, 'project.json'), OLD, 1500000000)
+    assert fetch_project_json.sync_project(url, json_path, project_dir, categories) == "version 1: 4 tiles"
+    assert read_list(os.path.join(project_dir, 'new_positive_tiles.lst')) == ['18-10-10', '18-10-12']
+
+    # not modified since the last sync
+    assert fetch_project_json.sync_project(url, json_path, project_dir, categories) == "unchanged"
+    assert read_list(os.path.join(project_dir, 'new_positive_tiles.lst')) == []
+
+    write_project(os.path.join(www, 'project.json'), NEW, 1500000100)
+    fetch_project_json.sync_project(url, json_path, project_dir, categories)
+    assert read_list(os.path.join(project_dir, 'all_positive_tiles.lst')) == ['18-10-10', '18-10-11', '18-10-14']
+    # 18-10-11 moved from ambiguous to positive, 18-10-12 was removed
+    assert read_list(os.path.join(project_dir, 'new_positive_tiles.lst')) == ['18-10-11', '18-10-14']
+    assert read_list(os.path.join(project_dir, 'dropped_positive_tiles.lst')) == ['18-10-12']
+    assert read_list(os.path.join(project_dir, 'dropped_ambiguous_tiles.lst')) == ['18-10-11']
+
+    sync = project_sync.ProjectSync(project_dir)
+    assert [version['version'] for version in sync.state['versions']] == [1, 2]
+    assert sync.latest()['added'] == 1 and sync.latest()['removed'] == 1 and sync.latest()['changed'] == 1
+    assert os.path.exists(os.path.join(sync.sync_dir, project_sync.diff_name(1, 2)))
+
+
+def test_sync_keeps_last_version_on_bad_download(tmp_path, server):
+    www, base_url = server
+    url = base_url + 'project.json'
+    project_dir = str(tmp_path)
+    json_path = os.path.join(project_dir, 'project.json')
+
+    write_project(os.path.join(www, 'project.json'), OLD, 1500000000)
+    assert project_sync.ProjectSync(project_dir).sync(url, json_path)['version'] == 1
+    with open(json_path, 'rb') as f:
+        good = f.read()
+
+    with open(os.path.join(www, 'project.json'), 'wt') as f:
+        f.write('[{"id": "18-10-10", "yes_co')
+    os.utime(os.path.join(www, 'project.json'), (1500000100, 1500000100))
+    with pytest.raises(ValueError):
+        project_sync.ProjectSync(project_dir).sync(url, json_path)
+
+    with open(json_path, 'rb') as f:
+        assert f.read() == good
+    assert not os.path.exists(json_path + '.part')
+    assert len(project_sync.ProjectSync(project_dir).state['versions']) == 1
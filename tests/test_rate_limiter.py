@@ -0,0 +1,104 @@
+# tests/test_rate_limiter.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Accounting of requests against the per second rate and the daily quota
+
+import json
+import time
+
+from mapswipe_utils import fetch_engine
+from mapswipe_utils import fetch_quota
+
+
+def test_counts_requests():
+    limiter = fetch_engine.RateLimiter(1000, 100)
+    for i in range(10):
+        limiter.acquire()
+    assert limiter.n_acquired == 10
+    assert limiter.used() == 10
+    assert limiter.wait_for(90) == 0.0
+
+
+def test_per_second_rate():
+    limiter = fetch_engine.RateLimiter(50, 1000)
+    start = time.monotonic()
+    # the first second's worth is a burst, the rest come at the rate
+    for i in range(75):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.4
+
+
+def test_daily_quota_starts_with_what_is_left(tmp_path):
+    quota_file = str(tmp_path / 'quota.json')
+    limiter = fetch_engine.RateLimiter(1000, 5, quota_file)
+    for i in range(3):
+        limiter.acquire()
+    limiter.save()
+
+    # a new run with the same quota file only has 2 requests left
+    limiter = fetch_engine.RateLimiter(1000, 5, quota_file)
+    assert limiter.used() == 3
+    assert limiter.wait_for(2) == 0.0
+    # the third has to wait about a day for the first requests to leave the window
+    assert limiter.wait_for(3) > fetch_quota.QUOTA_WINDOW - 120
+
+
+def test_quota_file_adds_up_runs(tmp_path):
+    quota_file = str(tmp_path / 'quota.json')
+    first = fetch_engine.RateLimiter(1000, 100, quota_file)
+    second = fetch_engine.RateLimiter(1000, 100, quota_file)
+    for i in range(4):
+        first.acquire()
+    for i in range(6):
+        second.acquire()
+    first.save()
+    second.save()
+    # saving again adds nothing
+    first.save()
+
+    assert sum(fetch_quota.read_quota_file(quota_file, time.time()).values()) == 10
+    assert fetch_engine.RateLimiter(1000, 100, quota_file).used() == 10
+
+
+def test_quota_file_is_saved_as_requests_are_made(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch_engine, 'QUOTA_SAVE_EVERY', 2)
+    quota_file = str(tmp_path / 'quota.json')
+    limiter = fetch_engine.RateLimiter(1000, 100, quota_file)
+    for i in range(5):
+        limiter.acquire()
+    # saved after the second and fourth requests - the fifth is saved at the end of the job
+    assert sum(fetch_quota.read_quota_file(quota_file, time.time()).values()) == 4
+
+
+def test_old_requests_leave_the_window(tmp_path):
+    quota_file = str(tmp_path / 'quota.json')
+    now = time.time()
+    minute = int(now // 60)
+    with open(quota_file, 'wt') as f:
+        json.dump({'version': fetch_quota.QUOTA_FILE_VERSION,
+                   'minutes': {str(minute - 25 * 60): 40, str(minute - 60): 7}}, f)
+
+    assert fetch_quota.read_quota_file(quota_file, now) == {minute - 60: 7}
+    limiter = fetch_engine.RateLimiter(1000, 10, quota_file)
+    assert limiter.used() == 7
+    # the oldest requests in the window leave it 23 hours from now, at the end of their minute
+    wait = limiter.wait_for(4)
+    assert 23 * 60 * 60 - 60 < wait <= 23 * 60 * 60 + 60
+
+
+def test_unreadable_quota_file_is_ignored(tmp_path):
+    quota_file = str(tmp_path / 'quota.json')
+    with open(quota_file, 'wt') as f:
+        f.write('not json')
+    assert fetch_engine.RateLimiter(1000, 10, quota_file).used() == 0
+
+
+def test_quota_file_per_key():
+    assert fetch_quota.default_quota_file('key1') != fetch_quota.default_quota_file('key2')
+    assert fetch_quota.default_quota_file('key1') == fetch_quota.default_quota_file('key1')
+    assert 'key1' not in fetch_quota.default_quota_file('key1')
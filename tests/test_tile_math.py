@@ -0,0 +1,75 @@
+# tests/test_tile_math.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Round trips between tile IDs, quadkeys and packed keys, one at a time and in batches
+
+import random
+
+import numpy as np
+
+from mapswipe_utils import tile_math
+
+
+def random_tiles(n, seed=0):
+    rng = random.Random(seed)
+    tiles = []
+    for i in range(n):
+        zoom = rng.randint(1, 23)
+        tiles.append((zoom, rng.randrange(1 << zoom), rng.randrange(1 << zoom)))
+    return tiles
+
+
+def test_known_quadkey():
+    # the example in the Bing Maps tile system documentation
+    assert tile_math.tile_coords_and_zoom_to_quadkey(3, 5, 3) == '213'
+    assert tile_math.quadkey_to_tile_coords_and_zoom('213') == (3, 5, 3)
+
+
+def test_single_tile_round_trips():
+    for zoom, x, y in random_tiles(1000):
+        tile_id = tile_math.format_tile_id(zoom, x, y)
+        assert tile_math.parse_tile_id(tile_id) == (zoom, x, y)
+        assert tile_math.key_to_tile_id(tile_math.tile_id_to_key(tile_id)) == tile_id
+        quadkey = tile_math.tile_id_to_quadkey(tile_id)
+        assert len(quadkey) == zoom
+        assert tile_math.quadkey_to_tile_coords_and_zoom(quadkey) == (x, y, zoom)
+
+
+def test_batch_matches_single_tiles():
+    tiles = random_tiles(1000, seed=1)
+    tile_ids = [tile_math.format_tile_id(*tile) for tile in tiles]
+    zooms, xs, ys = (np.array(column) for column in zip(*tiles))
+
+    keys = tile_math.tile_ids_to_keys(tile_ids)
+    assert [int(key) for key in keys] == [tile_math.tile_id_to_key(tile_id) for tile_id in tile_ids]
+    assert tile_math.keys_to_tile_ids(keys) == tile_ids
+    assert list(tile_math.format_tile_ids(zooms, xs, ys)) == tile_ids
+
+    unpacked = tile_math.unpack_tiles(keys)
+    for column, expected in zip(unpacked, (zooms, xs, ys)):
+        assert np.array_equal(column, expected)
+
+    quadkeys = tile_math.tile_ids_to_quadkeys(tile_ids)
+    assert list(quadkeys) == [tile_math.tile_id_to_quadkey(tile_id) for tile_id in tile_ids]
+
+
+def test_keys_sort_in_quadkey_order():
+    tile_ids = [tile_math.format_tile_id(18, x, y) for x, y in [(5, 9), (4, 4), (1000, 3), (7, 7), (0, 1)]]
+    by_key = sorted(tile_ids, key=tile_math.tile_id_to_key)
+    assert by_key == sorted(tile_ids, key=tile_math.tile_id_to_quadkey)
+
+
+def test_parents_and_children():
+    key = tile_math.tile_id_to_key('18-135793-124051')
+    children = tile_math.child_keys(key)
+    assert [tile_math.parent_key(child) for child in children] == [key] * 4
+    assert tile_math.key_to_tile_id(tile_math.parent_key(key)) == '17-67896-62025'
+
+    keys = np.array([key, children[2]], dtype=np.uint64)
+    assert [int(k) for k in tile_math.parent_keys(keys)] == [tile_math.parent_key(key), key]
+    assert [int(k) for k in tile_math.children_keys(keys)[0]] == children
@@ -0,0 +1,89 @@
+# tests/test_tile_query.py
+
+# Copyright 2017  Robert Jones  jones@craic.com
+
+# Project repo: https://github.com/craic/mapswipe_utils
+
+# Released under the terms of the MIT License
+
+# Parsing and evaluating tile queries
+
+import numpy as np
+import pytest
+
+from mapswipe_utils import tile_query
+
+
+TABLE = {
+    'yes_count':         np.array([0, 1, 2, 3, 4, 5]),
+    'maybe_count':       np.array([0, 2, 0, 1, 3, 0]),
+    'bad_imagery_count': np.array([0, 0, 1, 0, 0, 2]),
+    'task_y':            np.array([5, 10, 15, 20, 25, 30]),
+    'decision':          np.array([0.0, 1.0, 1.5, 1.0, 2.0, 0.5]),
+}
+
+
+def rows(text):
+    return np.flatnonzero(tile_query.compile_query(text).mask(TABLE)).tolist()
+
+
+# evaluate the query one record at a time, as check_tile_info does
+def record_rows(text):
+    query = tile_query.compile_query(text)
+    result = []
+    for i in range(len(TABLE['yes_count'])):
+        record = dict((name, column[i:i + 1]) for name, column in TABLE.items())
+        if query.mask(record)[0]:
+            result.append(i)
+    return result
+
+
+def test_symbols_and_words_are_the_same():
+    assert rows('yes_count >= 2') == rows('yes_count ge 2') == [2, 3, 4, 5]
+    assert rows('yes_count = 3') == rows('yes_count == 3') == rows('yes_count eq 3') == [3]
+    assert rows('maybe_count != 0') == rows('maybe_count ne 0') == [1, 3, 4]
+
+
+def test_precedence_and_parentheses():
+    # and binds tighter than or, not tighter than and
+    assert rows('yes_count > 3 or maybe_count == 2 and bad_imagery_count == 0') == [1, 4, 5]
+    assert rows('(yes_count > 3 or maybe_count == 2) and bad_imagery_count == 0') == [1, 4]
+    assert rows('not yes_count < 2 and not task_y > 20') == [2, 3]
+
+
+def test_value_on_the_left():
+    assert rows('2 < yes_count') == rows('yes_count > 2')
+    assert rows('1.0 <= decision') == rows('decision >= 1.0') == [1, 2, 3, 4]
+
+
+def test_mask_matches_record_evaluation():
+    for text in ['yes_count >= 2 and bad_imagery_count == 0',
+                 '(yes_count gt 3 or maybe_count ge 2) and not task_y < 20',
+                 'decision > 0.75']:
+        assert rows(text) == record_rows(text)
+
+
+def test_attributes():
+    query = tile_query.compile_query('yes_count > 1 and (task_y < 3 or yes_count == 0)')
+    assert query.attributes() == ['task_y', 'yes_count']
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'yes_count >',
+    'yes_count > 2 and',
+    '(yes_count > 2',
+    'yes_count > 2)',
+    'colour == 2',
+    'yes_count >> 2',
+    'yes_count > maybe_count',
+])
+def test_invalid_queries(text):
+    with pytest.raises(tile_query.QueryError):
+        tile_query.compile_query(text)
+
+
+def test_key_membership():
+    keys = np.array([5, 1, 9, 3], dtype=np.uint64)
+    assert tile_query.key_membership(keys, [9, 1, 7]).tolist() == [False, True, True, False]
+    assert tile_query.key_membership(keys, []).tolist() == [False] * 4